@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CalculatorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'calculator'
+
+    def ready(self):
+        from django.core.signals import request_started
+        from . import checks  # noqa: F401 (registers the system checks)
+        from .job_runner import start_job_runners
+        request_started.connect(start_job_runners, dispatch_uid='calculator.start_job_runners')
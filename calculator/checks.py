@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+@register()
+def check_fee_shard_size(app_configs, **kwargs):
+    """Batches are sharded one at a time, so shards larger than a batch would never run in parallel."""
+    if settings.FEE_SHARD_SIZE > settings.PATENT_BATCH_SIZE:
+        return [Error(
+            f"FEE_SHARD_SIZE ({settings.FEE_SHARD_SIZE}) is larger than PATENT_BATCH_SIZE ({settings.PATENT_BATCH_SIZE}).",
+            hint="Every batch would be calculated in a single shard; lower FEE_SHARD_SIZE.",
+            id='calculator.E001',
+        )]
+    return []
@@ -1,9 +1,26 @@
+import datetime
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 
 class UploadFileForm(forms.Form):
     file = forms.FileField(label='Select an Excel file')
+    as_of = forms.DateField(
+        label='Valuation date',
+        required=False,
+        initial=datetime.date.today,
+        widget=forms.DateInput(attrs={'type': 'date'})
+    )
+
+    OUTPUT_FORMAT_CHOICES = [
+        ('xlsx', 'Formatted Excel workbook'),
+        ('parquet', 'Machine-readable only (export to CSV, JSON lines or Excel later)'),
+    ]
+    output_format = forms.ChoiceField(choices=OUTPUT_FORMAT_CHOICES, initial='xlsx', required=False, label='Output')
+
+    def clean_as_of(self):
+        # Default to today so every calculation runs against an explicit valuation date
+        return self.cleaned_data.get('as_of') or datetime.date.today()
     
 
 class GPTForm(forms.Form):
@@ -22,4 +39,17 @@ class GPTForm(forms.Form):
         ('Title', 'Title'),
         ('Abstract', 'Abstract'),
     ]
-    columns = forms.MultipleChoiceField(choices=COLUMNS_CHOICES, widget=forms.CheckboxSelectMultiple, required=True)
\ No newline at end of file
+    columns = forms.MultipleChoiceField(choices=COLUMNS_CHOICES, widget=forms.CheckboxSelectMultiple, required=True)
+
+    # Send every row to the API again instead of reusing cached responses
+    bypass_cache = forms.BooleanField(required=False, label='Ignore cached responses')
+
+    # Rows packed into one request; short inputs such as titles need far fewer requests this way
+    batch_size = forms.IntegerField(min_value=1, max_value=100, initial=1, required=False, label='Rows per request')
+
+    # Rows at least this similar to an earlier row reuse its answer; identical rows always do
+    similarity_threshold = forms.FloatField(min_value=0.5, max_value=1.0, initial=0.95, required=False,
+                                            label='Reuse answers of rows at least this similar (0.5 - 1)')
+
+    # Submit the requests as a batch file, answered within 24 hours at a lower price
+    offline_batch = forms.BooleanField(required=False, label='Offline batch (results within 24 hours)')
\ No newline at end of file
@@ -0,0 +1,105 @@
+import os
+import logging
+from django.conf import settings
+from .models import GptBatchJob, GptResult
+from .utils.gpt_utils.operations import clean_and_extract_relevant_columns, build_inputs, save_to_excel
+from .utils.gpt_utils.batch_files import write_batch_requests, read_batch_results, get_batch_service
+from .utils.metrics import StageTimings
+
+
+def submit_gpt_batch_job(upload_path, filename, prompt, model, columns, created_by):
+    """
+    Write the GPT requests of every row of an upload to a JSONL batch request file and submit it
+    to the batch service.
+
+    Parameters:
+    - upload_path (str): The saved Excel upload.
+    - filename (str): The name of the result file created once the batch is complete.
+    - prompt (str): The GPT prompt.
+    - model (str): The GPT model to use.
+    - columns (list): The columns sent to the GPT model.
+    - created_by (User): The user submitting the batch.
+
+    Returns:
+    - GptBatchJob: The tracked batch.
+    """
+    df = clean_and_extract_relevant_columns(upload_path, columns)
+    inputs = build_inputs(df, columns)
+
+    request_path = os.path.join(settings.BASE_DIR, 'database', 'GPT', 'Batches',
+                                f"{os.path.splitext(filename)[0]}.requests.jsonl")
+    write_batch_requests(model, prompt, inputs, request_path)
+
+    return GptBatchJob.objects.create(
+        batch_id=get_batch_service().submit(request_path),
+        upload_path=upload_path,
+        request_path=request_path,
+        filename=filename,
+        prompt=prompt,
+        model_used=model,
+        columns=columns,
+        row_count=len(inputs),
+        created_by=created_by
+    )
+
+
+def sync_gpt_batch_jobs():
+    """
+    Check every batch still in progress, and write the results of completed ones into a GptResult workbook.
+
+    Returns:
+    - list: The batch jobs that completed or failed during this check.
+    """
+    service = get_batch_service()
+    finished = []
+
+    for job in GptBatchJob.objects.filter(status='in_progress'):
+        try:
+            status = service.status(job.batch_id)
+            if status == 'in_progress':
+                continue
+
+            if status == 'failed':
+                job.status = 'failed'
+                job.error = "The batch failed or expired at the batch service."
+            else:
+                job.result = ingest_gpt_batch_job(job, service)
+                job.status = 'completed'
+        except Exception as e:
+            logging.exception(f"GPT batch {job.batch_id} could not be synced")
+            job.status = 'failed'
+            job.error = str(e)
+
+        job.save()
+        finished.append(job)
+
+    return finished
+
+
+def ingest_gpt_batch_job(job, service):
+    """Download the results of a completed batch and save them, in row order, as a GptResult."""
+    timings = StageTimings('gpt-batch')
+    results_path = job.request_path.replace('.requests.jsonl', '.results.jsonl')
+    with timings.stage('download'):
+        service.download(job.batch_id, results_path)
+        responses = read_batch_results(results_path, job.row_count)
+
+    with timings.stage('read'):
+        df = clean_and_extract_relevant_columns(job.upload_path, job.columns)
+        df['GPT Category'] = responses
+
+    with timings.stage('workbook'):
+        output_dir = os.path.join(settings.BASE_DIR, 'database', 'GPT', 'Categorization')
+        os.makedirs(output_dir, exist_ok=True)
+        output_file_path = os.path.join(output_dir, job.filename)
+        save_to_excel(df, output_file_path)
+
+    return GptResult.objects.create(
+        filename=job.filename,
+        file_path=output_file_path,
+        prompt=job.prompt,
+        model_used=job.model_used,
+        cache_misses=job.row_count,
+        stage_timings=timings.finish(),
+        created_by=job.created_by
+    )
@@ -0,0 +1,148 @@
+import os
+import logging
+from django.conf import settings
+from .models import GptJob, GptResult
+from .job_runner import JobRunner
+from .utils.gpt_utils.operations import (
+    clean_and_extract_relevant_columns, build_inputs, build_request_messages, handle_multiple_requests, save_to_excel,
+    is_failed_response
+)
+from .utils.gpt_utils.tokens import token_savings
+from .utils.gpt_utils.similarity import plan_reuse
+from .utils.gpt_utils.checkpoints import GPTCheckpointStore
+from .utils.gpt_utils.response_cache import GPTResponseCache
+from .utils.gpt_utils.exceptions import GPTInvalidColumnsError
+from .utils.metrics import StageTimings
+
+# Most recently used cached answers compared with the rows of a job, bounding the similarity index
+PAST_EXAMPLES_LIMIT = 50000
+
+
+def get_checkpoint_store():
+    return GPTCheckpointStore(os.path.join(settings.BASE_DIR, 'database', 'GPT', 'checkpoints.sqlite3'))
+
+
+def submit_gpt_job(job):
+    """Queue a saved GptJob on the local worker pool."""
+    runner.submit(job.id)
+
+
+def run_gpt_job(job_id):
+    """
+    Categorize the rows of a GPT job claimed by the runner and store its GptResult.
+
+    Every row is checkpointed as soon as its response arrives, so a job interrupted by a crash
+    or restart resumes with the rows that have no successful response yet.
+
+    Parameters:
+    - job_id (int): The primary key of the GptJob to run.
+    """
+    job = GptJob.objects.get(pk=job_id)
+    try:
+        job.result = categorize_job(job)
+        job.status = 'done'
+    except GPTInvalidColumnsError as e:
+        job.status, job.error = 'failed', str(e)
+    except Exception as e:
+        logging.exception(f"GPT job {job_id} failed")
+        job.status, job.error = 'failed', f"Failed to process the Excel file: {str(e)}"
+    # Leaves the owner and heartbeat to the runner
+    job.save(update_fields=['status', 'error', 'result', 'updated_at'])
+
+
+# Local pool running the GPT categorization jobs; interrupted jobs resume from their checkpointed rows
+runner = JobRunner(GptJob, run_gpt_job, settings.GPT_JOB_WORKERS, 'gpt-job')
+
+
+def load_past_examples(cache, prompt, model, limit=PAST_EXAMPLES_LIMIT):
+    """
+    Return (input text, answer) pairs of earlier requests with the same prompt and model, from the response cache.
+    Failed requests are not cached, so every answer is a successful one.
+    """
+    return cache.examples(model, prompt, limit)
+
+
+def categorize_job(job):
+    """
+    Run the GPT categorization of a job and return the created GptResult.
+
+    The final workbook is assembled from the checkpoint store, which is cleared once it is saved.
+    The time spent in every stage is stored on the result.
+    """
+    timings = StageTimings('gpt')
+    with timings.stage('read'):
+        df = clean_and_extract_relevant_columns(job.upload_path, job.columns)
+        inputs = build_inputs(df, job.columns)
+    if job.row_count != len(inputs):
+        job.row_count = len(inputs)
+        job.save(update_fields=['row_count', 'updated_at'])
+
+    checkpoints = get_checkpoint_store()
+    completed = checkpoints.load(job.checkpoint_key, ok_only=True)
+
+    cache = GPTResponseCache(
+        os.path.join(settings.BASE_DIR, 'database', 'GPT', 'cache', 'gpt_responses.sqlite3')
+    ) if job.use_cache else None
+
+    try:
+        # Duplicate and near-duplicate rows reuse one answer instead of being sent again
+        with timings.stage('deduplication'):
+            examples = load_past_examples(cache, job.prompt, job.model_used) if cache else []
+            plan = plan_reuse(inputs, examples, job.similarity_threshold)
+            followers = {}
+            for row, source in enumerate(plan):
+                if source is None or row in completed:
+                    continue
+                if source[0] == 'answer':
+                    checkpoints.save(job.checkpoint_key, row, source[1])
+                elif source[1] in completed:
+                    checkpoints.save(job.checkpoint_key, row, completed[source[1]])
+                else:
+                    followers.setdefault(source[1], []).append(row)
+
+        leaders = [row for row, source in enumerate(plan) if source is None and row not in completed]
+
+        def save_result(position, response):
+            for row in [leaders[position]] + followers.get(leaders[position], []):
+                checkpoints.save(job.checkpoint_key, row, response, not is_failed_response(response))
+
+        sent = []
+        with timings.stage('requests'):
+            handle_multiple_requests(
+                job.model_used, job.prompt, [inputs[row] for row in leaders], cache=cache, batch_size=job.batch_size,
+                on_result=save_result, sent=sent
+            )
+
+        # Only the requests of this run count; reused, cached and checkpointed rows were not sent
+        with timings.stage('token count'):
+            tokens = token_savings(job.prompt, sent, build_request_messages, job.model_used)
+
+        with timings.stage('workbook'):
+            saved = checkpoints.load(job.checkpoint_key)
+            df['GPT Category'] = [saved.get(row) for row in range(len(inputs))]
+
+            output_dir = os.path.join(settings.BASE_DIR, 'database', 'GPT', 'Categorization')
+            os.makedirs(output_dir, exist_ok=True)
+            output_file_path = os.path.join(output_dir, job.filename)
+            save_to_excel(df, output_file_path)
+
+        result = GptResult.objects.create(
+            filename=job.filename,
+            file_path=output_file_path,
+            prompt=job.prompt,
+            model_used=job.model_used,
+            # Rows restored from checkpoints were paid for by the interrupted run
+            cache_hits=cache.hits if cache else 0,
+            cache_misses=cache.misses if cache else len(leaders),
+            prompt_tokens=tokens['tokens'],
+            prompt_tokens_saved=tokens['saved'],
+            api_calls_avoided=sum(source is not None for source in plan),
+            stage_timings=timings.finish(),
+            created_by=job.created_by
+        )
+        checkpoints.clear(job.checkpoint_key)
+        return result
+    finally:
+        checkpoints.close()
+        if cache:
+            cache.close()
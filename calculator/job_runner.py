@@ -0,0 +1,126 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+
+class JobRunner:
+    """
+    Runs the background jobs of one model (CalculationJob, GptJob) on a local pool of threads.
+
+    Several processes (e.g. web server workers) can run jobs from the same table: a job is claimed with a
+    conditional update, so it runs in one process only. Every process beats the heartbeat of the jobs it runs
+    every JOB_HEARTBEAT_SECONDS; a running job whose heartbeat is older than JOB_STALE_SECONDS was left behind
+    by a process that died, and is queued again. Each sweep also picks up the queued jobs, so jobs left behind
+    by a restart are resumed as soon as the runner starts, without waiting for a new submission.
+
+    Attributes:
+    - model (Model): The job model, with 'status', 'owner' and 'heartbeat_at' fields.
+    - run (callable): Runs a claimed job, given its primary key.
+    - max_workers (int): Number of jobs running at the same time in this process.
+    - claim_fields (dict): Fields set along with the status when a job is claimed.
+    - requeue_fields (dict): Fields reset when a stale job is queued again.
+    """
+    def __init__(self, model, run, max_workers, name, claim_fields=None, requeue_fields=None):
+        self.model = model
+        self.run = run
+        self.max_workers = max_workers
+        self.name = name
+        self.claim_fields = claim_fields or {}
+        self.requeue_fields = requeue_fields or {}
+        self.owner = None
+        self._executor = None
+        self._pending = set()
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the pool and the heartbeat thread of this process, once."""
+        with self._lock:
+            if self._executor is not None:
+                return
+            # Set after the web server forked its workers, so every worker has its own owner
+            self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        threading.Thread(target=self._beat, name=f"{self.name}-heartbeat", daemon=True).start()
+
+    def submit(self, job_id):
+        """Queue a saved job on the local pool, unless it is already waiting there."""
+        self.start()
+        with self._lock:
+            if job_id in self._pending or job_id in self._running:
+                return
+            self._pending.add(job_id)
+        self._executor.submit(self._run, job_id)
+
+    def claim(self, job_id):
+        """Mark a queued job as running in this process. Returns False if another process claimed it first."""
+        return bool(self.model.objects.filter(pk=job_id, status='queued').update(
+            status='running', owner=self.owner, heartbeat_at=timezone.now(), **self.claim_fields
+        ))
+
+    def _run(self, job_id):
+        close_old_connections()
+        try:
+            with self._lock:
+                self._pending.discard(job_id)
+            if not self.claim(job_id):
+                return
+            with self._lock:
+                self._running.add(job_id)
+            try:
+                self.run(job_id)
+            finally:
+                with self._lock:
+                    self._running.discard(job_id)
+        finally:
+            close_old_connections()
+
+    def sweep(self):
+        """Beat the heartbeat of the jobs running here, queue the stale jobs again and submit the queued ones."""
+        now = timezone.now()
+        with self._lock:
+            running = list(self._running)
+        if running:
+            self.model.objects.filter(pk__in=running, owner=self.owner, status='running').update(heartbeat_at=now)
+
+        stale_before = now - datetime.timedelta(seconds=settings.JOB_STALE_SECONDS)
+        # Jobs without a heartbeat were claimed before heartbeats were recorded
+        stale = Q(heartbeat_at__lt=stale_before) | Q(heartbeat_at__isnull=True)
+        requeued = self.model.objects.filter(stale, status='running').update(
+            status='queued', owner='', heartbeat_at=None, **self.requeue_fields
+        )
+        if requeued:
+            logging.warning(f"{requeued} {self.model.__name__} jobs with a stale heartbeat were queued again")
+
+        for job_id in self.model.objects.filter(status='queued').order_by('id').values_list('id', flat=True):
+            self.submit(job_id)
+
+    def _beat(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception:
+                logging.exception(f"The {self.name} heartbeat failed")
+            finally:
+                close_old_connections()
+            time.sleep(settings.JOB_HEARTBEAT_SECONDS)
+
+
+def start_job_runners(**kwargs):
+    """
+    Start the calculation and GPT job runners of this process. Connected to the first request of every
+    web server process, rather than run in AppConfig.ready, so management commands do not start them.
+    """
+    from .jobs import runner as calculation_runner
+    from .gpt_jobs import runner as gpt_runner
+    calculation_runner.start()
+    gpt_runner.start()
@@ -0,0 +1,142 @@
+import os
+import logging
+from functools import partial
+from django.conf import settings
+from .models import CalculationJob, CalculationResult
+from .job_runner import JobRunner
+from .utils.calculation import post_process_fees, attach_fee_matrix, combine_fee_batches, calculate_fees_matrix
+from .utils.excel_utils import extract_patent_columns, iter_patent_data
+from .utils.fees_reader import load_fee_schedule
+from .utils.locate import locate_country_codes_in_portfolio
+from .utils.fee_cache import FeeVectorCache, calculate_fees_matrix_cached
+from .utils.sharding import ShardPool, calculate_fees_matrix_sharded
+from .utils.total import add_total_fees_per_patent, calculate_grand_total
+from .utils.overview import write_results_workbook
+from .utils.result_store import save_result_store
+from .utils.metrics import StageTimings
+from .utils.exceptions import MissingRequiredColumnsError, ExcelError
+
+# Worker processes sharding the batches of every job, started on the first sharded batch
+_shard_pool = ShardPool(settings.FEE_SHARD_WORKERS)
+
+
+def fee_engine():
+    """The fee engine of the calculation jobs: batches larger than FEE_SHARD_SIZE are sharded on the shared pool."""
+    if settings.FEE_SHARD_WORKERS == 1:
+        return calculate_fees_matrix
+    return partial(calculate_fees_matrix_sharded, shard_size=settings.FEE_SHARD_SIZE, pool=_shard_pool)
+
+
+def submit_calculation_job(job):
+    """Queue a saved CalculationJob on the local worker pool."""
+    runner.submit(job.id)
+
+
+def _set_progress(job, **fields):
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save(update_fields=list(fields) + ['updated_at'])
+
+
+def run_calculation_job(job_id):
+    """
+    Calculate the fees of a job claimed by the runner and store its CalculationResult.
+
+    Progress (stage and rows processed) is saved on the job as the pipeline runs,
+    errors are saved on the job instead of being raised.
+
+    Parameters:
+    - job_id (int): The primary key of the CalculationJob to run.
+    """
+    job = CalculationJob.objects.get(pk=job_id)
+    try:
+        result = calculate_job(job)
+        _set_progress(job, status='done', stage='done', result=result)
+    except (MissingRequiredColumnsError, ExcelError) as e:
+        _set_progress(job, status='failed', stage='failed', error=str(e))
+    except Exception:
+        logging.exception(f"Calculation job {job_id} failed")
+        _set_progress(job, status='failed', stage='failed',
+                      error="An unexpected error occurred. Please try again later.")
+
+
+# Local pool running the calculation jobs; interrupted jobs restart from the first row
+runner = JobRunner(CalculationJob, run_calculation_job, settings.CALCULATION_WORKERS, 'calculation-job',
+                   claim_fields={'stage': 'reading'}, requeue_fields={'stage': 'queued', 'rows_processed': 0})
+
+
+def calculate_job(job):
+    """
+    Run the fee calculation pipeline for a job and return the created CalculationResult,
+    with the time spent in every stage of the pipeline.
+
+    Parameters:
+    - job (CalculationJob): The job to calculate, its upload must be saved at ``job.upload_path``.
+
+    Returns:
+    - CalculationResult: The stored result.
+    """
+    timings = StageTimings('calculation')
+    fees_info_path = os.path.join(settings.BASE_DIR, 'calculator', 'data', 'feesdollars.xlsx')
+    with timings.stage('fee table'):
+        fee_schedule = load_fee_schedule(fees_info_path)
+
+    output_filename = f"TIPA_MC_{job.project_id}_{job.original_filename}.xlsx"
+    output_file_path = os.path.join(settings.BASE_DIR, 'database', 'calculator', output_filename)
+    store_path = os.path.join(settings.BASE_DIR, 'database', 'calculator', 'store',
+                              f"TIPA_MC_{job.project_id}_{job.original_filename}.parquet")
+
+    fee_cache = FeeVectorCache(os.path.join(settings.BASE_DIR, 'database', 'cache', 'fee_vectors.sqlite3'))
+    engine = fee_engine()
+
+    # Validate, locate the country codes and calculate the fees batch by batch
+    results_batches = []
+    rows_processed = 0
+    try:
+        for patent_df in timings.timed('read', iter_patent_data(job.upload_path, settings.PATENT_BATCH_SIZE)):
+            _set_progress(job, stage='calculating')
+            with timings.stage('locate'):
+                portfolio = extract_patent_columns(patent_df)
+                date_types = locate_country_codes_in_portfolio(portfolio, fee_schedule)
+            with timings.stage('fees'):
+                years, fee_matrix, row_date_types = calculate_fees_matrix_cached(
+                    portfolio, date_types, fee_schedule, job.as_of, fee_cache, engine
+                )
+                results_batches.append(attach_fee_matrix(patent_df, years, fee_matrix, row_date_types))
+            rows_processed += len(patent_df)
+            _set_progress(job, stage='reading', rows_processed=rows_processed)
+    except Exception:
+        # Do not keep uploads that cannot be calculated
+        if os.path.isfile(job.upload_path):
+            os.remove(job.upload_path)
+        raise
+    finally:
+        fee_cache.close()
+
+    _set_progress(job, stage='post-processing')
+    with timings.stage('post-processing'):
+        results_df = combine_fee_batches(results_batches)
+        results_df = post_process_fees(results_df, job.as_of)
+    with timings.stage('totals'):
+        results_df = add_total_fees_per_patent(results_df)
+    with timings.stage('result store'):
+        save_result_store(results_df, store_path)
+
+    # Only pay for the formatted workbook when it was asked for; it can be exported later
+    if job.output_format == 'xlsx':
+        _set_progress(job, stage='writing workbook')
+        with timings.stage('grand total'):
+            results_df = calculate_grand_total(results_df)
+        with timings.stage('workbook'):
+            write_results_workbook(results_df, output_file_path)
+    else:
+        output_filename = os.path.basename(store_path)
+        output_file_path = store_path
+
+    return CalculationResult.objects.create(
+        filename=output_filename,
+        file_path=output_file_path,
+        store_path=store_path,
+        stage_timings=timings.finish(),
+        created_by=job.created_by
+    )
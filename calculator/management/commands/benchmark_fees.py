@@ -0,0 +1,57 @@
+import os
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from calculator.utils.benchmark import run_fee_benchmark, check_regressions, load_baseline, save_baseline
+
+
+class Command(BaseCommand):
+    help = ("Benchmark every stage of the fee calculation on synthetic portfolios against a fixed fee table, "
+            "and compare the timings with a saved baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000],
+                            help="Portfolio sizes in rows.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=settings.PATENT_BATCH_SIZE)
+        parser.add_argument('--directory', default=os.path.join(settings.BASE_DIR, 'database', 'benchmarks'),
+                            help="Where the synthetic portfolios (kept between runs) and result workbooks go.")
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'database', 'benchmarks', 'fee_baseline.json'))
+        parser.add_argument('--update-baseline', action='store_true', help="Save this run as the new baseline.")
+        parser.add_argument('--threshold', type=float, default=1.25,
+                            help="Fail when a stage takes more than this many times its baseline time or memory.")
+        parser.add_argument('--legacy-writer', action='store_true',
+                            help="Also time the separate workbook write, overview and formatting passes.")
+        parser.add_argument('--memory', action='store_true',
+                            help="Also record the peak memory of every stage; tracing slows the stages down.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        results = {}
+        for rows in options['sizes']:
+            self.stdout.write(f"{rows} rows")
+            stages = run_fee_benchmark(rows, options['directory'], seed=options['seed'], batch_size=options['batch_size'],
+                                       legacy_writer=options['legacy_writer'], trace_memory=options['memory'])
+            for stage, result in stages.items():
+                memory = f", peak {result['peak_mb']:.1f} MB" if result['peak_mb'] is not None else ""
+                self.stdout.write(f"  {stage:<16} {result['seconds']:>9.3f}s{memory}")
+            results[str(rows)] = stages
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+
+        if options['update_baseline']:
+            save_baseline(results, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {options['baseline']}"))
+            return
+
+        baseline = load_baseline(options['baseline'])
+        if not baseline:
+            self.stdout.write(f"No baseline at {options['baseline']}; save one with --update-baseline.")
+            return
+
+        regressions = check_regressions(results, baseline, options['threshold'])
+        if regressions:
+            raise CommandError("Performance regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No stage regressed beyond {options['threshold']}x the baseline."))
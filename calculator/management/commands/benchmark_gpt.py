@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from calculator.utils.gpt_utils.client import client_manager
+from calculator.utils.gpt_utils import operations
+from calculator.utils.gpt_utils.operations import categorize_claims, is_failed_response
+from calculator.utils.gpt_utils.standin import StandInGPTServer
+
+BENCHMARK_PROMPT = "Categorize the patent into one of: Category A, Category B, Category C, Category D. Answer with the category only."
+
+
+def synthetic_titles(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    words = ['method', 'system', 'device', 'apparatus', 'battery', 'sensor', 'wireless', 'vehicle', 'control',
+             'signal', 'image', 'data', 'network', 'composition', 'process', 'coating', 'valve', 'antenna']
+    return [' '.join(rng.choice(words, size=rng.integers(4, 10))) + f' {i}' for i in range(rows)]
+
+
+def timed_chat_completions(create_chat_completion, latencies):
+    """
+    Wrap ``create_chat_completion`` so the seconds every call takes on the client side, from
+    queuing for the limiter through the retries to the parsed reply, are appended to ``latencies``.
+    """
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return create_chat_completion(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+    return timed
+
+
+def percentile_ms(seconds, percentile):
+    return round(float(np.percentile(seconds, percentile)) * 1000, 1) if len(seconds) else None
+
+
+class Command(BaseCommand):
+    help = "Benchmark the GPT categorization pipeline end to end against the local stand-in API."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[2, 8, 16])
+        parser.add_argument('--batch-size', type=int, default=1)
+        parser.add_argument('--median-latency', type=float, default=0.3)
+        parser.add_argument('--latency-sigma', type=float, default=0.5)
+        parser.add_argument('--rate-limit-probability', type=float, default=0.02)
+        parser.add_argument('--retry-after', type=float, default=0.5)
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        server = StandInGPTServer(
+            median_latency=options['median_latency'], latency_sigma=options['latency_sigma'],
+            rate_limit_probability=options['rate_limit_probability'], retry_after=options['retry_after'], seed=0
+        ).start()
+        df = pd.DataFrame({'Patent/ Publication Number': range(options['rows']),
+                           'Title': synthetic_titles(options['rows'])})
+
+        config_path = client_manager.config_path
+        create_chat_completion = operations.create_chat_completion
+        results = []
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                client_manager.config_path = os.path.join(directory, 'config.json')
+
+                for concurrency in options['concurrency']:
+                    with open(client_manager.config_path, 'w') as file:
+                        json.dump({
+                            'OPENAI_API_KEY': 'stand-in',
+                            'OPENAI_BASE_URL': server.base_url,
+                            'MAX_CONCURRENT_REQUESTS': concurrency,
+                            'REQUESTS_PER_MINUTE': 1000000,
+                            'TOKENS_PER_MINUTE': 100000000,
+                        }, file)
+                    # A fresh mtime, so the new settings are picked up
+                    os.utime(client_manager.config_path, ns=(time.time_ns(), time.time_ns()))
+                    server.reset_stats()
+                    latencies = []
+                    operations.create_chat_completion = timed_chat_completions(create_chat_completion, latencies)
+
+                    start = time.perf_counter()
+                    categorized = categorize_claims(df.copy(), 'gpt-4o-mini', BENCHMARK_PROMPT, ['Title'],
+                                                    batch_size=options['batch_size'])
+                    elapsed = time.perf_counter() - start
+
+                    # Latencies as the pipeline sees them; the stand-in's own delays only show the server side
+                    result = {
+                        'concurrency': concurrency,
+                        'batch_size': options['batch_size'],
+                        'rows': options['rows'],
+                        'seconds': round(elapsed, 3),
+                        'rows_per_second': round(options['rows'] / elapsed, 1),
+                        'requests': len(latencies),
+                        'p50_latency_ms': percentile_ms(latencies, 50),
+                        'p95_latency_ms': percentile_ms(latencies, 95),
+                        'server_p50_latency_ms': percentile_ms(server.latencies, 50),
+                        'retries': server.rate_limited,
+                        'failed_rows': int(sum(is_failed_response(answer) for answer in categorized['GPT Category'])),
+                    }
+                    results.append(result)
+                    self.stdout.write(
+                        f"concurrency {concurrency:>3}: {result['rows_per_second']:>8} rows/s, "
+                        f"p50 {result['p50_latency_ms']} ms, p95 {result['p95_latency_ms']} ms, "
+                        f"{result['requests']} requests, {result['retries']} retries, {result['failed_rows']} failed rows"
+                    )
+        finally:
+            operations.create_chat_completion = create_chat_completion
+            client_manager.config_path = config_path
+            server.stop()
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
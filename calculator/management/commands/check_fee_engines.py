@@ -0,0 +1,45 @@
+import os
+import datetime
+import tempfile
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from calculator.utils.fees_reader import load_fee_schedule
+from calculator.utils.equivalence import check_equivalence, fee_engines, sample_workbooks
+
+
+class Command(BaseCommand):
+    help = ("Check that the vectorized, sharded and cached fee engines produce the same year columns, Total Fees "
+            "and Grand Total as the legacy date_check path, on the sample workbooks and generated edge cases.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fees', default=os.path.join(settings.BASE_DIR, 'calculator', 'data', 'feesdollars.xlsx'),
+                            help="The fees workbook.")
+        parser.add_argument('--samples', default=settings.MEDIA_ROOT,
+                            help="Directory of sample portfolio workbooks.")
+        parser.add_argument('--workbook', nargs='*', default=[], help="Additional portfolio workbooks to check.")
+        parser.add_argument('--as-of', type=datetime.date.fromisoformat, help="Valuation date (YYYY-MM-DD); today by default.")
+
+    def handle(self, *args, **options):
+        fee_schedule = load_fee_schedule(options['fees'])
+        if not fee_schedule.countries:
+            raise CommandError(f"Could not read the fees data from {options['fees']}.")
+
+        workbooks = sample_workbooks(options['samples']) + options['workbook']
+        self.stdout.write(f"{len(workbooks)} sample workbooks, fee table {fee_schedule.version[:12]}")
+
+        divergent = 0
+        with tempfile.TemporaryDirectory() as directory:
+            for case, engine, divergence in check_equivalence(workbooks, fee_schedule, fee_engines(directory),
+                                                              options['as_of'], directory):
+                if divergence is None:
+                    self.stdout.write(f"  {case} [{engine}]: identical")
+                elif engine == 'legacy':
+                    # Nothing to compare the engines with
+                    self.stdout.write(self.style.WARNING(f"  {case}: {divergence}"))
+                else:
+                    divergent += 1
+                    self.stdout.write(self.style.ERROR(f"  {case} [{engine}]: {divergence}"))
+
+        if divergent:
+            raise CommandError(f"{divergent} divergent results.")
+        self.stdout.write(self.style.SUCCESS("Every engine matches the legacy path."))
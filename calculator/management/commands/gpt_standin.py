@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from calculator.utils.gpt_utils.standin import StandInGPTServer
+
+
+class Command(BaseCommand):
+    help = "Run a local OpenAI-compatible stand-in for the chat completions API (set OPENAI_BASE_URL to its URL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--median-latency', type=float, default=0.3, help="Median latency in seconds.")
+        parser.add_argument('--latency-sigma', type=float, default=0.5, help="Spread of the log-normal latency.")
+        parser.add_argument('--rate-limit-probability', type=float, default=0.0,
+                            help="Share of requests refused with a 429.")
+        parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After of the 429s, in seconds.")
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        server = StandInGPTServer(
+            host=options['host'], port=options['port'], median_latency=options['median_latency'],
+            latency_sigma=options['latency_sigma'], rate_limit_probability=options['rate_limit_probability'],
+            retry_after=options['retry_after'], seed=options['seed']
+        )
+        self.stdout.write(f"Stand-in GPT API listening on {server.base_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.stop()
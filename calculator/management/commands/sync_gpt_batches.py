@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from calculator.gpt_batches import sync_gpt_batch_jobs
+
+
+class Command(BaseCommand):
+    help = "Check the offline GPT batches in progress and store the results of the completed ones."
+
+    def handle(self, *args, **options):
+        for job in sync_gpt_batch_jobs():
+            if job.status == 'completed':
+                self.stdout.write(self.style.SUCCESS(f"{job.filename}: {job.row_count} rows stored"))
+            else:
+                self.stdout.write(self.style.ERROR(f"{job.filename}: {job.error}"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0009_calculationresult_created_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calculationresult',
+            name='store_path',
+            field=models.CharField(blank=True, max_length=1024, null=True),
+        ),
+    ]
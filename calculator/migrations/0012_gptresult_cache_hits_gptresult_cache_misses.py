@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0011_calculationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gptresult',
+            name='cache_hits',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='gptresult',
+            name='cache_misses',
+            field=models.IntegerField(default=0),
+        ),
+    ]
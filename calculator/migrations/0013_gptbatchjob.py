@@ -0,0 +1,35 @@
+# Generated by Django 5.1 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0012_gptresult_cache_hits_gptresult_cache_misses'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GptBatchJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(max_length=255)),
+                ('upload_path', models.CharField(max_length=1024)),
+                ('request_path', models.CharField(max_length=1024)),
+                ('filename', models.CharField(max_length=255)),
+                ('prompt', models.TextField()),
+                ('model_used', models.CharField(max_length=255)),
+                ('columns', models.JSONField()),
+                ('row_count', models.IntegerField()),
+                ('status', models.CharField(choices=[('in_progress', 'In progress'), ('completed', 'Completed'), ('failed', 'Failed')], default='in_progress', max_length=16)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('result', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='calculator.gptresult')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0014_gptjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gptresult',
+            name='prompt_tokens',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='gptresult',
+            name='prompt_tokens_saved',
+            field=models.IntegerField(default=0),
+        ),
+    ]
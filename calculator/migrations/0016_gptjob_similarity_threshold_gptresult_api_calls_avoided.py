@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0015_gptresult_prompt_tokens_gptresult_prompt_tokens_saved'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gptjob',
+            name='similarity_threshold',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='gptresult',
+            name='api_calls_avoided',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0016_gptjob_similarity_threshold_gptresult_api_calls_avoided'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calculationresult',
+            name='stage_timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='gptresult',
+            name='stage_timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0017_calculationresult_stage_timings_gptresult_stage_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calculationjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='calculationjob',
+            name='owner',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0018_calculationjob_owner_calculationjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gptjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='gptjob',
+            name='owner',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
@@ -7,13 +7,16 @@ class CalculationResult(models.Model):
     filename = models.CharField(max_length=255)
     custom_name = models.CharField(max_length=255, blank=True, null=True)  # New field
     file_path = models.CharField(max_length=1024)
+    store_path = models.CharField(max_length=1024, blank=True, null=True)  # Parquet result store the exports are made from
+    stage_timings = models.JSONField(default=dict, blank=True)  # Seconds spent in each stage of the calculation
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)  # Track the user who created the file
 
     def delete_file(self):
-        if os.path.isfile(self.file_path):
-            os.remove(self.file_path)
-            print(f"Deleted file: {self.file_path}")
+        for path in {self.file_path, self.store_path} - {None, ''}:
+            if os.path.isfile(path):
+                os.remove(path)
+                print(f"Deleted file: {path}")
 
     def delete(self, *args, **kwargs):
         self.delete_file()  # Delete the file before deleting the model instance
@@ -25,6 +28,12 @@ class GptResult(models.Model):
     file_path = models.CharField(max_length=1024)
     prompt = models.TextField()
     model_used = models.CharField(max_length=255, blank=True, null=True)  # Optional: Store the GPT model used
+    cache_hits = models.IntegerField(default=0)  # Rows answered from the response cache
+    cache_misses = models.IntegerField(default=0)  # Rows sent to the API
+    prompt_tokens = models.IntegerField(default=0)  # Prompt tokens of the requests sent
+    prompt_tokens_saved = models.IntegerField(default=0)  # Prompt tokens saved compared to the former message layout
+    api_calls_avoided = models.IntegerField(default=0)  # Rows answered by an identical or near-identical row
+    stage_timings = models.JSONField(default=dict, blank=True)  # Seconds spent in each stage of the categorization
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)  # Track the user who created the file
 
@@ -39,3 +48,91 @@ class GptResult(models.Model):
     def delete(self, *args, **kwargs):
         self.delete_file()  # Delete the file before deleting the model instance
         super().delete(*args, **kwargs)
+
+
+class CalculationJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    upload_path = models.CharField(max_length=1024)  # Saved upload the job calculates from
+    original_filename = models.CharField(max_length=255)
+    project_id = models.IntegerField()
+    as_of = models.DateField()
+    output_format = models.CharField(max_length=16, default='xlsx')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='queued')
+    stage = models.CharField(max_length=64, default='queued')  # Pipeline stage currently running
+    rows_processed = models.IntegerField(default=0)
+    owner = models.CharField(max_length=255, blank=True, default='')  # Process running the job
+    heartbeat_at = models.DateTimeField(blank=True, null=True)  # Last sign of life of the running job
+    error = models.TextField(blank=True, null=True)
+    result = models.ForeignKey(CalculationResult, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)  # Track the user who submitted the job
+
+    def __str__(self):
+        return f"{self.original_filename} ({self.status})"
+
+
+class GptBatchJob(models.Model):
+    STATUS_CHOICES = [
+        ('in_progress', 'In progress'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    batch_id = models.CharField(max_length=255)  # Id of the batch at the batch service
+    upload_path = models.CharField(max_length=1024)  # Saved upload the results are written back into
+    request_path = models.CharField(max_length=1024)  # JSONL batch request file
+    filename = models.CharField(max_length=255)  # Name of the GptResult file to create
+    prompt = models.TextField()
+    model_used = models.CharField(max_length=255)
+    columns = models.JSONField()  # Columns sent to the GPT model
+    row_count = models.IntegerField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='in_progress')
+    error = models.TextField(blank=True, null=True)
+    result = models.ForeignKey(GptResult, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)  # Track the user who submitted the batch
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+
+class GptJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    upload_path = models.CharField(max_length=1024)  # Saved upload the job categorizes
+    filename = models.CharField(max_length=255)  # Name of the GptResult file to create
+    prompt = models.TextField()
+    model_used = models.CharField(max_length=255)
+    columns = models.JSONField()  # Columns sent to the GPT model
+    batch_size = models.IntegerField(default=1)
+    use_cache = models.BooleanField(default=True)
+    similarity_threshold = models.FloatField(blank=True, null=True)  # Near-duplicate rows reuse answers above it
+    row_count = models.IntegerField(default=0)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='queued')
+    owner = models.CharField(max_length=255, blank=True, default='')  # Process running the job
+    heartbeat_at = models.DateTimeField(blank=True, null=True)  # Last sign of life of the running job
+    error = models.TextField(blank=True, null=True)
+    result = models.ForeignKey(GptResult, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)  # Track the user who submitted the job
+
+    @property
+    def checkpoint_key(self):
+        # Rows of this job in the GPT checkpoint store
+        return f"gpt-job-{self.pk}"
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
@@ -1,3 +1,879 @@
-from django.test import TestCase
+import io
+import os
+import json
+import datetime
+import time
+import sqlite3
+import tempfile
+from contextlib import redirect_stdout
+from unittest import mock
+import httpx
+import numpy as np
+import pandas as pd
+import openai
+from openpyxl import load_workbook
+from django.conf import settings
+from django.core.signals import request_started
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from . import jobs
+from .job_runner import JobRunner, start_job_runners
+from .models import CalculationJob, GptJob
+from . import gpt_jobs, gpt_batches
+from .checks import check_fee_shard_size
+from .utils.benchmark import benchmark_fee_schedule, generate_portfolio
+from .utils.sharding import ShardPool, calculate_fees_matrix_sharded
+from .utils.gpt_utils import operations, retry, response_cache
+from .utils.gpt_utils.response_cache import GPTResponseCache
+from .utils.gpt_utils.batch_files import read_batch_results, get_batch_service, LocalBatchService
+from .utils.gpt_utils.similarity import SimilarityIndex, plan_reuse
+from .utils.gpt_utils.tokens import token_savings, count_message_tokens, legacy_messages
+from .utils import fee_cache
+from .utils.fee_cache import FeeVectorCache, FEE_CACHE_LOOKUPS, calculate_fees_matrix_cached
+from .utils.fees_reader import FeeSchedule, load_fee_schedule
+from .utils.equivalence import check_equivalence, fee_engines, sample_workbooks
+from .utils.excel_utils import extract_patent_info, extract_patent_columns, iter_patent_data
+from .utils.locate import locate_country_code_in_fees, locate_country_codes_in_portfolio
+from .utils.calculation import date_check, calculate_fees_matrix, attach_fee_matrix, combine_fee_batches, post_process_fees
+from .utils.total import add_total_fees_per_patent, calculate_grand_total
+from .utils.overview import write_results_workbook, create_overview_sheet, format_dates_and_currency
+from .utils.result_store import save_result_store, load_result_store, export_results
 
-# Create your tests here.
+AS_OF = datetime.date(2026, 10, 18)
+
+
+def gapped_fee_schedule():
+    """A small fee table whose publication and file date columns have blank cells."""
+    fees = {
+        'US': ['Publication Date', 'United States'] + [0, 0, 400, np.nan, 0, 0, 900, 0, np.nan, 0, 1800, 0, 0, 0, 3700, 0, 0, 0, 0, 0],
+        'JP': ['Publication Date', 'Japan'] + [40, 40, 40, 120, np.nan, 120, 300, np.nan, 300, 900, 900, 900, 900, 900, 900, 900, 900, 900, 900, 900],
+        'JPPC': ['Publication Date', 'Japan'] + [3, 3, 3, 9, 9, 9, np.nan, 20, 20, 60, 60, 60, 60, 60, 60, 60, 60, 60, 60, 60],
+        'TW': ['Publication Date', 'Taiwan'] + [30, 30, np.nan, 60, 60, 60, 110, 110, 110, 190, 190, 190, 190, np.nan, 190, 190, 190, 190, 190, 190],
+        'DE': ['File Date', 'Germany'] + [0, 0, 70, 80, np.nan, 150, 210, 270, 330, 400, 480, 550, np.nan, 700, 800, 900, 1000, 1100, 1200, 1300],
+    }
+    return FeeSchedule(pd.DataFrame(fees), version='gapped')
+
+
+def gapped_portfolio():
+    rows = []
+    for country in ('US', 'JP', 'TW', 'DE'):
+        for issued_year in (2012, 2018, 2026):
+            rows.append({
+                'Patent/ Publication Number': f"{country}{issued_year}",
+                'Publication Country': country,
+                'Type': 'Grant',
+                'File Date': pd.Timestamp(issued_year - 3, 5, 1),
+                'Publication Date': pd.Timestamp(issued_year, 11, 20),
+                'Est. Expiration Date': pd.Timestamp(issued_year + 17, 5, 1),
+                'Number of claims': 14,
+            })
+    return pd.DataFrame(rows)
+
+
+def gapped_results():
+    """The fees of the gapped portfolio with the total of every patent, as the calculation job stores them."""
+    patent_df = gapped_portfolio()
+    fee_schedule = gapped_fee_schedule()
+    portfolio = extract_patent_columns(patent_df)
+    date_types = locate_country_codes_in_portfolio(portfolio, fee_schedule)
+    years, fee_matrix, row_date_types = calculate_fees_matrix(portfolio, date_types, fee_schedule, AS_OF)
+    results_df = combine_fee_batches([attach_fee_matrix(patent_df, years, fee_matrix, row_date_types)])
+    return add_total_fees_per_patent(post_process_fees(results_df, AS_OF))
+
+
+class FeeEngineBlankCellsTests(SimpleTestCase):
+    """The vectorized engine matches date_check on fee columns with blank cells."""
+
+    def test_gapped_columns_match_date_check(self):
+        fee_schedule = gapped_fee_schedule()
+        patent_df = gapped_portfolio()
+
+        # The per-patent path, as calculate_fees_view used to run it
+        patent_info = extract_patent_info(patent_df)
+        with redirect_stdout(io.StringIO()):
+            date_types = locate_country_code_in_fees(patent_info, fee_schedule)
+            expected = patent_df.copy()
+            expected['Date Type'] = None
+            for i, patent in enumerate(patent_info):
+                expected = date_check(patent, date_types, fee_schedule.frame, expected, i, AS_OF)
+
+            years, fee_matrix, row_date_types = calculate_fees_matrix(
+                extract_patent_columns(patent_df), date_types, fee_schedule, AS_OF
+            )
+        actual = attach_fee_matrix(patent_df, years, fee_matrix, row_date_types)
+
+        year_columns = sorted({col for col in list(expected.columns) + list(actual.columns) if col.isdigit()}, key=int)
+        for col in year_columns:
+            expected_fees = pd.to_numeric(expected.get(col), errors='coerce')
+            actual_fees = pd.to_numeric(actual.get(col), errors='coerce')
+            self.assertIsNotNone(expected_fees, col)
+            self.assertIsNotNone(actual_fees, col)
+            np.testing.assert_allclose(actual_fees.to_numpy(dtype=float), expected_fees.to_numpy(dtype=float),
+                                       atol=0.005, err_msg=f"year {col}")
+
+    def test_publication_date_fees_skip_blank_cells(self):
+        japan = gapped_fee_schedule()['JP']
+        # Blank cells are dropped, so the fee after a gap moves up
+        self.assertEqual(list(japan.listed_fees[:8]), [40, 40, 40, 120, 120, 300, 300, 900])
+        # File date countries keep every fee in its row
+        self.assertEqual(list(gapped_fee_schedule()['DE'].fees[:6]), [0, 0, 70, 80, 0, 150])
+
+
+class FeeShardingTests(SimpleTestCase):
+    """Calculation jobs shard their batches on the shared process pool."""
+
+    def test_batches_are_larger_than_shards(self):
+        self.assertEqual(check_fee_shard_size(None), [])
+        with override_settings(FEE_SHARD_SIZE=settings.PATENT_BATCH_SIZE + 1):
+            self.assertEqual([error.id for error in check_fee_shard_size(None)], ['calculator.E001'])
+
+    @override_settings(FEE_SHARD_SIZE=500, FEE_SHARD_WORKERS=2)
+    def test_large_batch_takes_the_parallel_path(self):
+        fee_schedule = benchmark_fee_schedule()
+        portfolio = extract_patent_columns(generate_portfolio(2000))
+        date_types = locate_country_codes_in_portfolio(portfolio, fee_schedule)
+
+        pool = ShardPool(max_workers=2)
+        self.addCleanup(pool.shutdown)
+        with mock.patch.object(jobs, '_shard_pool', pool):
+            years, fee_matrix, row_date_types = jobs.fee_engine()(portfolio, date_types, fee_schedule, AS_OF)
+        self.assertEqual(pool.shards_calculated, 4)
+
+        expected_years, expected_matrix, expected_date_types = calculate_fees_matrix(portfolio, date_types, fee_schedule, AS_OF)
+        np.testing.assert_array_equal(years, expected_years)
+        np.testing.assert_array_equal(fee_matrix, expected_matrix)
+        np.testing.assert_array_equal(row_date_types, expected_date_types)
+
+    def test_pool_restarts_for_a_new_fee_table(self):
+        fee_schedule = benchmark_fee_schedule()
+        portfolio = extract_patent_columns(generate_portfolio(600))
+        date_types = locate_country_codes_in_portfolio(portfolio, fee_schedule)
+        # The same table with the US fees doubled, under another version
+        frame = fee_schedule.frame.copy()
+        frame.loc[frame.index[2:], 'US'] = frame['US'].iloc[2:] * 2
+        changed = FeeSchedule(frame, version='benchmark-v2')
+
+        pool = ShardPool(max_workers=2)
+        self.addCleanup(pool.shutdown)
+        for schedule in (fee_schedule, changed, fee_schedule):
+            _, fee_matrix, _ = calculate_fees_matrix_sharded(portfolio, date_types, schedule, AS_OF, shard_size=200,
+                                                             pool=pool)
+            _, expected_matrix, _ = calculate_fees_matrix(portfolio, date_types, schedule, AS_OF)
+            np.testing.assert_array_equal(fee_matrix, expected_matrix)
+        self.assertEqual(pool.shards_calculated, 9)
+
+
+class JobRunnerTests(TestCase):
+    """Jobs are claimed by one process, and only jobs with a stale heartbeat are taken over."""
+
+    def make_runner(self, owner):
+        runner = JobRunner(CalculationJob, lambda job_id: None, 1, 'test-job',
+                           requeue_fields={'stage': 'queued', 'rows_processed': 0})
+        runner.owner = owner
+        return runner
+
+    def make_job(self, **fields):
+        return CalculationJob.objects.create(upload_path='upload.xlsx', original_filename='upload', project_id=1,
+                                             as_of=AS_OF, **fields)
+
+    def test_job_is_claimed_once(self):
+        job = self.make_job()
+        self.assertTrue(self.make_runner('first').claim(job.id))
+        self.assertFalse(self.make_runner('second').claim(job.id))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.owner), ('running', 'first'))
+
+    @override_settings(JOB_STALE_SECONDS=120)
+    def test_sweep_requeues_only_stale_jobs(self):
+        now = timezone.now()
+        stale = self.make_job(status='running', owner='dead', heartbeat_at=now - datetime.timedelta(minutes=10),
+                              stage='calculating', rows_processed=50000)
+        alive = self.make_job(status='running', owner='alive', heartbeat_at=now)
+        queued = self.make_job()
+
+        runner = self.make_runner('sweeper')
+        with mock.patch.object(runner, 'submit') as submit:
+            runner.sweep()
+        self.assertEqual([call.args[0] for call in submit.call_args_list], [stale.id, queued.id])
+
+        stale.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual((stale.status, stale.owner, stale.stage, stale.rows_processed), ('queued', '', 'queued', 0))
+        self.assertEqual((alive.status, alive.owner), ('running', 'alive'))
+
+
+class GPTRateLimitTests(SimpleTestCase):
+    """The rate limiter is acquired before every request, including the retries of a split batch."""
+
+    def test_split_batches_acquire_the_limiter(self):
+        def reply(model, messages):
+            # Batches get an unusable reply, so they are split down to single rows
+            content = f"answer to {messages[1]['content']}" if not messages[1]['content'].startswith('[') else 'no json'
+            return mock.Mock(choices=[mock.Mock(message=mock.Mock(content=content))], usage=None)
+
+        client = mock.Mock()
+        client.chat.completions.create.side_effect = reply
+        limiter = mock.Mock()
+        with mock.patch.object(operations, 'load_config', return_value={}), \
+                mock.patch.object(operations.client_manager, 'get_client', return_value=client):
+            answers = operations.categorize_batch('gpt-test', 'Categorize', ['a', 'b', 'c', 'd'], limiter=limiter)
+
+        self.assertEqual(answers, ['answer to a', 'answer to b', 'answer to c', 'answer to d'])
+        # 4 rows, then 2 halves, then 4 single rows
+        self.assertEqual(client.chat.completions.create.call_count, 7)
+        self.assertEqual(limiter.acquire.call_count, 7)
+
+    def test_reply_without_content_fails_its_row_only(self):
+        def reply(model, messages):
+            # The batch and row 'b' are stopped by the content filter
+            content = messages[1]['content']
+            if content.startswith('[') or content == 'b':
+                choice = mock.Mock(message=mock.Mock(content=None, refusal=None), finish_reason='content_filter')
+            else:
+                choice = mock.Mock(message=mock.Mock(content=f"answer to {content}"), finish_reason='stop')
+            return mock.Mock(choices=[choice], usage=None)
+
+        client = mock.Mock()
+        client.chat.completions.create.side_effect = reply
+        with mock.patch.object(operations, 'load_config', return_value={}), \
+                mock.patch.object(operations.client_manager, 'get_client', return_value=client):
+            answers = operations.categorize_batch('gpt-test', 'Categorize', ['a', 'b', 'c'])
+            single = operations.call_gpt_model('gpt-test', 'Categorize', 'b')
+
+        self.assertEqual(answers, ['answer to a', "API request failed: The GPT reply has no content (content_filter)",
+                                   'answer to c'])
+        self.assertEqual(single, "API request failed: The GPT reply has no content (content_filter)")
+
+    def test_token_savings_count_the_requests_sent(self):
+        sent = [['a', 'b', 'c'], ['d']]
+        tokens = token_savings('Categorize', sent, operations.build_request_messages)
+
+        self.assertEqual(tokens['tokens'], count_message_tokens(operations.build_request_messages('Categorize', ['a', 'b', 'c']))
+                         + count_message_tokens(operations.build_messages('Categorize', 'd')))
+        self.assertEqual(tokens['legacy_tokens'], sum(count_message_tokens(legacy_messages('Categorize', text))
+                                                      for text in 'abcd'))
+        self.assertEqual(tokens['saved'], tokens['legacy_tokens'] - tokens['tokens'])
+
+        # The rows of a split batch were sent once in the former layout
+        resent = token_savings('Categorize', sent + [['a'], ['b', 'c']], operations.build_request_messages)
+        self.assertEqual(resent['legacy_tokens'], tokens['legacy_tokens'])
+        self.assertGreater(resent['tokens'], tokens['tokens'])
+
+
+class BatchResultsTests(SimpleTestCase):
+    """Batch results are read back into one response per row."""
+
+    def test_reply_without_content_is_a_failed_row(self):
+        def result(row, message, finish_reason='stop'):
+            choice = {'index': 0, 'message': message, 'finish_reason': finish_reason}
+            return {'custom_id': f"row-{row}", 'error': None,
+                    'response': {'status_code': 200, 'body': {'choices': [choice]}}}
+
+        lines = [
+            result(0, {'role': 'assistant', 'content': ' Category A \n'}),
+            result(1, {'role': 'assistant', 'content': None}, finish_reason='content_filter'),
+            result(2, {'role': 'assistant', 'content': None, 'refusal': "I can't help with that."}),
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8', delete=False) as file:
+            file.write('\n'.join(json.dumps(line) for line in lines))
+        self.addCleanup(os.remove, file.name)
+
+        responses = read_batch_results(file.name, 4)
+        self.assertEqual(responses[0], 'Category A')
+        self.assertEqual(responses[1], "API request failed: no content in the reply (content_filter)")
+        self.assertEqual(responses[2], "API request failed: no content in the reply (I can't help with that.)")
+        self.assertTrue(all(operations.is_failed_response(response) for response in responses[1:]))
+
+    def test_results_of_unknown_rows_are_skipped(self):
+        lines = [
+            {'custom_id': 'row-5', 'error': None, 'response': {'status_code': 200, 'body': {
+                'choices': [{'message': {'role': 'assistant', 'content': 'Category B'}}]}}},
+            {'custom_id': 'row-1', 'error': None, 'response': {'status_code': 200, 'body': {
+                'choices': [{'message': {'role': 'assistant', 'content': 'Category A'}}]}}},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8', delete=False) as file:
+            file.write('\n'.join(json.dumps(line) for line in lines))
+        self.addCleanup(os.remove, file.name)
+
+        with self.assertLogs(level='WARNING') as logs:
+            responses = read_batch_results(file.name, 2)
+        self.assertEqual(responses, ["API request failed: no result in the batch output", 'Category A'])
+        self.assertIn('row-5', logs.output[0])
+
+
+class GPTBatchPipelineTests(TestCase):
+    """A batch goes from submission through the local batch service to a GptResult workbook."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(BASE_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        service_directory = os.path.join(self.directory, 'batch service')
+        config = mock.patch.object(operations.client_manager, 'get_config',
+                                   return_value={'BATCH_SERVICE_DIR': service_directory})
+        config.start()
+        self.addCleanup(config.stop)
+
+    def test_submit_process_sync(self):
+        titles = ['t0', 't1', 't2']
+        upload_path = os.path.join(self.directory, 'upload.xlsx')
+        pd.DataFrame({'Patent/ Publication Number': ['US0', 'US1', 'US2'], 'Title': titles}).to_excel(upload_path, index=False)
+
+        job = gpt_batches.submit_gpt_batch_job(upload_path, 'TIPA_0001_upload.xlsx', 'Categorize', 'gpt-test',
+                                               ['Title'], None)
+        self.assertEqual((job.status, job.row_count), ('in_progress', 3))
+
+        # Nothing to ingest before the batch service answers
+        self.assertEqual(gpt_batches.sync_gpt_batch_jobs(), [])
+
+        service = get_batch_service()
+        self.assertIsInstance(service, LocalBatchService)
+        service.process(job.batch_id, lambda body: f"cat {body['messages'][-1]['content']}")
+
+        self.assertEqual(gpt_batches.sync_gpt_batch_jobs(), [job])
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.result.cache_misses, 3)
+        workbook = pd.read_excel(job.result.file_path)
+        self.assertEqual(list(workbook['GPT Category']), ['cat Title: t0', 'cat Title: t1', 'cat Title: t2'])
+
+
+class GoldenOutputTests(SimpleTestCase):
+    """Every fee engine matches the legacy date_check path, as check_fee_engines checks it."""
+
+    def check_engines(self, workbooks, fee_schedule):
+        with tempfile.TemporaryDirectory() as directory:
+            report = check_equivalence(workbooks, fee_schedule, fee_engines(directory), AS_OF, directory)
+        # Cases the legacy path cannot calculate have nothing to compare the engines with
+        divergent = [entry for entry in report if entry[1] != 'legacy' and entry[2] is not None]
+        self.assertEqual(divergent, [])
+        return {case for case, engine, _ in report if engine != 'legacy'}
+
+    def test_media_samples(self):
+        fee_schedule = load_fee_schedule(os.path.join(settings.BASE_DIR, 'calculator', 'Data', 'FeesDollars.xlsx'))
+        workbooks = sample_workbooks(settings.MEDIA_ROOT)
+        self.assertTrue(workbooks)
+
+        checked = self.check_engines(workbooks, fee_schedule)
+        self.assertTrue({os.path.basename(path) for path in workbooks} <= checked)
+        self.assertIn('fee table with blank cells', checked)
+
+    def test_fee_table_with_blank_cells(self):
+        checked = self.check_engines([], gapped_fee_schedule())
+        self.assertIn('fee table with blank cells', checked)
+
+
+class CalculateFeesViewTests(TestCase):
+    """Uploads are only accepted from logged in users."""
+
+    def setUp(self):
+        # No job runners in tests
+        request_started.disconnect(dispatch_uid='calculator.start_job_runners')
+        self.addCleanup(request_started.connect, start_job_runners, dispatch_uid='calculator.start_job_runners')
+
+    def test_anonymous_upload_is_redirected_to_login(self):
+        upload = io.BytesIO(b'not a workbook')
+        upload.name = 'portfolio.xlsx'
+        response = self.client.post(reverse('calculate_fees'), {'file': upload})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.LOGIN_URL, response['Location'])
+        self.assertFalse(CalculationJob.objects.exists())
+
+
+def api_error(status_code, headers=None):
+    """An OpenAI API error with the given status and response headers."""
+    response = httpx.Response(status_code, headers=headers, request=httpx.Request('POST', 'https://api.test/v1/chat'))
+    if status_code == 429:
+        error_class = openai.RateLimitError
+    elif status_code >= 500:
+        error_class = openai.InternalServerError
+    else:
+        error_class = openai.APIStatusError
+    return error_class(f"Error code: {status_code}", response=response, body=None)
+
+
+class FlakyRequest:
+    """Raises the given errors in turn, then returns 'ok'; counts its attempts."""
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.attempts = 0
+
+    def __call__(self):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+class GPTRetryTests(SimpleTestCase):
+    """Transient API errors are retried after the Retry-After or a backoff, and 429s lower the concurrency."""
+
+    def call(self, request, controller=None, **kwargs):
+        with mock.patch.object(retry.time, 'sleep') as sleep, mock.patch.object(retry.random, 'uniform', lambda a, b: b):
+            try:
+                return retry.call_with_retries(request, controller, **kwargs), [c.args[0] for c in sleep.call_args_list]
+            except Exception as e:
+                return e, [c.args[0] for c in sleep.call_args_list]
+
+    def test_retry_after_headers_are_waited_for(self):
+        request = FlakyRequest(api_error(429, {'retry-after': '2'}), api_error(500, {'retry-after-ms': '1500'}))
+        controller = retry.ConcurrencyController(8)
+
+        result, delays = self.call(request, controller)
+        self.assertEqual(result, 'ok')
+        self.assertEqual(request.attempts, 3)
+        self.assertEqual(delays, [2.0, 1.5])
+        # Halved by the 429, then +1/limit for the 500 (not a rate limit) and the success
+        self.assertAlmostEqual(controller.limit, 4.25 + 1 / 4.25)
+        self.assertEqual(controller.in_flight, 0)
+
+    def test_exponential_backoff_up_to_the_maximum_delay(self):
+        request = FlakyRequest(*[api_error(503) for _ in range(5)])
+        error, delays = self.call(request, max_retries=3, base_delay=1.0, max_delay=3.0)
+        self.assertIsInstance(error, openai.InternalServerError)
+        self.assertEqual(request.attempts, 4)
+        self.assertEqual(delays, [1.0, 2.0, 3.0])
+
+        # A Retry-After longer than the maximum delay is capped too
+        self.assertEqual(retry.retry_delay(api_error(429, {'retry-after': '120'}), 0, max_delay=60), 60)
+        # A Retry-After date falls back to the backoff
+        self.assertEqual(retry.retry_after(api_error(429, {'retry-after': 'Wed, 21 Oct 2026 07:28:00 GMT'})), None)
+
+    def test_permanent_errors_are_not_retried(self):
+        request = FlakyRequest(api_error(400), api_error(400))
+        error, delays = self.call(request)
+        self.assertEqual((error.status_code, request.attempts, delays), (400, 1, []))
+
+    def test_concurrency_is_halved_once_per_round_of_429s(self):
+        controller = retry.ConcurrencyController(8, minimum=2)
+        first, second = controller.acquire(), controller.acquire()
+        controller.release(first, throttled=True)
+        self.assertEqual(controller.limit, 4)
+        # Already in flight when the limit was halved
+        controller.release(second, throttled=True)
+        self.assertEqual(controller.limit, 4)
+
+        for _ in range(2):
+            controller.release(controller.acquire(), throttled=True)
+        self.assertEqual(controller.limit, 2)
+
+        controller.release(controller.acquire())
+        self.assertEqual(controller.limit, 2.5)
+
+
+class GPTJobResumeTests(TestCase):
+    """An interrupted GPT job resumes from the rows saved in the checkpoint store."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(BASE_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_only_missing_rows_are_sent(self):
+        titles = ['t0', 't1', 't2', 't3', 't4', 't5', 'T1 ']
+        upload_path = os.path.join(self.directory, 'upload.xlsx')
+        pd.DataFrame({'Patent/ Publication Number': [f"US{row}" for row in range(len(titles))],
+                      'Title': titles}).to_excel(upload_path, index=False)
+        job = GptJob.objects.create(upload_path=upload_path, filename='TIPA_0001_upload.xlsx', prompt='Categorize',
+                                    model_used='gpt-test', columns=['Title'], use_cache=False, status='running')
+
+        # Rows 0 and 2 were answered before the interruption, row 3 failed
+        checkpoints = gpt_jobs.get_checkpoint_store()
+        checkpoints.save(job.checkpoint_key, 0, 'saved 0')
+        checkpoints.save(job.checkpoint_key, 2, 'saved 2')
+        checkpoints.save(job.checkpoint_key, 3, 'API request failed: timeout', ok=False)
+
+        sent = []
+
+        def reply(model, messages):
+            sent.append(messages[1]['content'])
+            choice = mock.Mock(message=mock.Mock(content=f"cat {messages[1]['content']}"), finish_reason='stop')
+            return mock.Mock(choices=[choice], usage=None)
+
+        client = mock.Mock()
+        client.chat.completions.create.side_effect = reply
+        with mock.patch.object(operations, 'load_config', return_value={}), \
+                mock.patch.object(operations.client_manager, 'get_client', return_value=client):
+            result = gpt_jobs.categorize_job(job)
+
+        # Row 6 is a duplicate of row 1 and reuses its answer
+        self.assertEqual(sorted(sent), ['Title: t1', 'Title: t3', 'Title: t4', 'Title: t5'])
+        workbook = pd.read_excel(result.file_path)
+        self.assertEqual(list(workbook['GPT Category']), [
+            'saved 0', 'cat Title: t1', 'saved 2', 'cat Title: t3', 'cat Title: t4', 'cat Title: t5', 'cat Title: t1'
+        ])
+        self.assertEqual(result.api_calls_avoided, 1)
+        self.assertEqual(checkpoints.count(job.checkpoint_key), 0)
+
+    def test_finished_job_keeps_its_owner_and_heartbeat(self):
+        job = GptJob.objects.create(upload_path='upload.xlsx', filename='upload.xlsx', prompt='Categorize',
+                                    model_used='gpt-test', columns=['Title'], status='running', owner='worker',
+                                    heartbeat_at=timezone.now())
+        beat = timezone.now() + datetime.timedelta(minutes=5)
+
+        def categorize(job):
+            # The runner beats the heartbeat while the job runs
+            GptJob.objects.filter(pk=job.pk).update(heartbeat_at=beat)
+            return None
+
+        with mock.patch.object(gpt_jobs, 'categorize_job', categorize):
+            gpt_jobs.run_gpt_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.owner, job.heartbeat_at), ('done', 'worker', beat))
+
+
+class GPTResponseCacheTests(SimpleTestCase):
+    """The response cache expires responses after their lifetime and evicts the least recently used ones."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'gpt_responses.sqlite3')
+
+    def cache(self, **options):
+        cache = GPTResponseCache(self.path, **options)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_responses_expire(self):
+        cache = self.cache(ttl_seconds=60)
+        with mock.patch.object(response_cache, 'time') as clock:
+            clock.time.return_value = 1000.0
+            cache.put('gpt-test', 'Categorize', 'Title: t0', 'cat 0')
+            clock.time.return_value = 1059.0
+            self.assertEqual(cache.get('gpt-test', 'Categorize', 'Title: t0'), 'cat 0')
+            clock.time.return_value = 1060.0
+            self.assertIsNone(cache.get('gpt-test', 'Categorize', 'Title: t0'))
+            cache.evict()
+
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'entries': 0})
+
+    def test_least_recently_used_responses_are_evicted(self):
+        cache = self.cache(max_entries=2)
+        now = time.time()
+        with mock.patch.object(response_cache, 'time') as clock:
+            for second, row in enumerate(['t0', 't1', 't2']):
+                clock.time.return_value = now - 60 + second
+                cache.put('gpt-test', 'Categorize', row, f"cat {row}")
+            # Reading t0 makes t1 the least recently used response
+            clock.time.return_value = now - 30
+            cache.get('gpt-test', 'Categorize', 't0')
+            cache.evict()
+
+        self.assertEqual(cache.get('gpt-test', 'Categorize', 't0'), 'cat t0')
+        self.assertIsNone(cache.get('gpt-test', 'Categorize', 't1'))
+        self.assertEqual(cache.get('gpt-test', 'Categorize', 't2'), 'cat t2')
+        self.assertEqual(cache.stats()['entries'], 2)
+
+    def test_one_connection_per_thread(self):
+        cache = self.cache()
+        connection = cache._connect()
+        cache.put('gpt-test', 'Categorize', 't0', 'cat t0')
+        self.assertIs(cache._connect(), connection)
+
+        cache.close()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            connection.execute("SELECT 1")
+        # A closed cache opens a new connection when it is used again
+        self.assertEqual(cache.get('gpt-test', 'Categorize', 't0'), 'cat t0')
+
+
+class PlanReuseTests(SimpleTestCase):
+    """Rows reuse past answers and the answers of earlier rows instead of being sent again."""
+
+    def test_exact_duplicates_reuse_past_answers(self):
+        examples = [('Title: Battery  cell', 'Energy')]
+        plan = plan_reuse(['title: battery cell', 'Title: Solar panel'], examples)
+        self.assertEqual(plan, [('answer', 'Energy'), None])
+
+    def test_similar_rows_reuse_past_answers_above_the_threshold(self):
+        examples = [('Title: lithium battery cell with cooling plate', 'Energy')]
+        inputs = ['Title: lithium battery cell with a cooling plate', 'Title: lithium battery for toys']
+        index = SimilarityIndex([text for text, _ in examples] + inputs)
+        index.add(examples[0][0], 'Energy')
+        scores = [index.best_match(text)[1] for text in inputs]
+        threshold = (scores[0] + scores[1]) / 2
+
+        self.assertEqual(plan_reuse(inputs, examples, threshold), [('answer', 'Energy'), None])
+        # Without a threshold only exact duplicates are reused
+        self.assertEqual(plan_reuse(inputs, examples), [None, None])
+
+    def test_followers_reuse_the_leader_of_the_job(self):
+        inputs = ['Title: gear pump', 'Title: wind turbine blade with root insert', 'Title: GEAR  pump',
+                  'Title: wind turbine blade with a root insert', 'Title: wind turbine tower']
+        self.assertEqual(plan_reuse(inputs, threshold=0.8), [None, None, ('row', 0), ('row', 1), None])
+        self.assertEqual(plan_reuse(inputs), [None, None, ('row', 0), None, None])
+
+
+class PastExamplesTests(TestCase):
+    """A job with the cache on reuses the cached answers of earlier jobs with the same prompt and model."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(BASE_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def run_job(self, titles, prompt):
+        upload_path = os.path.join(self.directory, 'upload.xlsx')
+        pd.DataFrame({'Patent/ Publication Number': [f"US{row}" for row in range(len(titles))],
+                      'Title': titles}).to_excel(upload_path, index=False)
+        job = GptJob.objects.create(upload_path=upload_path, filename='TIPA_0001_upload.xlsx', prompt=prompt,
+                                    model_used='gpt-test', columns=['Title'], use_cache=True)
+        sent = []
+
+        def reply(model, messages):
+            sent.append(messages[1]['content'])
+            message = mock.Mock(content=f"cat {messages[1]['content']}", refusal=None)
+            return mock.Mock(choices=[mock.Mock(message=message, finish_reason='stop')], usage=None)
+
+        client = mock.Mock()
+        client.chat.completions.create.side_effect = reply
+        with mock.patch.object(operations, 'load_config', return_value={}), \
+                mock.patch.object(operations.client_manager, 'get_client', return_value=client), \
+                mock.patch.object(pd, 'read_excel', wraps=pd.read_excel) as read_excel:
+            result = gpt_jobs.categorize_job(job)
+        return result, sent, read_excel
+
+    def test_cached_answers_are_examples(self):
+        self.run_job(['t0', 't1'], 'Categorize')
+        result, sent, read_excel = self.run_job(['T0', 't1 ', 't2'], 'Categorize')
+
+        self.assertEqual(sent, ['Title: t2'])
+        self.assertEqual(result.api_calls_avoided, 2)
+        self.assertEqual(list(pd.read_excel(result.file_path)['GPT Category']),
+                         ['cat Title: t0', 'cat Title: t1', 'cat Title: t2'])
+        # Only the upload is read, not the workbooks of earlier results
+        self.assertEqual(read_excel.call_count, 1)
+
+        # Answers given for another prompt are not reused
+        _, sent, _ = self.run_job(['t0'], 'Summarize')
+        self.assertEqual(sent, ['Title: t0'])
+
+
+def counter_value(counter, **labels):
+    """The value of a metrics counter for the given labels, as rendered for /metrics."""
+    label_values = ','.join(f'{name}="{value}"' for name, value in sorted(labels.items()))
+    series = f"{counter.name}{{{label_values}}} "
+    values = [float(line[len(series):]) for line in counter.render() if line.startswith(series)]
+    return values[0] if values else 0.0
+
+
+class FeeVectorCacheTests(SimpleTestCase):
+    """The fee vector cache evicts the least recently used vectors and counts its hits and misses."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'fee_vectors.sqlite3')
+
+    def cache(self, **options):
+        cache = FeeVectorCache(self.path, **options)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_least_recently_used_vectors_are_evicted(self):
+        cache = self.cache(max_entries=2)
+        now = time.time()
+        with mock.patch.object(fee_cache, 'time') as clock:
+            clock.time.return_value = now - 60
+            cache.put_many({'a': np.array([1.0]), 'b': np.array([2.0])}, 'v1')
+            # Reading a makes b the least recently used vector
+            clock.time.return_value = now - 30
+            cache.get_many(['a'])
+            clock.time.return_value = now
+            cache.put_many({'c': np.array([3.0, np.nan])}, 'v1')
+
+        vectors = cache.get_many(['a', 'b', 'c'])
+        self.assertEqual(sorted(vectors), ['a', 'c'])
+        np.testing.assert_array_equal(vectors['c'], [3.0, np.nan])
+
+    def test_invalidate_keeps_one_version(self):
+        cache = self.cache()
+        cache.put_many({'a': np.array([1.0])}, 'v1')
+        cache.put_many({'b': np.array([2.0])}, 'v2')
+
+        cache.invalidate(keep_version='v2')
+        self.assertEqual(list(cache.get_many(['a', 'b'])), ['b'])
+        cache.invalidate()
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_hits_and_misses_are_counted(self):
+        cache = self.cache()
+        hits, misses = counter_value(FEE_CACHE_LOOKUPS, result='hit'), counter_value(FEE_CACHE_LOOKUPS, result='miss')
+
+        portfolio = extract_patent_columns(gapped_portfolio())
+        fee_schedule = gapped_fee_schedule()
+        date_types = locate_country_codes_in_portfolio(portfolio, fee_schedule)
+        cold = calculate_fees_matrix_cached(portfolio, date_types, fee_schedule, AS_OF, cache)
+        warm = calculate_fees_matrix_cached(portfolio, date_types, fee_schedule, AS_OF, cache)
+
+        np.testing.assert_array_equal(cold[1], warm[1])
+        rows = len(gapped_portfolio())
+        self.assertEqual(cache.stats(), {'hits': rows, 'misses': rows, 'entries': rows})
+        self.assertEqual(counter_value(FEE_CACHE_LOOKUPS, result='hit') - hits, rows)
+        self.assertEqual(counter_value(FEE_CACHE_LOOKUPS, result='miss') - misses, rows)
+
+
+class ResultsWorkbookTests(SimpleTestCase):
+    """The streamed results workbook matches the workbook the view used to write and then format."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        results_df = calculate_grand_total(gapped_results())
+
+        self.path = os.path.join(directory.name, 'results.xlsx')
+        write_results_workbook(results_df, self.path)
+        self.workbook = load_workbook(self.path)
+
+        # The former writer: to_excel, then the overview sheet, then the formatting
+        legacy_path = os.path.join(directory.name, 'legacy.xlsx')
+        results_df.to_excel(legacy_path, index=False)
+        with redirect_stdout(io.StringIO()):
+            create_overview_sheet(legacy_path)
+        format_dates_and_currency(legacy_path)
+        self.legacy = load_workbook(legacy_path)
+
+    @staticmethod
+    def values(sheet):
+        return [[cell.value for cell in row] for row in sheet.iter_rows()]
+
+    def test_fees_per_year_sheet(self):
+        self.assertEqual(self.workbook.sheetnames, self.legacy.sheetnames)
+        sheet, legacy = self.workbook['Fees per Year'], self.legacy['Fees per Year']
+        self.assertEqual(self.values(sheet), self.values(legacy))
+        self.assertEqual((sheet.sheet_view.zoomScale, sheet.row_dimensions[1].height),
+                         (legacy.sheet_view.zoomScale, legacy.row_dimensions[1].height))
+
+        # Formats follow the column names, where the former formatting assumed fixed column letters
+        header = [cell.value for cell in sheet[1]]
+        for column, cell in zip(header, sheet[2]):
+            if column in ('File Date', 'Publication Date', 'Est. Expiration Date'):
+                self.assertEqual(cell.number_format, 'MM/DD/YYYY', column)
+            elif column.isdigit() or column == 'Total Fees':
+                self.assertEqual(cell.number_format, '$#,##0.00', column)
+            else:
+                self.assertEqual(cell.number_format, 'General', column)
+            self.assertEqual((cell.alignment.horizontal, cell.alignment.vertical), ('center', 'top'), column)
+        self.assertTrue(all(cell.font.b for cell in sheet[1]))
+        self.assertEqual(sheet.cell(sheet.max_row, sheet.max_column).number_format, '$#,##0.00')
+
+    def test_overview_sheet(self):
+        sheet = self.workbook['Overview']
+        # The country table gets the header row the former formatting already styled as one
+        self.assertEqual(self.values(sheet)[0], ['Publication Country', 'Total Fees'])
+        self.assertEqual(self.values(sheet)[1:], self.values(self.legacy['Overview']))
+
+        for row in sheet.iter_rows(min_row=2):
+            value, amount = row
+            if isinstance(amount.value, (int, float)):
+                self.assertEqual(amount.number_format, '$#,##0.00', value.value)
+        self.assertEqual([cell.value for cell in sheet[7]], ['Year', 'Maintenance Cost ($)'])
+        self.assertTrue(all(cell.font.b for cell in sheet[1] + sheet[7]))
+
+
+class ResultStoreTests(SimpleTestCase):
+    """The Parquet result store keeps the calculated fees, and the exports are made from it."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.results_df = gapped_results()
+        # A text column with a blank and a column mixing numbers and text
+        self.results_df.loc[0, 'Type'] = None
+        self.results_df['Family'] = [1, 'F-2'] + [None] * (len(self.results_df) - 2)
+        self.year_columns = [col for col in self.results_df.columns if col.isdigit()]
+
+        self.store_path = os.path.join(self.directory, 'store', 'results.parquet')
+        save_result_store(self.results_df, self.store_path)
+
+    def test_round_trip(self):
+        stored = load_result_store(self.store_path)
+        self.assertEqual(list(stored.columns), list(self.results_df.columns))
+
+        # Fee columns stay numeric, with NaN for the years without a fee
+        for column in self.year_columns + ['Total Fees']:
+            self.assertEqual(stored[column].dtype, np.float64, column)
+            np.testing.assert_array_equal(stored[column].to_numpy(), self.results_df[column].to_numpy(dtype=float))
+        self.assertTrue(stored[self.year_columns].isna().any().any())
+
+        for column in ('File Date', 'Publication Date', 'Est. Expiration Date'):
+            self.assertTrue(pd.api.types.is_datetime64_dtype(stored[column]), column)
+            pd.testing.assert_series_equal(stored[column], self.results_df[column], check_dtype=False)
+        self.assertEqual(stored['Type'].dtype, 'string')
+        self.assertTrue(pd.isna(stored.loc[0, 'Type']))
+        self.assertEqual(list(stored['Family'][:2]), ['1', 'F-2'])
+        self.assertTrue(pd.isna(stored.loc[2, 'Family']))
+
+    def test_csv_export(self):
+        output = io.StringIO()
+        export_results(self.store_path, 'csv', output)
+        exported = pd.read_csv(io.StringIO(output.getvalue()))
+
+        self.assertEqual(len(exported), len(self.results_df))
+        for column in self.year_columns + ['Total Fees']:
+            self.assertEqual(exported[column].dtype, np.float64, column)
+            np.testing.assert_array_equal(exported[column].to_numpy(), self.results_df[column].to_numpy(dtype=float))
+        self.assertEqual(exported.loc[0, 'File Date'], '2009-05-01')
+
+    def test_jsonl_export(self):
+        output = io.StringIO()
+        export_results(self.store_path, 'jsonl', output)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        self.assertEqual(len(records), len(self.results_df))
+        for record, (_, row) in zip(records, self.results_df.iterrows()):
+            for column in self.year_columns + ['Total Fees']:
+                # Blank fees are null, not zero
+                expected = None if pd.isna(row[column]) else row[column]
+                self.assertEqual(record[column], expected, column)
+        self.assertIsNone(records[0]['Type'])
+        self.assertEqual(records[0]['File Date'], '2009-05-01T00:00:00.000')
+
+    def test_xlsx_export(self):
+        path = os.path.join(self.directory, 'export.xlsx')
+        export_results(self.store_path, 'xlsx', path)
+        # The same workbook as the calculation job writes, with the mixed column stored as text
+        expected_path = os.path.join(self.directory, 'expected.xlsx')
+        expected_df = self.results_df.assign(Family=['1', 'F-2'] + [None] * (len(self.results_df) - 2))
+        write_results_workbook(calculate_grand_total(expected_df), expected_path)
+
+        for name in ('Fees per Year', 'Overview'):
+            self.assertEqual(ResultsWorkbookTests.values(load_workbook(path)[name]),
+                             ResultsWorkbookTests.values(load_workbook(expected_path)[name]), name)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export_results(self.store_path, 'xml', io.StringIO())
+
+
+class PatentBatchesTests(SimpleTestCase):
+    """The upload is read in batches of at most the batch size, keeping the sheet's row positions."""
+
+    def test_empty_rows_do_not_overflow_a_batch(self):
+        patent_df = gapped_portfolio().head(4)
+        # Empty rows between patents are kept as rows; those at the end of the sheet are dropped
+        blank = pd.DataFrame([{}] * 5, columns=patent_df.columns)
+        sheet_df = pd.concat([patent_df.iloc[:1], blank, patent_df.iloc[1:], blank], ignore_index=True)
+        output = io.BytesIO()
+        sheet_df.to_excel(output, index=False)
+
+        batches = list(iter_patent_data(io.BytesIO(output.getvalue()), batch_size=2))
+
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 2, 2, 1])
+        combined = pd.concat(batches)
+        self.assertEqual(list(combined.index), list(range(9)))
+        self.assertEqual(list(combined['Patent/ Publication Number'].dropna()), list(patent_df['Patent/ Publication Number']))
+        self.assertEqual(list(combined.index[combined['Patent/ Publication Number'].notna()]), [0, 6, 7, 8])
@@ -13,7 +13,11 @@ urlpatterns = [
     path('download-fees/', views.download_fees, name='download_fees'),  # Download Fees page
     path('upload-fees/', views.upload_fees, name='upload_fees'),  # Upload Fees page
     path('bulk_download/', views.bulk_download, name='bulk_download'),  # Bulk download
+    path('calculate/jobs/<int:job_id>/', views.calculation_job_progress, name='calculation_job_progress'),  # Calculation job progress
+    path('calculate/<int:result_id>/export/<str:export_format>/', views.export_calculation, name='export_calculation'),  # Export stored results
     path('gpt-categorize/', views.gpt_categorize_view, name='gpt-categorize'),  # GPT page
+    path('gpt-categorize/jobs/<int:job_id>/', views.gpt_job_progress, name='gpt_job_progress'),  # GPT job progress
+    path('metrics/', views.metrics_view, name='metrics'),  # Prometheus metrics, staff only
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),  # Custom logout view
 ]
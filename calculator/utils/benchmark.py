@@ -0,0 +1,216 @@
+import gc
+import os
+import json
+import time
+import datetime
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from .fees_reader import FeeSchedule
+from .excel_utils import iter_patent_data, extract_patent_columns
+from .locate import locate_country_codes_in_portfolio
+from .calculation import post_process_fees, calculate_fees_matrix, attach_fee_matrix, combine_fee_batches
+from .total import add_total_fees_per_patent, calculate_grand_total
+from .overview import write_results_workbook, create_overview_sheet, format_dates_and_currency
+
+# Valuation date of every benchmark run, so results do not drift with the calendar
+BENCHMARK_AS_OF = datetime.date(2025, 1, 1)
+
+# Countries of the synthetic portfolios and their share; 'XX' is not in the fee table
+BENCHMARK_COUNTRIES = {
+    'US': 0.35, 'JP': 0.15, 'KR': 0.1, 'ID': 0.05, 'TW': 0.08, 'RU': 0.05, 'MY': 0.04, 'SK': 0.03,
+    'DE': 0.07, 'FR': 0.04, 'XX': 0.04,
+}
+
+# Stages timed by run_fee_benchmark, in pipeline order
+FEE_STAGES = ['ingest', 'locate', 'fee_engine', 'post_processing', 'totals', 'workbook']
+LEGACY_WRITER_STAGES = ['legacy_write', 'overview', 'formatting']
+
+
+def benchmark_fee_schedule(years=20):
+    """
+    A fixed fee table covering the countries of the synthetic portfolios, independent of the uploaded FeesDollars file.
+    """
+    year = np.arange(1, years + 1, dtype=float)
+    columns = {
+        'US': ('Publication Date', 'United States', np.where(year % 4 == 0, 400 + 150 * year, 0)),
+        'JP': ('Publication Date', 'Japan', 50 + 20 * year),
+        'JPPC': ('Publication Date', 'Japan', 3 + year),
+        'KR': ('Publication Date', 'South Korea', 40 + 15 * year),
+        'KRPC': ('Publication Date', 'South Korea', 2 + year),
+        'ID': ('Publication Date', 'Indonesia', 30 + 10 * year),
+        'IDPC': ('Publication Date', 'Indonesia', 1 + 0.5 * year),
+        'TW': ('Publication Date', 'Taiwan', 60 + 12 * year),
+        'RU': ('Publication Date', 'Russia', 25 + 18 * year),
+        'MY': ('Publication Date', 'Malaysia', 35 + 9 * year),
+        'SK': ('Publication Date', 'Slovakia', 20 + 11 * year),
+        'DE': ('File Date', 'Germany', np.where(year >= 3, 70 + 45 * year, 0)),
+        'FR': ('File Date', 'France', np.where(year >= 2, 38 + 30 * year, 0)),
+    }
+    fees_df = pd.DataFrame({
+        code: [date_type, name] + list(np.round(fees, 2)) for code, (date_type, name, fees) in columns.items()
+    })
+    return FeeSchedule(fees_df, version='benchmark-v1')
+
+
+def generate_portfolio(rows, seed=0, as_of=BENCHMARK_AS_OF):
+    """
+    Generate a synthetic patent portfolio with the columns of a calculation upload.
+
+    Countries follow BENCHMARK_COUNTRIES, about 80% of the patents are grants (in mixed case),
+    filing dates span the 25 years before ``as_of``, grants follow filing by up to 6 years,
+    expiration by 15 to 23 years, and patents have 1 to 40 claims.
+    """
+    rng = np.random.default_rng(seed)
+    filing = pd.Timestamp(as_of) - pd.to_timedelta(rng.integers(0, 365 * 25, rows), 'D')
+    issued = filing + pd.to_timedelta(rng.integers(0, 365 * 6, rows), 'D')
+    expiration = filing + pd.to_timedelta(rng.integers(365 * 15, 365 * 23, rows), 'D')
+
+    return pd.DataFrame({
+        'Patent/ Publication Number': [f'BM{i:07d}' for i in range(rows)],
+        'Publication Country': rng.choice(list(BENCHMARK_COUNTRIES), rows, p=list(BENCHMARK_COUNTRIES.values())),
+        'Type': rng.choice(['Grant', 'grant', 'GRANT', 'Application', 'Utility Model'], rows, p=[0.6, 0.1, 0.1, 0.15, 0.05]),
+        'File Date': filing.normalize(),
+        'Publication Date': issued.normalize(),
+        'Est. Expiration Date': expiration.normalize(),
+        'Number of claims': rng.integers(1, 41, rows),
+    })
+
+
+class StageTimer:
+    """
+    Records the wall time and, with ``trace_memory``, the peak traced memory of every stage run under ``stage``.
+    Garbage is collected before every stage, so a collection left over from the previous one does not
+    land in its timing.
+
+    Attributes:
+    - results (dict): Stage name to {'seconds': float, 'peak_mb': float or None}.
+    """
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.results = {}
+
+    @contextmanager
+    def stage(self, name):
+        gc.collect()
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak_mb = None
+            if self.trace_memory:
+                peak_mb = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+                tracemalloc.stop()
+            self.results[name] = {'seconds': round(seconds, 4), 'peak_mb': peak_mb}
+
+
+def portfolio_workbook(rows, directory, seed=0):
+    """Path of the synthetic portfolio workbook of ``rows`` patents, generated on first use."""
+    path = os.path.join(directory, f"portfolio_{rows}_{seed}.xlsx")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        generate_portfolio(rows, seed).to_excel(path, index=False)
+    return path
+
+
+def run_fee_benchmark(rows, directory, seed=0, batch_size=50000, legacy_writer=False, trace_memory=False):
+    """
+    Run the fee calculation pipeline on a synthetic portfolio against the fixed fee table and time every stage.
+
+    Parameters:
+    - rows (int): Number of patents.
+    - directory (str): Where the portfolio and the result workbooks are written.
+    - seed (int): Seed of the portfolio generator.
+    - batch_size (int): Rows per ingest batch.
+    - legacy_writer (bool): Also time the former writer (to_excel, create_overview_sheet, format_dates_and_currency).
+    - trace_memory (bool): Record the peak memory of every stage. Tracing slows the openpyxl stages down
+      several times over, so timings of traced runs are only comparable with other traced runs.
+
+    Returns:
+    - dict: Stage name to {'seconds', 'peak_mb'}.
+    """
+    fee_schedule = benchmark_fee_schedule()
+    input_path = portfolio_workbook(rows, directory, seed)
+    timer = StageTimer(trace_memory)
+
+    with timer.stage('ingest'):
+        batches = list(iter_patent_data(input_path, batch_size))
+
+    with timer.stage('locate'):
+        located = []
+        for patent_df in batches:
+            portfolio = extract_patent_columns(patent_df)
+            located.append((patent_df, portfolio, locate_country_codes_in_portfolio(portfolio, fee_schedule)))
+
+    with timer.stage('fee_engine'):
+        results_batches = []
+        for patent_df, portfolio, date_types in located:
+            years, fee_matrix, row_date_types = calculate_fees_matrix(portfolio, date_types, fee_schedule, BENCHMARK_AS_OF)
+            results_batches.append(attach_fee_matrix(patent_df, years, fee_matrix, row_date_types))
+        results_df = combine_fee_batches(results_batches)
+
+    with timer.stage('post_processing'):
+        results_df = post_process_fees(results_df, BENCHMARK_AS_OF)
+
+    with timer.stage('totals'):
+        results_df = add_total_fees_per_patent(results_df)
+        results_df = calculate_grand_total(results_df)
+
+    with timer.stage('workbook'):
+        write_results_workbook(results_df, os.path.join(directory, f"results_{rows}.xlsx"))
+
+    if legacy_writer:
+        legacy_path = os.path.join(directory, f"results_{rows}_legacy.xlsx")
+        with timer.stage('legacy_write'):
+            results_df.to_excel(legacy_path, index=False)
+        with timer.stage('overview'):
+            create_overview_sheet(legacy_path)
+        with timer.stage('formatting'):
+            format_dates_and_currency(legacy_path)
+
+    return timer.results
+
+
+def check_regressions(results, baseline, threshold=1.25, min_seconds=0.25):
+    """
+    Compare benchmark results with a baseline.
+
+    Parameters:
+    - results (dict): Rows (as str) to stage results, as returned by run_fee_benchmark.
+    - baseline (dict): Earlier results in the same format.
+    - threshold (float): A stage regresses when it takes more than ``threshold`` times its baseline time or memory.
+    - min_seconds (float): Stages faster than this in the baseline are too noisy to compare on time.
+
+    Returns:
+    - list: A description of every regression.
+    """
+    regressions = []
+    for rows, stages in results.items():
+        for stage, result in stages.items():
+            base = baseline.get(rows, {}).get(stage)
+            if not base:
+                continue
+            # Traced and untraced timings are not comparable
+            traced_alike = (base.get('peak_mb') is None) == (result.get('peak_mb') is None)
+            if traced_alike and base['seconds'] >= min_seconds and result['seconds'] > base['seconds'] * threshold:
+                regressions.append(f"{rows} rows, {stage}: {result['seconds']:.3f}s vs {base['seconds']:.3f}s baseline")
+            if base.get('peak_mb') and result.get('peak_mb') and result['peak_mb'] > base['peak_mb'] * threshold:
+                regressions.append(f"{rows} rows, {stage}: {result['peak_mb']:.1f} MB vs {base['peak_mb']:.1f} MB baseline")
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def save_baseline(results, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
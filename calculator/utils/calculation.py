@@ -1,11 +1,16 @@
 import datetime
 import pandas as pd
 import numpy as np
+from .country_rules import COUNTRY_FEE_RULES
 
 ## todo add exception for blank dates etc, add us per year overview, and non us overview
-def check_year_inclusion(date, date_type):
+def resolve_as_of(as_of=None):
+    """Return the valuation date of a calculation, defaulting to today."""
+    return as_of if as_of is not None else datetime.date.today()
 
-    today = pd.Timestamp.today().date()
+def check_year_inclusion(date, date_type, as_of=None):
+
+    today = resolve_as_of(as_of)
     current_month_day = (today.month, today.day)
 
     if date_type == 'file date':
@@ -20,32 +25,39 @@ def check_year_inclusion(date, date_type):
 
     return include_current_year
 
-def post_process_fees(results_df):
-    today = pd.Timestamp.today().date()
-    current_year = today.year
+def post_process_fees(results_df, as_of=None):
+    """
+    Clear the current year's fee of every patent whose payment date for this year has already passed.
+    The anniversary month and day of all patents are compared against the valuation date
+    ``as_of`` (today by default) in one pass; patents with the "none" date type are left unchanged.
+    """
+    today = resolve_as_of(as_of)
+    column_name = str(today.year)
 
-    for index, row in results_df.iterrows():
-        filing_date = row['File Date']
-        issued_date = row['Publication Date']
-        date_type = row['Date Type']  # Get the date type from the DataFrame
+    if column_name not in results_df.columns:
+        return results_df
 
-        # Skip processing for "none" date type
-        if date_type == "none":
-            continue
+    date_types = results_df['Date Type'].to_numpy()
+    is_publication = date_types == 'publication date'
+    is_filing = date_types == 'file date'
 
-        # Determine the appropriate date based on the date type
-        date_to_check = issued_date if date_type == 'publication date' else filing_date
+    # Determine the appropriate date based on the date type
+    issued_dates = pd.DatetimeIndex(pd.to_datetime(results_df['Publication Date'], errors='coerce'))
+    filing_dates = pd.DatetimeIndex(pd.to_datetime(results_df['File Date'], errors='coerce'))
+    month = np.where(is_publication, issued_dates.month, filing_dates.month)
+    day = np.where(is_publication, issued_dates.day, filing_dates.day)
+
+    # Check if the current year's payment date has already passed
+    include_current_year = (month > today.month) | ((month == today.month) & (day > today.day))
+    already_paid = (is_publication | is_filing) & ~include_current_year
 
-        include_current_year = check_year_inclusion(date_to_check, date_type)
-        if not include_current_year:
-            column_name = str(current_year)
-            if column_name in results_df.columns:
-                results_df.at[index, column_name] = np.nan  # Clear the fee for the current year if it has already been paid
+    results_df.loc[already_paid, column_name] = np.nan  # Clear the fee for the current year if it has already been paid
 
     return results_df
 
-def date_check(patent, date_types, fees_info, results_df, index):
+def date_check(patent, date_types, fees_info, results_df, index, as_of=None):
     patent_number, type, filing_date, issued_date, expiration_date, country, numofclaims = patent
+    as_of = resolve_as_of(as_of)
     date_type = date_types.get(patent_number, '').lower()
 
     # Check if Type is not "Grant", and mark it as "none" if that's the case
@@ -54,22 +66,22 @@ def date_check(patent, date_types, fees_info, results_df, index):
 
     # Handle "none" date type by setting fees to 0
     if date_type == "none":
-        for year in range(datetime.date.today().year, expiration_date.year + 1):
+        for year in range(as_of.year, expiration_date.year + 1):
             results_df.at[index, str(year)] = 0
         results_df.at[index, 'Date Type'] = "none"
         return results_df
 
     # Proceed with normal fee calculation if type is "Grant"
     if date_type == 'publication date':
-        fees_by_year = calculate_fees_issued_date(patent, fees_info)
+        fees_by_year = calculate_fees_issued_date(patent, fees_info, as_of)
     elif date_type == 'file date':
-        fees_by_year = calculate_fees_filing_date(patent, fees_info)
+        fees_by_year = calculate_fees_filing_date(patent, fees_info, as_of)
     else:
         return results_df  # If no valid date type, return without changes
 
     # Update the DataFrame with the calculated fees by year
     for year, fee in fees_by_year:
-        if year >= datetime.date.today().year:
+        if year >= as_of.year:
             results_df.at[index, str(year)] = fee
 
     # Add the date type to the DataFrame
@@ -81,7 +93,7 @@ def date_check(patent, date_types, fees_info, results_df, index):
 
 ######## FOR PATENTS WHICH CALCULATE FROM FILING DATE ########################
 
-def calculate_fees_issued_date(patent_info, fees_info):
+def calculate_fees_issued_date(patent_info, fees_info, as_of=None):
 
     patent_number, priority_date, filing_date, issued_date, expiration_date, country, numofclaims = patent_info
 
@@ -96,36 +108,36 @@ def calculate_fees_issued_date(patent_info, fees_info):
     print(f"Country fees for {country}: {country_fees}")
 
     if country == 'US':
-        return calculate_fees_us(patent_info, country_fees)
+        return calculate_fees_us(patent_info, country_fees, as_of)
     elif country == 'JP':
         fees_per_claim = fees_info['JPPC'].dropna().values  # Drop NA values and get the fees per claim as a list
         print(f"Fees per claim for JP: {fees_per_claim}")
-        return calculate_fees_jp(patent_info, country_fees, fees_per_claim)
+        return calculate_fees_jp(patent_info, country_fees, fees_per_claim, as_of)
     elif country == 'KR':
         fees_per_claim = fees_info['KRPC'].dropna().values  # Drop NA values and get the fees per claim as a list
         print(f"Fees per claim for KR: {fees_per_claim}")
-        return calculate_fees_kr(patent_info, country_fees, fees_per_claim)
+        return calculate_fees_kr(patent_info, country_fees, fees_per_claim, as_of)
     elif country == 'ID':
         fees_per_claim = fees_info['IDPC'].dropna().values  # Drop NA values and get the fees per claim as a list
         print(f"Fees per claim for ID: {fees_per_claim}")
-        return calculate_fees_id(patent_info, country_fees, fees_per_claim)
+        return calculate_fees_id(patent_info, country_fees, fees_per_claim, as_of)
     elif country == 'TW':
-        return calculate_fees_tw(patent_info, country_fees)
+        return calculate_fees_tw(patent_info, country_fees, as_of)
     elif country == 'RU':
-        return calculate_fees_ru(patent_info, country_fees)
+        return calculate_fees_ru(patent_info, country_fees, as_of)
     elif country == 'MY':
-        return calculate_fees_my(patent_info, country_fees)
+        return calculate_fees_my(patent_info, country_fees, as_of)
     elif country == 'SK':
-        return calculate_fees_sk(patent_info, country_fees)
+        return calculate_fees_sk(patent_info, country_fees, as_of=as_of)
     else:
         # Log warning if the country code is unsupported
         print(f"Warning: Unsupported country code for issued date calculation: {country}. Skipping this patent.")
         return []
     
-def calculate_fees_us(patent_info, country_fees):
+def calculate_fees_us(patent_info, country_fees, as_of=None):
 
     _, _, _, issued_date, expiration_date, _, _ = patent_info
-    today = datetime.date.today()
+    today = resolve_as_of(as_of)
     start_year = max(today.year, issued_date.year)
     end_year = expiration_date.year
 
@@ -145,13 +157,13 @@ def calculate_fees_us(patent_info, country_fees):
     return fees_by_year
     
 
-def calculate_fees_filing_date(patent_info, fees_info):
+def calculate_fees_filing_date(patent_info, fees_info, as_of=None):
 
     # Unpack the patent information
     patent_number, priority_date, filing_date, issued_date, expiration_date, country, numofclaims = patent_info
     
     # Calculate the remaining years
-    today = datetime.date.today()
+    today = resolve_as_of(as_of)
     start_year = max(today.year, filing_date.year)
     remaining_years = expiration_date.year - start_year  # Include the expiration year
     
@@ -177,10 +189,10 @@ def calculate_fees_filing_date(patent_info, fees_info):
     return fees_by_year
 
 ############# FOR PATENTS CALCULATING FROM PUBLICATION/ISSUED DATE ###################
-def calculate_fees_jp(patent_info, country_fees, fees_per_claim):
+def calculate_fees_jp(patent_info, country_fees, fees_per_claim, as_of=None):
 
     _, _, _, issued_date, expiration_date, country, numofclaims = patent_info
-    today = datetime.date.today()
+    today = resolve_as_of(as_of)
     start_year = max(today.year, issued_date.year)
     end_year = expiration_date.year
 
@@ -210,10 +222,10 @@ def calculate_fees_jp(patent_info, country_fees, fees_per_claim):
 
     return fees_by_year
 
-def calculate_fees_kr(patent_info, country_fees, fees_per_claim):
+def calculate_fees_kr(patent_info, country_fees, fees_per_claim, as_of=None):
 
     _, _, _, issued_date, expiration_date, country, numofclaims = patent_info
-    today = datetime.date.today()
+    today = resolve_as_of(as_of)
     start_year = max(today.year, issued_date.year)
     end_year = expiration_date.year
 
@@ -243,10 +255,10 @@ def calculate_fees_kr(patent_info, country_fees, fees_per_claim):
 
     return fees_by_year
 
-def calculate_fees_id(patent_info, country_fees, fees_per_claim):
+def calculate_fees_id(patent_info, country_fees, fees_per_claim, as_of=None):
    
     _, priority_date, filing_date, issued_date, expiration_date, country, numofclaims = patent_info
-    today = datetime.date.today()
+    today = resolve_as_of(as_of)
     start_year = max(today.year, issued_date.year + 1)  # Start paying fees one year after grant
     end_year = expiration_date.year
 
@@ -271,10 +283,10 @@ def calculate_fees_id(patent_info, country_fees, fees_per_claim):
 
     return fees_by_year
 
-def calculate_fees_tw(patent_info, country_fees):
+def calculate_fees_tw(patent_info, country_fees, as_of=None):
  
     _, priority_date, filing_date, issued_date, expiration_date, country, numofclaims = patent_info
-    today = datetime.date.today()
+    today = resolve_as_of(as_of)
     start_year = max(today.year, issued_date.year)  # Start paying fees from the issued year
     end_year = expiration_date.year
 
@@ -295,10 +307,10 @@ def calculate_fees_tw(patent_info, country_fees):
     return fees_by_year
 
 
-def calculate_fees_ru(patent_info, country_fees):
+def calculate_fees_ru(patent_info, country_fees, as_of=None):
    
     _, priority_date, filing_date, issued_date, expiration_date, country, numofclaims = patent_info
-    today = datetime.date.today()
+    today = resolve_as_of(as_of)
     start_year = max(today.year, issued_date.year)  # Start paying fees from the issued year
     end_year = expiration_date.year
 
@@ -318,10 +330,10 @@ def calculate_fees_ru(patent_info, country_fees):
 
     return fees_by_year
 
-def calculate_fees_my(patent_info, country_fees):
+def calculate_fees_my(patent_info, country_fees, as_of=None):
    
     _, priority_date, filing_date, issued_date, expiration_date, country, numofclaims = patent_info
-    today = datetime.date.today()
+    today = resolve_as_of(as_of)
     start_year = max(today.year, issued_date.year)  # Start paying fees from the issued year
     end_year = expiration_date.year
 
@@ -342,16 +354,15 @@ def calculate_fees_my(patent_info, country_fees):
     return fees_by_year
 
 
-def calculate_fees_sk(patent_info, country_fees, fees_per_claim):
+def calculate_fees_sk(patent_info, country_fees, fees_per_claim=None, as_of=None):
  
     _, priority_date, filing_date, issued_date, expiration_date, country, numofclaims = patent_info
-    today = datetime.date.today()
+    today = resolve_as_of(as_of)
     start_year = max(today.year, issued_date.year + 1)  # Start paying fees one year after grant
     end_year = expiration_date.year
 
     # Skip initial entries and ensure fees are numeric
     country_fees = np.nan_to_num(np.array(country_fees[2:], dtype=float), nan=0.0)
-    fees_per_claim = np.nan_to_num(np.array(fees_per_claim[2:], dtype=float), nan=0.0)
 
     fees_by_year = []
 
@@ -368,4 +379,232 @@ def calculate_fees_sk(patent_info, country_fees, fees_per_claim):
             fee = 0
         fees_by_year.append((year, fee))
 
-    return fees_by_year
\ No newline at end of file
+    return fees_by_year
+
+
+############# VECTORIZED PORTFOLIO ENGINE ###################
+
+def _years(dates):
+    """Return the calendar years of a datetime64 array as floats (NaN for missing dates)."""
+    return pd.DatetimeIndex(dates).year.to_numpy(dtype=float)
+
+
+def _prefix_sum(fees, count):
+    """
+    Vectorized equivalent of ``sum(fees[:count])`` for an array of counts,
+    following Python slice semantics for counts that are negative or out of range.
+    """
+    prefix = np.concatenate(([0.0], np.cumsum(fees)))
+    count = np.where(count < 0, np.maximum(len(fees) + count, 0), np.minimum(count, len(fees)))
+    return prefix[count]
+
+
+def _fill_annual_fees(fee_matrix, year_axis, rows, anchor_year, start_year, end_year,
+                      country_fees, numofclaims=None, fees_per_claim=None, covered_years=None):
+    """
+    Write annual fees for ``start_year <= year < end_year`` into ``fee_matrix`` for the given rows.
+    The fee of a year is looked up at ``year - anchor_year``; years outside the fee table,
+    and the first ``covered_years`` table years (already paid at grant), cost 0.
+    """
+    if len(rows) == 0:
+        return
+
+    year_index = year_axis[None, :] - anchor_year[:, None]
+    in_range = (year_axis[None, :] >= start_year[:, None]) & (year_axis[None, :] < end_year[:, None])
+    in_table = (year_index >= 0) & (year_index < len(country_fees))
+    safe_index = np.clip(year_index, 0, max(len(country_fees) - 1, 0))
+
+    if len(country_fees):
+        fees = country_fees[safe_index]
+        if fees_per_claim is not None:
+            fees = fees + numofclaims[:, None] * fees_per_claim[safe_index]
+        fees = np.where(in_table, fees, 0.0)
+    else:
+        fees = np.zeros(year_index.shape)
+
+    if covered_years is not None:
+        fees = np.where(year_index < covered_years[:, None], 0.0, fees)
+
+    fee_matrix[rows] = np.where(in_range, fees, fee_matrix[rows])
+
+
+def _fill_grant_fees(fee_matrix, year_axis, rows, issued_year, years_covered,
+                     country_fees, numofclaims=None, fees_per_claim=None):
+    """Write the lump sum paid at grant (the first ``years_covered`` fees) into the grant year column."""
+    lump = _prefix_sum(country_fees, years_covered)
+    if fees_per_claim is not None:
+        lump = lump + numofclaims * _prefix_sum(fees_per_claim, years_covered)
+
+    in_axis = (issued_year >= year_axis[0]) & (issued_year <= year_axis[-1])
+    fee_matrix[rows[in_axis], issued_year[in_axis] - year_axis[0]] = lump[in_axis]
+
+
+def _fill_filing_date_fees(fee_matrix, year_axis, rows, start_year, remaining_years, country_fees, table_length):
+    """
+    Map the tail of a filing date country column onto the remaining years, mirroring the
+    ``country_fees[-remaining_years:]`` selection of ``calculate_fees_filing_date``.
+    The two metadata rows at the top of the column are not fees and are left empty.
+    """
+    fee_rows = len(country_fees)
+
+    # Python slice start of country_fees[-remaining_years:]
+    first_index = np.where(remaining_years > 0, table_length - remaining_years, -remaining_years)
+    selected = np.maximum(table_length - first_index, 0)
+
+    offset = year_axis[None, :] - start_year[:, None]
+    table_index = first_index[:, None] + offset - 2
+    in_range = (offset >= 0) & (offset < selected[:, None])
+    is_fee = in_range & (table_index >= 0)
+
+    fees = country_fees[np.clip(table_index, 0, max(fee_rows - 1, 0))] if fee_rows else np.zeros(offset.shape)
+    fee_matrix[rows] = np.where(is_fee, fees, fee_matrix[rows])
+
+
+def _apply_country_rule(fee_matrix, year_axis, rows, rule, country_fees, current_year,
+                        filing_year, issued_year, expiration_year, numofclaims):
+    """Evaluate a CountryFeeRule once for all patents of its country."""
+    fees_per_claim = country_fees.fees_per_claim if rule.per_claim else None
+    anchor_year = rule.anchor_year(filing_year, issued_year)
+    covered_years = rule.covered_years(filing_year, issued_year)
+    start_year = np.maximum(current_year, issued_year + rule.start_offset)
+
+    # Publication date countries read the column without its blank cells, as calculate_fees_issued_date does
+    _fill_annual_fees(fee_matrix, year_axis, rows, anchor_year, start_year, expiration_year,
+                      country_fees.listed_fees, numofclaims, fees_per_claim, covered_years)
+
+    if covered_years is not None:
+        _fill_grant_fees(fee_matrix, year_axis, rows, issued_year, covered_years,
+                         country_fees.listed_fees, numofclaims, fees_per_claim)
+
+
+def resolve_row_date_types(portfolio, date_types):
+    """
+    Resolve the date type of every patent the same way ``date_check`` does: "none" for patents
+    that are not granted, None where the date type is not 'publication date' or 'file date'.
+    """
+    is_grant = pd.Series(portfolio['type'], dtype=object).astype(str).str.lower().to_numpy() == 'grant'
+    row_date_types = np.array([str(date_types.get(number, '')).lower() for number in portfolio['patent_number']],
+                              dtype=object)
+    row_date_types[~is_grant] = 'none'
+    row_date_types[~np.isin(row_date_types, ['none', 'publication date', 'file date'])] = None
+    return row_date_types
+
+
+def calculate_fees_matrix(portfolio, date_types, fee_schedule, as_of=None):
+    """
+    Calculate the maintenance fees of a whole portfolio in one pass.
+
+    Patents are grouped by date type and country, and every group is evaluated with
+    array operations over all of its patents. Publication date countries are charged
+    according to their rule in ``COUNTRY_FEE_RULES``. The numbers match the per-patent
+    ``date_check`` path.
+
+    Parameters:
+    - portfolio (dict of arrays): Columnar patent data as returned by ``extract_patent_columns``.
+    - date_types (dict): Date type per patent number as returned by ``locate_country_code_in_fees``.
+    - fee_schedule (FeeSchedule): The compiled fees data as returned by ``load_fee_schedule``.
+    - as_of (date, optional): The valuation date; fees are calculated from its year on. Defaults to today.
+
+    Returns:
+    - years (ndarray): The year axis, starting with the valuation year.
+    - fee_matrix (ndarray): Fees per patent (rows) and year (columns); NaN where no fee applies.
+    - row_date_types (ndarray): The date type used for each patent, or None if it could not be resolved.
+    """
+    current_year = resolve_as_of(as_of).year
+    patent_numbers = portfolio['patent_number']
+    countries = portfolio['country']
+    count = len(patent_numbers)
+
+    filing_year = _years(portfolio['filing_date'])
+    issued_year = _years(portfolio['issued_date'])
+    expiration_year = _years(portfolio['expiration_date'])
+    numofclaims = np.asarray(portfolio['numofclaims'], dtype=float)
+
+    row_date_types = resolve_row_date_types(portfolio, date_types)
+
+    # Rows for which the dates needed by their date type are known
+    none_rows = np.flatnonzero((row_date_types == 'none') & ~np.isnan(expiration_year))
+    issued_rows = np.flatnonzero((row_date_types == 'publication date') & ~np.isnan(issued_year)
+                                 & ~np.isnan(filing_year) & ~np.isnan(expiration_year))
+    filing_rows = np.flatnonzero((row_date_types == 'file date') & ~np.isnan(filing_year)
+                                 & ~np.isnan(expiration_year))
+
+    filing_year = np.nan_to_num(filing_year).astype(int)
+    issued_year = np.nan_to_num(issued_year).astype(int)
+    expiration_year = np.nan_to_num(expiration_year).astype(int)
+
+    filing_start = np.maximum(current_year, filing_year)
+    remaining_years = expiration_year - filing_start
+
+    # Size the year axis to the last year any patent can be charged for
+    last_years = [current_year]
+    if len(none_rows):
+        last_years.append(expiration_year[none_rows].max())
+    if len(issued_rows):
+        last_years.append(np.maximum(expiration_year[issued_rows] - 1, issued_year[issued_rows]).max())
+    if len(filing_rows):
+        selected = np.where(remaining_years[filing_rows] > 0, remaining_years[filing_rows],
+                            fee_schedule.table_length + np.minimum(remaining_years[filing_rows], 0))
+        last_years.append((filing_start[filing_rows] + selected - 1).max())
+    years = np.arange(current_year, max(last_years) + 1)
+    fee_matrix = np.full((count, len(years)), np.nan)
+
+    # Patents that are not granted or have no fee data cost nothing until they expire
+    in_term = years[None, :] <= expiration_year[none_rows, None]
+    fee_matrix[none_rows] = np.where(in_term, 0.0, np.nan)
+
+    # Filing date countries
+    for country in pd.unique(countries[filing_rows]):
+        rows = filing_rows[countries[filing_rows] == country]
+        if country not in fee_schedule:
+            print(f"Warning: Fees data for country code {country} not found. Skipping {len(rows)} patents.")
+            continue
+
+        too_long = remaining_years[rows] > fee_schedule.table_length
+        if too_long.any():
+            print(f"Warning: Not enough fee data available for country code {country}. Skipping {too_long.sum()} patents.")
+            rows = rows[~too_long]
+
+        _fill_filing_date_fees(fee_matrix, years, rows, filing_start[rows], remaining_years[rows],
+                               fee_schedule[country].fees, fee_schedule.table_length)
+
+    # Publication date countries
+    for country in pd.unique(countries[issued_rows]):
+        rows = issued_rows[countries[issued_rows] == country]
+        rule = COUNTRY_FEE_RULES.get(country)
+
+        if rule is None:
+            print(f"Warning: Unsupported country code for issued date calculation: {country}. Skipping {len(rows)} patents.")
+            continue
+
+        if country not in fee_schedule or (rule.per_claim and fee_schedule[country].fees_per_claim is None):
+            print(f"Warning: Fees data for country code {country} or its per claim fees not found. Skipping {len(rows)} patents.")
+            continue
+
+        _apply_country_rule(fee_matrix, years, rows, rule, fee_schedule[country], current_year,
+                            filing_year[rows], issued_year[rows], expiration_year[rows], numofclaims[rows])
+
+    return years, fee_matrix, row_date_types
+
+
+def attach_fee_matrix(patent_df, years, fee_matrix, row_date_types):
+    """
+    Build the results DataFrame from the processed patent data and the output of ``calculate_fees_matrix``.
+    Only years with at least one calculated fee get a column, as with ``date_check``.
+    """
+    results_df = patent_df.copy()
+    results_df['Date Type'] = row_date_types
+
+    written = ~np.isnan(fee_matrix).all(axis=0)
+    fees_df = pd.DataFrame(fee_matrix[:, written], index=results_df.index,
+                           columns=[str(year) for year in years[written]])
+
+    return pd.concat([results_df, fees_df], axis=1)
+
+
+def combine_fee_batches(results_batches):
+    """Concatenate the results DataFrames of consecutive batches, with the year columns in ascending order."""
+    results_df = pd.concat(results_batches)
+    year_columns = sorted((col for col in results_df.columns if col.isdigit()), key=int)
+    other_columns = [col for col in results_df.columns if not col.isdigit()]
+    return results_df[other_columns + year_columns]
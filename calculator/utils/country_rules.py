@@ -0,0 +1,69 @@
+import hashlib
+import numpy as np
+
+# Grant window of countries where all years from filing up to grant are paid at grant
+SINCE_FILING = 'since filing'
+
+
+class CountryFeeRule:
+    """
+    How the maintenance fees of a publication date country are charged.
+
+    Annual fees are looked up in the country's fee column at ``year - anchor year`` and are
+    charged from ``grant year + start_offset`` up to (not including) the expiration year.
+    Years covered by the lump sum paid at grant cost nothing afterwards.
+
+    Attributes:
+    - anchor (str): 'publication date' or 'file date', the date the fee table is indexed from.
+    - grant_window (int, str or None): Number of table years paid as a lump sum in the grant year,
+      SINCE_FILING for the years between filing and grant, or None if nothing is paid at grant.
+    - per_claim (bool): Whether every fee is increased by the number of claims times the per claim fee.
+    - start_offset (int): Years after the grant year in which annual fees start.
+    """
+    def __init__(self, anchor='publication date', grant_window=None, per_claim=False, start_offset=0):
+        if anchor not in ('publication date', 'file date'):
+            raise ValueError(f"Invalid anchor: {anchor}. Expected 'publication date' or 'file date'.")
+        self.anchor = anchor
+        self.grant_window = grant_window
+        self.per_claim = per_claim
+        self.start_offset = start_offset
+
+    def anchor_year(self, filing_year, issued_year):
+        return issued_year if self.anchor == 'publication date' else filing_year
+
+    def covered_years(self, filing_year, issued_year):
+        """Return the number of table years paid at grant for each patent, or None."""
+        if self.grant_window is None:
+            return None
+        if self.grant_window == SINCE_FILING:
+            return issued_year - filing_year
+        return np.full(len(issued_year), self.grant_window)
+
+
+COUNTRY_FEE_RULES = {
+    # Annual fees from the year of grant onward
+    'US': CountryFeeRule(),
+    'TW': CountryFeeRule(),
+    'RU': CountryFeeRule(),
+    'MY': CountryFeeRule(),
+    # First three years paid at grant, annual fees from the 4th year onward
+    'JP': CountryFeeRule(grant_window=3, per_claim=True),
+    'KR': CountryFeeRule(grant_window=3, per_claim=True),
+    # Years since filing paid at grant, annual fees (indexed from filing) from the year after grant
+    'ID': CountryFeeRule(anchor='file date', grant_window=SINCE_FILING, per_claim=True, start_offset=1),
+    'SK': CountryFeeRule(anchor='file date', grant_window=SINCE_FILING, start_offset=1),
+}
+
+
+def register_country_rule(country_code, rule):
+    """Add or replace the fee rule of a publication date country."""
+    COUNTRY_FEE_RULES[country_code] = rule
+
+
+def rules_fingerprint():
+    """Hash of every registered rule, so results calculated under other rules can be told apart."""
+    fields = sorted(
+        (code, rule.anchor, str(rule.grant_window), rule.per_claim, rule.start_offset)
+        for code, rule in COUNTRY_FEE_RULES.items()
+    )
+    return hashlib.sha1(repr(fields).encode()).hexdigest()[:16]
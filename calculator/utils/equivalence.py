@@ -0,0 +1,268 @@
+import io
+import os
+import glob
+import datetime
+import tempfile
+import warnings
+from contextlib import redirect_stdout
+from functools import partial
+import numpy as np
+import pandas as pd
+from .fees_reader import FeeSchedule
+from .excel_utils import NECESSARY_COLUMNS, read_patent_data, extract_patent_info, iter_patent_data, extract_patent_columns
+from .locate import locate_country_code_in_fees, locate_country_codes_in_portfolio
+from .calculation import (
+    date_check, post_process_fees, resolve_as_of, calculate_fees_matrix, attach_fee_matrix, combine_fee_batches
+)
+from .sharding import calculate_fees_matrix_sharded
+from .fee_cache import FeeVectorCache, calculate_fees_matrix_cached
+from .total import add_total_fees_per_patent, calculate_grand_total
+
+# Fees are expected to match to the cent
+TOLERANCE = 0.005
+
+# Publication date countries of the edge cases; HK has no fee rule
+EDGE_CASE_COUNTRIES = ['US', 'JP', 'KR', 'ID', 'TW', 'RU', 'MY', 'SK', 'HK']
+
+
+def legacy_results(input_path, fee_schedule, as_of=None):
+    """Calculate a portfolio workbook the way calculate_fees_view did, one patent at a time with date_check."""
+    _, patent_df = read_patent_data(input_path)
+    patent_info = extract_patent_info(patent_df)
+    date_types = locate_country_code_in_fees(patent_info, fee_schedule)
+
+    results_df = patent_df.copy()
+    results_df['Date Type'] = None
+    for i, patent in enumerate(patent_info):
+        results_df = date_check(patent, date_types, fee_schedule.frame, results_df, i, as_of)
+
+    results_df = post_process_fees(results_df, as_of)
+    results_df = add_total_fees_per_patent(results_df)
+    return calculate_grand_total(results_df)
+
+
+def engine_results(input_path, fee_schedule, engine, as_of=None, batch_size=50000):
+    """
+    Calculate a portfolio workbook the way the calculation jobs do, with ``engine`` taking the
+    arguments of calculate_fees_matrix in place of the fee engine.
+    """
+    results_batches = []
+    for patent_df in iter_patent_data(input_path, batch_size):
+        portfolio = extract_patent_columns(patent_df)
+        date_types = locate_country_codes_in_portfolio(portfolio, fee_schedule)
+        years, fee_matrix, row_date_types = engine(portfolio, date_types, fee_schedule, as_of)
+        results_batches.append(attach_fee_matrix(patent_df, years, fee_matrix, row_date_types))
+
+    results_df = post_process_fees(combine_fee_batches(results_batches), as_of)
+    results_df = add_total_fees_per_patent(results_df)
+    return calculate_grand_total(results_df)
+
+
+def fee_engines(directory):
+    """
+    The engines checked against the legacy path by default, by name. The cached engine runs twice
+    on the same cache, so the second run is answered from the cached vectors.
+    """
+    cache = FeeVectorCache(os.path.join(directory, 'fee_vectors.sqlite3'))
+    cached = partial(calculate_fees_matrix_cached, cache=cache)
+    return {
+        'vectorized': calculate_fees_matrix,
+        # Tiny shards, so even the edge cases are split over several processes
+        'sharded': partial(calculate_fees_matrix_sharded, shard_size=2, max_workers=2),
+        'cached (cold)': cached,
+        'cached (warm)': cached,
+    }
+
+
+def _numeric_column(results_df, column):
+    if column not in results_df.columns:
+        return np.full(len(results_df), np.nan)
+    return pd.to_numeric(results_df[column], errors='coerce').to_numpy(dtype=float)
+
+
+def first_divergence(expected, actual, tolerance=TOLERANCE):
+    """
+    Compare two results DataFrames (patents followed by the grand total row) on their year columns,
+    'Total Fees' and the grand total.
+
+    A year column missing from one side counts as empty. Empty and zero fees are different.
+
+    Returns:
+    - str or None: A description of the first divergent patent, or None if the results match.
+    """
+    if len(expected) != len(actual):
+        return f"{len(expected) - 1} patents expected, {len(actual) - 1} calculated"
+
+    year_columns = sorted({col for col in list(expected.columns) + list(actual.columns) if str(col).isdigit()}, key=int)
+    columns = year_columns + ['Total Fees']
+    patents = len(expected) - 1
+
+    expected_values = np.column_stack([_numeric_column(expected, col)[:patents] for col in columns])
+    actual_values = np.column_stack([_numeric_column(actual, col)[:patents] for col in columns])
+    both_empty = np.isnan(expected_values) & np.isnan(actual_values)
+    differs = ~both_empty & ~(np.abs(expected_values - actual_values) <= tolerance)
+
+    divergent_rows = np.flatnonzero(differs.any(axis=1))
+    if len(divergent_rows):
+        row = divergent_rows[0]
+        divergent_columns = np.flatnonzero(differs[row])
+        details = ', '.join(f"{columns[col]}: {expected_values[row, col]} expected, {actual_values[row, col]} calculated"
+                            for col in divergent_columns[:5])
+        if len(divergent_columns) > 5:
+            details += f" and {len(divergent_columns) - 5} more columns"
+        return (f"Patent {expected['Patent/ Publication Number'].iloc[row]} (row {row + 2}, "
+                f"{expected['Publication Country'].iloc[row]}): {details}")
+
+    expected_total = _numeric_column(expected, 'Total Fees')[-1]
+    actual_total = _numeric_column(actual, 'Total Fees')[-1]
+    if not abs(expected_total - actual_total) <= tolerance:
+        return f"Grand Total: {expected_total} expected, {actual_total} calculated"
+
+    return None
+
+
+def _patent(number, country, type, filing_date, issued_date, expiration_date, claims=10):
+    return {
+        'Patent/ Publication Number': number,
+        'Publication Country': country,
+        'Type': type,
+        'File Date': pd.Timestamp(filing_date),
+        'Publication Date': pd.Timestamp(issued_date),
+        'Est. Expiration Date': pd.Timestamp(expiration_date),
+        'Number of claims': claims,
+    }
+
+
+def edge_cases(fee_schedule, as_of=None):
+    """
+    Generated portfolios covering the corner cases of the fee rules, relative to the valuation date.
+
+    Returns:
+    - list: (name, portfolio DataFrame, fee schedule) tuples.
+    """
+    as_of = resolve_as_of(as_of)
+    year = as_of.year
+    file_date_countries = [code for code, fees in fee_schedule.countries.items()
+                           if str(fees.date_type).strip().lower() == 'file date'][:3]
+    countries = EDGE_CASE_COUNTRIES + file_date_countries
+
+    # Granted this year, with the anniversary before, on and after the valuation date (Feb 29 is not in every year)
+    anniversary = (as_of.month, 28) if (as_of.month, as_of.day) == (2, 29) else (as_of.month, as_of.day)
+    granted_this_year = []
+    for country in countries:
+        for month, day in [(1, 1), (12, 31), anniversary]:
+            granted_this_year.append(_patent(f"{country}-G{year}-{month:02d}{day:02d}", country, 'Grant',
+                                             datetime.date(year - 3, month, day), datetime.date(year, month, day),
+                                             datetime.date(year + 17, month, day), claims=12))
+
+    # Already expired, expiring this year, and expiring next year
+    expired = []
+    for country in countries:
+        for years_left in [-5, -1, 0, 1]:
+            expired.append(_patent(f"{country}-E{years_left}", country, 'Grant', datetime.date(year - 20, 6, 15),
+                                   datetime.date(year - 17, 3, 1), datetime.date(year + years_left, 9, 30)))
+
+    # Not granted, or from a country without fees, in and out of term
+    none_date_types = []
+    for country in countries + ['XX']:
+        for type in ['Application', 'utility model', 'Grant' if country == 'XX' else 'Pending']:
+            for years_left in [-2, 0, 8]:
+                none_date_types.append(_patent(f"{country}-N-{type}-{years_left}", country, type,
+                                               datetime.date(year - 4, 2, 10), datetime.date(year - 1, 5, 20),
+                                               datetime.date(year + years_left, 2, 10)))
+
+    # The per claim countries, priced with a fee table that lacks the '<code>PC' columns
+    without_per_claim = FeeSchedule(
+        fee_schedule.frame.drop(columns=[col for col in fee_schedule.frame.columns if str(col).endswith('PC')]),
+        version=f"{fee_schedule.version}-without-per-claim"
+    )
+    per_claim_cases = []
+    for country in ('JP', 'KR', 'ID'):
+        patents = [patent for patent in granted_this_year + expired if patent['Publication Country'] == country]
+        patents += [_patent(f"{country}-PC{claims}", country, 'Grant', datetime.date(year - 8, 4, 4),
+                            datetime.date(year - 5, 4, 4), datetime.date(year + 12, 4, 4), claims=claims)
+                    for claims in (1, 25)]
+        per_claim_cases.append((f"missing per claim columns ({country})", pd.DataFrame(patents), without_per_claim))
+
+    # Priced with a fee table with blank cells in every country column, which publication date countries
+    # skip and file date countries read as no fee; granted over the past years to reach most of the table
+    gapped_frame = fee_schedule.frame.copy()
+    fee_rows = gapped_frame.index[2:]
+    for position, col in enumerate(gapped_frame.columns):
+        # Blanks in the per claim columns would leave them shorter than their country column
+        if not str(col).endswith('PC'):
+            gapped_frame.loc[fee_rows[position % 5::5], col] = np.nan
+    with_blank_cells = FeeSchedule(gapped_frame, version=f"{fee_schedule.version}-with-blank-cells")
+    granted_over_the_years = [
+        _patent(f"{country}-B{years_ago}", country, 'Grant', datetime.date(year - years_ago - 3, 7, 1),
+                datetime.date(year - years_ago, 7, 1), datetime.date(year - years_ago + 17, 7, 1), claims=15)
+        for country in countries for years_ago in (0, 2, 5, 9, 13)
+    ]
+
+    return [
+        ('grant year is the valuation year', pd.DataFrame(granted_this_year), fee_schedule),
+        ('expiration before the valuation date', pd.DataFrame(expired), fee_schedule),
+        ("'none' date types", pd.DataFrame(none_date_types), fee_schedule),
+        ('fee table with blank cells', pd.DataFrame(granted_over_the_years), with_blank_cells),
+    ] + per_claim_cases
+
+
+def sample_workbooks(directory):
+    """The workbooks in ``directory`` (e.g. MEDIA_ROOT) that have the columns of a calculation upload."""
+    workbooks = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.xlsx'))):
+        try:
+            header = pd.read_excel(path, nrows=0).columns
+        except Exception:
+            continue
+        if all(col in header for col in NECESSARY_COLUMNS):
+            workbooks.append(path)
+    return workbooks
+
+
+def check_equivalence(workbooks, fee_schedule, engines, as_of=None, directory=None):
+    """
+    Calculate every sample workbook and edge case with the legacy date_check path and with every engine,
+    and compare the results.
+
+    Parameters:
+    - workbooks (list): Paths of portfolio workbooks.
+    - fee_schedule (FeeSchedule): The fee table of the sample workbooks and the edge cases.
+    - engines (dict): Engines by name, taking the arguments of calculate_fees_matrix.
+    - as_of (date, optional): The valuation date. Defaults to today.
+    - directory (str, optional): Where the edge case workbooks are written. Defaults to a temporary directory.
+
+    Returns:
+    - list: (case, engine, divergence) tuples; divergence is None when the engine matches the legacy path.
+      Cases the legacy path cannot calculate are reported once, with 'legacy' as the engine.
+    """
+    as_of = resolve_as_of(as_of)
+    report = []
+
+    with tempfile.TemporaryDirectory() as temporary:
+        directory = directory or temporary
+        cases = [(os.path.basename(path), path, fee_schedule) for path in workbooks]
+        for name, portfolio, schedule in edge_cases(fee_schedule, as_of):
+            path = os.path.join(directory, f"edge case {len(cases)}.xlsx")
+            portfolio.to_excel(path, index=False)
+            cases.append((name, path, schedule))
+
+        for name, path, schedule in cases:
+            # Both paths print a line per skipped or calculated patent, and date_check writes
+            # fees into float columns one cell at a time
+            with redirect_stdout(io.StringIO()), warnings.catch_warnings():
+                warnings.simplefilter('ignore', FutureWarning)
+                try:
+                    expected = legacy_results(path, schedule, as_of)
+                except Exception as e:
+                    report.append((name, 'legacy', f"The legacy path failed: {type(e).__name__}: {e}"))
+                    continue
+
+                for engine_name, engine in engines.items():
+                    try:
+                        divergence = first_divergence(expected, engine_results(path, schedule, engine, as_of))
+                    except Exception as e:
+                        divergence = f"The engine failed: {type(e).__name__}: {e}"
+                    report.append((name, engine_name, divergence))
+
+    return report
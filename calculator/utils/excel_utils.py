@@ -1,7 +1,21 @@
 import pandas as pd
 import logging
+from openpyxl import load_workbook
 from .exceptions import MissingRequiredColumnsError
 
+# Define necessary columns
+NECESSARY_COLUMNS = [
+    'Patent/ Publication Number', 
+    'Publication Country', 
+    'Type', 
+    'File Date', 
+    'Publication Date', 
+    'Est. Expiration Date', 
+    'Number of claims'
+]
+
+DATE_COLUMNS = ['File Date', 'Publication Date', 'Est. Expiration Date']
+
 def read_patent_data(file_path):
     """
     Read the patent information from the Excel file and return two DataFrames: 
@@ -16,23 +30,12 @@ def read_patent_data(file_path):
         logging.error(f"Error reading Excel file {file_path}: {e}")
         raise
 
-    # Define necessary columns
-    necessary_columns = [
-        'Patent/ Publication Number', 
-        'Publication Country', 
-        'Type', 
-        'File Date', 
-        'Publication Date', 
-        'Est. Expiration Date', 
-        'Number of claims'
-    ]
-
     # Check if necessary columns are present
-    missing_columns = [col for col in necessary_columns if col not in full_df.columns]
+    missing_columns = [col for col in NECESSARY_COLUMNS if col not in full_df.columns]
     if missing_columns:
-        raise MissingRequiredColumnsError(missing_columns, necessary_columns)
+        raise MissingRequiredColumnsError(missing_columns, NECESSARY_COLUMNS)
 
-    processed_df = full_df[necessary_columns].copy()
+    processed_df = full_df[NECESSARY_COLUMNS].copy()
     return full_df, processed_df
 
 
@@ -65,3 +68,95 @@ def extract_patent_info(patent_df):
         patent_info.append((patent_number, type, filing_date, issued_date, expiration_date, country, numofclaims))
 
     return patent_info
+
+
+def extract_patent_columns(patent_df):
+    """
+    Extract the same information as ``extract_patent_info`` as columnar NumPy arrays,
+    for the vectorized fee engine.
+
+    Parameters:
+    - patent_df (DataFrame): The processed DataFrame with necessary columns.
+
+    Returns:
+    - portfolio (dict of arrays): Arrays keyed by patent_number, type, filing_date, issued_date,
+      expiration_date, country and numofclaims. Dates are datetime64 arrays (NaT where missing).
+    """
+    return {
+        'patent_number': patent_df['Patent/ Publication Number'].to_numpy(dtype=object),
+        'type': patent_df['Type'].to_numpy(dtype=object),
+        'filing_date': pd.to_datetime(patent_df['File Date'], errors='coerce').to_numpy(),
+        'issued_date': pd.to_datetime(patent_df['Publication Date'], errors='coerce').to_numpy(),
+        'expiration_date': pd.to_datetime(patent_df['Est. Expiration Date'], errors='coerce').to_numpy(),
+        'country': patent_df['Publication Country'].to_numpy(dtype=object),
+        'numofclaims': pd.to_numeric(patent_df['Number of claims'], errors='coerce').to_numpy(dtype=float),
+    }
+
+
+def _typed_batch(rows, start):
+    """Build a processed DataFrame batch with typed date and claim columns from raw row values."""
+    batch = pd.DataFrame(rows, columns=NECESSARY_COLUMNS, index=pd.RangeIndex(start, start + len(rows)))
+    for column in DATE_COLUMNS:
+        batch[column] = pd.to_datetime(batch[column], errors='coerce')
+    batch['Number of claims'] = pd.to_numeric(batch['Number of claims'], errors='coerce')
+    return batch
+
+
+def iter_patent_data(file_path, batch_size=50000):
+    """
+    Stream the patent information from the Excel file in batches, without loading the whole sheet.
+
+    The header row is validated against the necessary columns and only those columns are read.
+    Dates are converted to datetimes and the number of claims to numbers (NaT/NaN where invalid).
+    Empty rows at the end of the sheet are ignored.
+
+    Parameters:
+    - file_path (str or file): The Excel file, as a path or a file-like object.
+    - batch_size (int): Number of patents per batch.
+
+    Yields:
+    - patent_df (DataFrame): Batches of the processed DataFrame, indexed by row position in the sheet.
+    """
+    try:
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+    except FileNotFoundError:
+        logging.error(f"File not found: {file_path}")
+        raise
+    except Exception as e:
+        logging.error(f"Error reading Excel file {file_path}: {e}")
+        raise
+
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+
+        # Check if necessary columns are present
+        missing_columns = [col for col in NECESSARY_COLUMNS if col not in header]
+        if missing_columns:
+            raise MissingRequiredColumnsError(missing_columns, NECESSARY_COLUMNS)
+
+        positions = [header.index(col) for col in NECESSARY_COLUMNS]
+        batch = []
+        empty_rows = []
+        start = 0
+
+        for row in rows:
+            values = tuple(row[position] if position < len(row) else None for position in positions)
+            if all(value is None for value in values):
+                empty_rows.append(values)  # Only kept if more data follows
+                continue
+
+            batch.extend(empty_rows)
+            empty_rows = []
+            batch.append(values)
+
+            # Empty rows kept in the middle of the sheet can fill more than one batch
+            while len(batch) >= batch_size:
+                yield _typed_batch(batch[:batch_size], start)
+                start += batch_size
+                batch = batch[batch_size:]
+
+        if batch or start == 0:
+            yield _typed_batch(batch, start)  # A sheet without patents still yields one empty batch
+    finally:
+        workbook.close()
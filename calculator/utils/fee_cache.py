@@ -0,0 +1,178 @@
+import os
+import time
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from .calculation import calculate_fees_matrix, resolve_row_date_types, resolve_as_of
+from .country_rules import rules_fingerprint
+from .sqlite_connections import SQLiteConnections
+from .metrics import metrics
+
+# Raised whenever the engine starts calculating different numbers from the same inputs,
+# so vectors cached by an earlier engine are not served (2: publication date fees skip blank cells)
+FEE_ENGINE_REVISION = 2
+
+# SQLite limits the number of parameters of a single statement
+_QUERY_BATCH_SIZE = 500
+
+FEE_CACHE_LOOKUPS = metrics.counter('calculator_fee_cache_lookups_total', "Fee vector cache lookups, by result (hit or miss).")
+
+
+class FeeVectorCache:
+    """
+    Persistent memo of fee-by-year vectors per patent, stored in SQLite.
+
+    A vector holds the fees of one patent from the valuation year onward (NaN where no fee applies).
+    The cache keeps at most ``max_entries`` vectors and evicts the least recently used ones first.
+
+    Attributes:
+    - path (str): Path of the SQLite database file.
+    - max_entries (int): Maximum number of cached vectors.
+    - hits (int): Number of vectors found in the cache by this instance.
+    - misses (int): Number of vectors not found in the cache by this instance.
+    """
+    def __init__(self, path, max_entries=500000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._connections = SQLiteConnections(path)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS fee_vectors ("
+                "key TEXT PRIMARY KEY, version TEXT NOT NULL, fees BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS fee_vectors_last_used ON fee_vectors (last_used)")
+            connection.execute("CREATE INDEX IF NOT EXISTS fee_vectors_version ON fee_vectors (version)")
+
+    def _connect(self):
+        return self._connections.get()
+
+    def close(self):
+        """Close the database connections of every thread that used the cache."""
+        self._connections.close()
+
+    def get_many(self, keys):
+        """Return a dict of the cached fee vectors for the given keys; missing keys are left out."""
+        found = {}
+        keys = list(keys)
+        now = time.time()
+
+        with self._connect() as connection:
+            for start in range(0, len(keys), _QUERY_BATCH_SIZE):
+                batch = keys[start:start + _QUERY_BATCH_SIZE]
+                placeholders = ','.join('?' * len(batch))
+                rows = connection.execute(
+                    f"SELECT key, fees FROM fee_vectors WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, fees in rows:
+                    found[key] = np.frombuffer(fees, dtype=np.float64)
+                if rows:
+                    hit_keys = [key for key, _ in rows]
+                    connection.execute(
+                        f"UPDATE fee_vectors SET last_used = ? WHERE key IN ({','.join('?' * len(hit_keys))})",
+                        [now] + hit_keys
+                    )
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        FEE_CACHE_LOOKUPS.inc(len(found), result='hit')
+        FEE_CACHE_LOOKUPS.inc(len(keys) - len(found), result='miss')
+        return found
+
+    def put_many(self, vectors, version):
+        """Store fee vectors (dict of key to ndarray) calculated with the given fee table version."""
+        now = time.time()
+        rows = [(key, version, np.asarray(fees, dtype=np.float64).tobytes(), now) for key, fees in vectors.items()]
+
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO fee_vectors (key, version, fees, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+            # Evict the least recently used vectors beyond the size bound
+            connection.execute(
+                "DELETE FROM fee_vectors WHERE key IN ("
+                "SELECT key FROM fee_vectors ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def invalidate(self, keep_version=None):
+        """Delete all vectors that were not calculated with ``keep_version`` (all vectors if None)."""
+        with self._connect() as connection:
+            if keep_version is None:
+                connection.execute("DELETE FROM fee_vectors")
+            else:
+                connection.execute("DELETE FROM fee_vectors WHERE version != ?", (keep_version,))
+
+    def stats(self):
+        with self._connect() as connection:
+            entries = connection.execute("SELECT COUNT(*) FROM fee_vectors").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+
+def fee_vector_keys(portfolio, row_date_types, fee_schedule, as_of=None):
+    """
+    Build the cache key of every patent from everything its fee vector depends on:
+    country, date type (which covers the type), file, publication and expiration dates,
+    number of claims, fee table version, valuation year, the registered country rules and the engine revision.
+    """
+    def iso_dates(dates):
+        return pd.DatetimeIndex(dates).strftime('%Y-%m-%d').fillna('').to_numpy()
+
+    key_columns = zip(
+        pd.Series(portfolio['country'], dtype=object).astype(str),
+        pd.Series(row_date_types, dtype=object).astype(str),
+        iso_dates(portfolio['filing_date']),
+        iso_dates(portfolio['issued_date']),
+        iso_dates(portfolio['expiration_date']),
+        pd.Series(portfolio['numofclaims'], dtype=float).astype(str),
+    )
+    suffix = f"|{fee_schedule.version}|{resolve_as_of(as_of).year}|{rules_fingerprint()}|{FEE_ENGINE_REVISION}"
+
+    return np.array([hashlib.sha1(('|'.join(columns) + suffix).encode()).hexdigest() for columns in key_columns],
+                    dtype=object)
+
+
+def calculate_fees_matrix_cached(portfolio, date_types, fee_schedule, as_of=None, cache=None,
+                                 engine=calculate_fees_matrix):
+    """
+    Same as ``calculate_fees_matrix``, but fee vectors of patents seen before are read from the cache.
+    Only the patents missing from the cache (each distinct one once) go through ``engine``, which
+    takes the same arguments as ``calculate_fees_matrix``.
+    """
+    if cache is None or not fee_schedule.version:
+        return engine(portfolio, date_types, fee_schedule, as_of)
+
+    current_year = resolve_as_of(as_of).year
+    row_date_types = resolve_row_date_types(portfolio, date_types)
+    keys = fee_vector_keys(portfolio, row_date_types, fee_schedule, as_of)
+
+    unique_keys, first_rows, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    vectors = cache.get_many(unique_keys)
+
+    missing = np.flatnonzero([key not in vectors for key in unique_keys])
+    if len(missing):
+        rows = first_rows[missing]
+        subset = {name: values[rows] for name, values in portfolio.items()}
+        _, fee_matrix, _ = engine(subset, date_types, fee_schedule, as_of)
+
+        # Store every vector up to its last written year
+        written = ~np.isnan(fee_matrix)
+        lengths = np.where(written.any(axis=1), fee_matrix.shape[1] - np.argmax(written[:, ::-1], axis=1), 0)
+        calculated = {key: fee_matrix[index, :lengths[index]] for index, key in enumerate(unique_keys[missing])}
+        cache.put_many(calculated, fee_schedule.version)
+        vectors.update(calculated)
+
+    # Lay the vectors of different lengths out on a common year axis
+    ordered = [vectors[key] for key in unique_keys]
+    lengths = np.array([len(fees) for fees in ordered], dtype=int)
+    years = np.arange(current_year, current_year + max(lengths.max(initial=0), 1))
+    unique_matrix = np.full((len(unique_keys), len(years)), np.nan)
+    unique_matrix[np.arange(len(years))[None, :] < lengths[:, None]] = np.concatenate(ordered + [np.zeros(0)])
+
+    logging.info(f"Fee vector cache: {len(unique_keys) - len(missing)} hits, {len(missing)} misses")
+
+    return years, unique_matrix[inverse], row_date_types
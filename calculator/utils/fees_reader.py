@@ -1,5 +1,10 @@
-import pandas as pd
+import os
+import hashlib
 import logging
+import threading
+from io import BytesIO
+import numpy as np
+import pandas as pd
 from .exceptions import ExcelFileReadError
 
 def read_fees_data(file_path):
@@ -19,3 +24,138 @@ def read_fees_data(file_path):
         logging.warning(f"Fees data is empty in {file_path}")
 
     return fees_df
+
+
+class CountryFees:
+    """
+    The compiled fees of one FeesDollars column.
+
+    Attributes:
+    - code (str): The country code (column header).
+    - date_type (str): The date type from row 0, e.g. 'Publication Date' or 'File Date'.
+    - country_name (str): The country name from row 1.
+    - fees (ndarray): The fees per year from row 2 onward as floats, blank cells as 0, each fee in its row.
+      File date countries read the column this way.
+    - listed_fees (ndarray): The non-blank cells of the column after the first two, as floats. Publication
+      date countries read the column this way: blank cells are dropped, so the later fees move up.
+    - fees_per_claim (ndarray or None): The fees per claim from the matching '<code>PC' column, read like
+      ``listed_fees`` and padded with 0 to at least its length, if there is such a column.
+    """
+    def __init__(self, code, date_type, country_name, fees, listed_fees=None, fees_per_claim=None):
+        self.code = code
+        self.date_type = date_type
+        self.country_name = country_name
+        self.fees = fees
+        self.listed_fees = listed_fees if listed_fees is not None else fees
+        self.fees_per_claim = fees_per_claim
+
+
+class FeeSchedule:
+    """
+    The fees data parsed once into per-country float arrays.
+
+    Attributes:
+    - frame (DataFrame): The fees data as read from the Excel file.
+    - countries (dict): CountryFees per country code, in column order.
+    - table_length (int): Number of rows in the fees data, including the two metadata rows.
+    - version (str): Content hash of the Excel file the schedule was parsed from.
+    """
+    def __init__(self, fees_df, version=''):
+        self.frame = fees_df
+        self.table_length = len(fees_df)
+        self.version = version
+        self.countries = {}
+
+        for code in fees_df.columns:
+            column = fees_df[code]
+            per_claim_code = f"{code}PC"
+            listed_fees = self._listed_fees(column)
+            fees_per_claim = None
+            if per_claim_code in fees_df.columns:
+                fees_per_claim = self._listed_fees(fees_df[per_claim_code])
+                fees_per_claim = np.pad(fees_per_claim, (0, max(len(listed_fees) - len(fees_per_claim), 0)))
+
+            self.countries[code] = CountryFees(
+                code=code,
+                date_type=column.iloc[0] if len(column) > 0 else None,
+                country_name=column.iloc[1] if len(column) > 1 else None,
+                fees=self._numeric_fees(column),
+                listed_fees=listed_fees,
+                fees_per_claim=fees_per_claim,
+            )
+
+    @staticmethod
+    def _numeric_fees(column):
+        """Return the fee rows of a column (metadata rows 0 and 1 skipped) as floats."""
+        return pd.to_numeric(column.iloc[2:], errors='coerce').fillna(0).to_numpy(dtype=float)
+
+    @staticmethod
+    def _listed_fees(column):
+        """
+        Return the fees of a column as ``fees_info[code].dropna().values[2:]`` in the per-patent
+        functions: blank cells dropped first, then the first two cells skipped.
+        """
+        return pd.to_numeric(column.dropna().iloc[2:], errors='coerce').fillna(0).to_numpy(dtype=float)
+
+    def __contains__(self, code):
+        return code in self.countries
+
+    def __getitem__(self, code):
+        return self.countries[code]
+
+
+_fee_schedule_cache = {}
+_fee_schedule_lock = threading.Lock()
+
+
+def load_fee_schedule(file_path):
+    """
+    Return the FeeSchedule for the fees Excel file, parsing it only when it has changed.
+
+    Schedules are cached in-process per file. A cached schedule is reused while the file's
+    modification time and size are unchanged; otherwise the content hash decides whether
+    the file needs to be parsed again.
+    """
+    path = os.path.abspath(file_path)
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        logging.error(f"File not found: {file_path}. Returning empty fees data.")
+        return FeeSchedule(pd.DataFrame())
+
+    with _fee_schedule_lock:
+        cached = _fee_schedule_cache.get(path)
+    if cached and cached['mtime'] == stat.st_mtime_ns and cached['size'] == stat.st_size:
+        return cached['schedule']
+
+    with open(path, 'rb') as file:
+        content = file.read()
+    digest = hashlib.sha256(content).hexdigest()
+
+    if cached and cached['digest'] == digest:
+        schedule = cached['schedule']
+    else:
+        fees_df = read_fees_data(BytesIO(content))
+        if fees_df.empty:
+            return FeeSchedule(fees_df)
+        schedule = FeeSchedule(fees_df, version=digest)
+
+    with _fee_schedule_lock:
+        _fee_schedule_cache[path] = {
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'digest': digest,
+            'schedule': schedule,
+        }
+
+    return schedule
+
+
+def invalidate_fee_schedule(file_path=None):
+    """Drop the cached FeeSchedule for the given file, or all cached schedules if no file is given."""
+    with _fee_schedule_lock:
+        if file_path is None:
+            _fee_schedule_cache.clear()
+        else:
+            _fee_schedule_cache.pop(os.path.abspath(file_path), None)
@@ -0,0 +1,159 @@
+import os
+import json
+import uuid
+import shutil
+import logging
+from .client import client_manager
+from .operations import build_messages
+
+# Prefix of the custom id of every request line, followed by the row number
+ROW_ID_PREFIX = 'row-'
+
+
+def write_batch_requests(model, prompt, inputs, request_path):
+    """
+    Write one chat completion request per input to a JSONL batch request file.
+
+    Parameters:
+    - model (str): The GPT model to use.
+    - prompt (str): The prompt sent with every input.
+    - inputs (list): The input texts, in row order.
+    - request_path (str): The JSONL file to create.
+    """
+    os.makedirs(os.path.dirname(request_path), exist_ok=True)
+    with open(request_path, 'w', encoding='utf-8') as file:
+        for i, input_text in enumerate(inputs):
+            request = {
+                "custom_id": f"{ROW_ID_PREFIX}{i}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {"model": model, "messages": build_messages(prompt, input_text)},
+            }
+            file.write(json.dumps(request, ensure_ascii=False) + '\n')
+
+
+def read_batch_results(results_path, count):
+    """
+    Read a JSONL batch results file back into one response per row.
+
+    Parameters:
+    - results_path (str): The JSONL results file.
+    - count (int): The number of rows in the request file.
+
+    Returns:
+    - list: The responses in row order; rows without a successful result get an "API request failed" message.
+      Results of rows outside the request file are logged and skipped.
+    """
+    responses = ["API request failed: no result in the batch output"] * count
+
+    with open(results_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            row = int(result['custom_id'][len(ROW_ID_PREFIX):])
+            # Results of rows that are not in the request file cannot be placed
+            if not 0 <= row < count:
+                logging.warning(f"Skipping the batch result of {result['custom_id']}: the batch has {count} rows")
+                continue
+            response = result.get('response') or {}
+
+            if result.get('error') or response.get('status_code') != 200:
+                error = result.get('error') or response.get('body', {}).get('error')
+                responses[row] = f"API request failed: {error}"
+            else:
+                choice = response['body']['choices'][0]
+                content = choice['message'].get('content')
+                # Refused or filtered replies have no content
+                if content is None:
+                    reason = choice['message'].get('refusal') or choice.get('finish_reason')
+                    responses[row] = f"API request failed: no content in the reply ({reason})"
+                else:
+                    responses[row] = content.strip()
+
+    return responses
+
+
+class OpenAIBatchService:
+    """The OpenAI Batch API: request files are uploaded and completed within 24 hours."""
+    def submit(self, request_path):
+        client = client_manager.get_client()
+        with open(request_path, 'rb') as file:
+            input_file = client.files.create(file=file, purpose='batch')
+        batch = client.batches.create(
+            input_file_id=input_file.id, endpoint='/v1/chat/completions', completion_window='24h'
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        """Return 'completed', 'failed' or 'in_progress'."""
+        batch = client_manager.get_client().batches.retrieve(batch_id)
+        if batch.status == 'completed':
+            return 'completed'
+        if batch.status in ('failed', 'expired', 'cancelled'):
+            return 'failed'
+        return 'in_progress'
+
+    def download(self, batch_id, results_path):
+        client = client_manager.get_client()
+        batch = client.batches.retrieve(batch_id)
+        with open(results_path, 'wb') as file:
+            file.write(client.files.content(batch.output_file_id).read())
+
+
+class LocalBatchService:
+    """
+    Directory-based stand-in for the batch service.
+
+    Every submitted batch gets a folder under ``directory`` holding ``input.jsonl``. The batch is
+    completed once an ``output.jsonl`` in the same format as the OpenAI batch output appears there,
+    written by hand, by another tool, or by ``process``.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _batch_directory(self, batch_id):
+        return os.path.join(self.directory, batch_id)
+
+    def submit(self, request_path):
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        os.makedirs(self._batch_directory(batch_id))
+        shutil.copy(request_path, os.path.join(self._batch_directory(batch_id), 'input.jsonl'))
+        return batch_id
+
+    def status(self, batch_id):
+        if os.path.exists(os.path.join(self._batch_directory(batch_id), 'output.jsonl')):
+            return 'completed'
+        if not os.path.isdir(self._batch_directory(batch_id)):
+            return 'failed'
+        return 'in_progress'
+
+    def download(self, batch_id, results_path):
+        shutil.copy(os.path.join(self._batch_directory(batch_id), 'output.jsonl'), results_path)
+
+    def process(self, batch_id, respond):
+        """
+        Complete a batch by answering every request with ``respond(body)``, which returns the reply text.
+        """
+        batch_directory = self._batch_directory(batch_id)
+        with open(os.path.join(batch_directory, 'input.jsonl'), 'r', encoding='utf-8') as requests_file, \
+                open(os.path.join(batch_directory, 'output.jsonl.part'), 'w', encoding='utf-8') as output_file:
+            for line in requests_file:
+                request = json.loads(line)
+                result = {
+                    "custom_id": request['custom_id'],
+                    "response": {
+                        "status_code": 200,
+                        "body": {"choices": [{"message": {"role": "assistant", "content": respond(request['body'])}}]},
+                    },
+                    "error": None,
+                }
+                output_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+        # Appear complete only once fully written
+        os.replace(os.path.join(batch_directory, 'output.jsonl.part'), os.path.join(batch_directory, 'output.jsonl'))
+
+
+def get_batch_service():
+    """The batch service set up in config.json: the local stand-in if BATCH_SERVICE_DIR is set, OpenAI otherwise."""
+    directory = client_manager.get_config().get('BATCH_SERVICE_DIR')
+    return LocalBatchService(directory) if directory else OpenAIBatchService()
@@ -0,0 +1,56 @@
+import os
+import time
+from ..sqlite_connections import SQLiteConnections
+
+
+class GPTCheckpointStore:
+    """
+    Durable per-row results of GPT categorization jobs, stored in SQLite as they arrive.
+
+    Every row of a job is saved under (job key, row number) together with whether it succeeded,
+    so an interrupted job only sends the rows that have no successful result yet.
+
+    Attributes:
+    - path (str): Path of the SQLite database file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._connections = SQLiteConnections(path)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS gpt_checkpoints ("
+                "job_key TEXT NOT NULL, row INTEGER NOT NULL, response TEXT NOT NULL, ok INTEGER NOT NULL, "
+                "saved REAL NOT NULL, PRIMARY KEY (job_key, row))"
+            )
+
+    def _connect(self):
+        return self._connections.get()
+
+    def close(self):
+        """Close the database connections of every thread that used the store."""
+        self._connections.close()
+
+    def save(self, job_key, row, response, ok=True):
+        """Save the response of one row of a job, replacing an earlier one."""
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO gpt_checkpoints (job_key, row, response, ok, saved) VALUES (?, ?, ?, ?, ?)",
+                (job_key, row, response, int(ok), time.time())
+            )
+
+    def load(self, job_key, ok_only=False):
+        """Return a dict of row number to saved response for a job (only the successful rows if ``ok_only``)."""
+        query = "SELECT row, response FROM gpt_checkpoints WHERE job_key = ?" + (" AND ok = 1" if ok_only else "")
+        with self._connect() as connection:
+            return dict(connection.execute(query, (job_key,)).fetchall())
+
+    def count(self, job_key):
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM gpt_checkpoints WHERE job_key = ?", (job_key,)).fetchone()[0]
+
+    def clear(self, job_key):
+        """Delete the saved rows of a job."""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM gpt_checkpoints WHERE job_key = ?", (job_key,))
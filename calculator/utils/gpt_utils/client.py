@@ -0,0 +1,70 @@
+import os
+import json
+import threading
+import httpx
+from openai import OpenAI, DefaultHttpxClient
+
+# Default number of GPT requests in flight, overridable in config.json
+DEFAULT_MAX_CONCURRENT_REQUESTS = 8
+
+
+class OpenAIClientManager:
+    """
+    Process-wide holder of the GPT configuration and of one pooled OpenAI client.
+
+    The configuration is read once and read again only when config.json changes on disk.
+    The client keeps its HTTP connections alive between requests, with a pool sized to
+    MAX_CONCURRENT_REQUESTS; it is rebuilt when the API key or the concurrency change, and the
+    replaced client is closed.
+
+    Attributes:
+    - config_path (str): Path of config.json.
+    """
+    def __init__(self, config_path):
+        self.config_path = config_path
+        self._lock = threading.Lock()
+        self._config = None
+        self._config_mtime = None
+        self._client = None
+        self._client_settings = None
+
+    def get_config(self):
+        """Return the configuration, reloading it if config.json changed since it was read."""
+        if not os.path.exists(self.config_path):
+            raise FileNotFoundError("Configuration file not found. Please ensure that config.json is in the gpt_utils directory.")
+
+        mtime = os.stat(self.config_path).st_mtime_ns
+        with self._lock:
+            if self._config is None or mtime != self._config_mtime:
+                with open(self.config_path, 'r') as file:
+                    self._config = json.load(file)
+                self._config_mtime = mtime
+            return self._config
+
+    def get_client(self):
+        """Return the shared OpenAI client for the current configuration."""
+        config = self.get_config()
+        api_key = config.get('OPENAI_API_KEY')
+
+        if not api_key:
+            raise ValueError("API key is not set in the configuration file.")
+
+        max_connections = config.get('MAX_CONCURRENT_REQUESTS', DEFAULT_MAX_CONCURRENT_REQUESTS)
+        settings = (api_key, config.get('OPENAI_BASE_URL'), max_connections)
+
+        with self._lock:
+            if self._client is None or settings != self._client_settings:
+                # Keeps the OpenAI defaults (timeouts, redirects) with a pool sized to the concurrency
+                http_client = DefaultHttpxClient(
+                    limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+                )
+                # Requests still running on the replaced client fail with a connection error and are retried
+                # by call_with_retries on the new one, which also adapts the concurrency
+                if self._client is not None:
+                    self._client.close()
+                self._client = OpenAI(api_key=api_key, base_url=settings[1], http_client=http_client, max_retries=0)
+                self._client_settings = settings
+            return self._client
+
+
+client_manager = OpenAIClientManager(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json'))
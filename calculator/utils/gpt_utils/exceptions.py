@@ -3,3 +3,15 @@ class GPTInvalidColumnsError(Exception):
         self.missing_columns = missing_columns
         self.required_columns = required_columns
         super().__init__(f"Missing required columns: {', '.join(missing_columns)}. Required columns are: {', '.join(required_columns)}")
+
+
+class GPTBatchResponseError(Exception):
+    def __init__(self, reason):
+        self.reason = reason
+        super().__init__(f"Batched GPT response does not match the request: {reason}")
+
+
+class GPTEmptyResponseError(Exception):
+    def __init__(self, reason):
+        self.reason = reason
+        super().__init__(f"The GPT reply has no content ({reason})")
@@ -1,82 +1,396 @@
-import os
 import json
 import time
 import pandas as pd
-from openai import OpenAI
 import threading
-from .exceptions import GPTInvalidColumnsError 
+from concurrent.futures import ThreadPoolExecutor
+from .client import client_manager, DEFAULT_MAX_CONCURRENT_REQUESTS
+from .retry import (
+    ConcurrencyController, call_with_retries, DEFAULT_MAX_RETRIES, DEFAULT_RETRY_BASE_DELAY, DEFAULT_RETRY_MAX_DELAY
+)
+from .exceptions import GPTInvalidColumnsError, GPTBatchResponseError, GPTEmptyResponseError
+from ..metrics import metrics
+
+GPT_REQUEST_SECONDS = metrics.histogram('gpt_request_seconds', "Seconds per GPT chat completion, retries included.")
+GPT_REQUEST_TOKENS = metrics.histogram('gpt_request_tokens', "Tokens per GPT chat completion, as reported by the API.",
+                                       buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000))
+GPT_REQUESTS = metrics.counter('gpt_requests_total', "GPT chat completions, by model and outcome.")
+GPT_TOKENS = metrics.counter('gpt_tokens_total', "Tokens used by GPT chat completions, by model and kind.")
 
 # Učitavanje konfiguracije
 def load_config():
-   
-    # Get the directory of the current file (which is utils/gpt_utils)
-    current_directory = os.path.dirname(os.path.abspath(__file__))
+    # Read once and cached until config.json changes
+    return client_manager.get_config()
 
-    # Construct the full path to the config.json file in the same directory
-    config_path = os.path.join(current_directory, 'config.json')
+def build_messages(prompt, input_text):
+    """
+    Chat messages of a single row request: the prompt once, as a system message that is the same
+    for every row (so the provider can cache it), and the row text once, as the user message.
+    """
+    return [
+        {
+            "role": "system",
+            "content": prompt
+        },
+        {
+            "role": "user",
+            "content": input_text
+        }
+    ]
 
-    if not os.path.exists(config_path):
-        raise FileNotFoundError("Configuration file not found. Please ensure that config.json is in the gpt_utils directory.")
-    
-    with open(config_path, 'r') as file:
-        return json.load(file)
+def create_chat_completion(model, messages, controller=None, limiter=None, answers=1):
+    """
+    Send a chat completion request, retried with backoff on rate limits and transient errors
+    (MAX_RETRIES, RETRY_BASE_DELAY and RETRY_MAX_DELAY in config.json).
+    The latency and the token usage of every call are recorded in the GPT metrics.
 
-# Funkcija za pozivanje GPT modela
-def call_gpt_model(model, prompt, input_text):
-   
+    Parameters:
+    - model (str): The GPT model to use.
+    - messages (list): The chat messages.
+    - controller (ConcurrencyController): Limits the requests in flight, if given.
+    - limiter (RateLimiter): Acquired before every attempt, retries included, if given.
+    - answers (int): Number of answers expected in the reply, for the tokens reserved by the limiter.
+
+    Returns:
+    - str: The content of the reply.
+
+    Raises:
+    - GPTEmptyResponseError: If the reply has no content, e.g. a refusal or a content filter stop.
+    """
     config = load_config()
-    api_key = config.get('OPENAI_API_KEY')
+    # Shared client, reusing its connections across rows
+    client = client_manager.get_client()
 
-    if not api_key:
-        raise ValueError("API key is not set in the configuration file.")
+    tokens = estimate_tokens(*(message['content'] for message in messages)) + COMPLETION_TOKEN_ESTIMATE * answers
 
-    client = OpenAI(api_key=api_key)
+    def request():
+        if limiter is not None:
+            limiter.acquire(tokens)
+        return client.chat.completions.create(model=model, messages=messages)
 
+    start = time.perf_counter()
     try:
-        chat_completion = client.chat.completions.create(
-            model=model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"{prompt} {input_text}"
-                },
-                {
-                    "role": "user",
-                    "content": input_text
-                }
-            ]
+        chat_completion = call_with_retries(
+            request,
+            controller=controller,
+            max_retries=config.get('MAX_RETRIES', DEFAULT_MAX_RETRIES),
+            base_delay=config.get('RETRY_BASE_DELAY', DEFAULT_RETRY_BASE_DELAY),
+            max_delay=config.get('RETRY_MAX_DELAY', DEFAULT_RETRY_MAX_DELAY)
         )
-      
-        return chat_completion.choices[0].message.content.strip()
+    except Exception:
+        GPT_REQUESTS.inc(model=model, outcome='failed')
+        raise
+    finally:
+        GPT_REQUEST_SECONDS.observe(time.perf_counter() - start, model=model)
+
+    GPT_REQUESTS.inc(model=model, outcome='ok')
+    usage = getattr(chat_completion, 'usage', None)
+    if usage is not None:
+        GPT_TOKENS.inc(usage.prompt_tokens or 0, model=model, kind='prompt')
+        GPT_TOKENS.inc(usage.completion_tokens or 0, model=model, kind='completion')
+        GPT_REQUEST_TOKENS.observe(usage.total_tokens or 0, model=model)
+
+    choice = chat_completion.choices[0]
+    if choice.message.content is None:
+        raise GPTEmptyResponseError(getattr(choice.message, 'refusal', None) or choice.finish_reason)
+    return choice.message.content
+
+# Funkcija za pozivanje GPT modela
+def call_gpt_model(model, prompt, input_text, controller=None, limiter=None):
+   
+    try:
+        return create_chat_completion(model, build_messages(prompt, input_text), controller, limiter).strip()
     except Exception as e:
+        # Only reached once the retries are exhausted or the error is permanent
         return f"API request failed: {str(e)}"
 
+# Instructions appended to the prompt when several rows are sent in one request
+BATCH_INSTRUCTIONS = (
+    "You will receive a JSON array of {count} numbered items. Answer every item separately, as if it was sent alone. "
+    "Reply only with a JSON array of {count} objects, in the same order as the items, "
+    "of the form {{\"id\": <item id>, \"answer\": \"<your answer>\"}}."
+)
+
+
+def parse_batch_response(content, count):
+    """
+    Parse the reply to a batched request into one answer per item.
+
+    Parameters:
+    - content (str): The reply of the GPT model.
+    - count (int): The number of items sent.
+
+    Returns:
+    - list: The answers, in item order.
+
+    Raises:
+    - GPTBatchResponseError: If the reply is not a JSON array with exactly one answer per item, in order.
+    """
+    content = content.strip()
+    # Models sometimes wrap the array in a markdown code block
+    if content.startswith('```'):
+        content = content.strip('`')
+        content = content[content.find('['):]
+
+    try:
+        answers = json.loads(content)
+    except ValueError:
+        raise GPTBatchResponseError("The reply is not valid JSON.")
+
+    if not isinstance(answers, list) or len(answers) != count:
+        raise GPTBatchResponseError(f"Expected a JSON array of {count} answers.")
+
+    for expected_id, answer in enumerate(answers, start=1):
+        if not isinstance(answer, dict) or answer.get('id') != expected_id or not isinstance(answer.get('answer'), str):
+            raise GPTBatchResponseError(f"Answer {expected_id} is missing or out of order.")
+
+    return [answer['answer'].strip() for answer in answers]
+
+
+def build_request_messages(prompt, input_texts):
+    """
+    Chat messages of a request for one or more rows: those of build_messages for a single row,
+    otherwise the prompt with the batch instructions and the rows as a numbered JSON array.
+    """
+    if len(input_texts) == 1:
+        return build_messages(prompt, input_texts[0])
+
+    items = [{"id": number, "text": text} for number, text in enumerate(input_texts, start=1)]
+    return [
+        {
+            "role": "system",
+            "content": f"{prompt}\n\n{BATCH_INSTRUCTIONS.format(count=len(input_texts))}"
+        },
+        {
+            "role": "user",
+            "content": json.dumps(items, ensure_ascii=False)
+        }
+    ]
+
+
+def call_gpt_model_batch(model, prompt, input_texts, controller=None, limiter=None):
+    """
+    Send several input texts to the GPT model in a single request.
+
+    Parameters:
+    - model (str): The GPT model to use.
+    - prompt (str): The prompt, sent once for all inputs.
+    - input_texts (list): The input texts.
+    - controller (ConcurrencyController): Limits the requests in flight, if given.
+    - limiter (RateLimiter): Acquired before the request, if given.
+
+    Returns:
+    - list: One answer per input text, in order.
+
+    Raises:
+    - GPTBatchResponseError: If the answers do not line up with the inputs.
+    """
+    try:
+        content = create_chat_completion(
+            model, build_request_messages(prompt, input_texts), controller, limiter, answers=len(input_texts)
+        )
+    except GPTEmptyResponseError as e:
+        # Likely caused by one of the rows; splitting the batch isolates it
+        raise GPTBatchResponseError(str(e))
+
+    return parse_batch_response(content, len(input_texts))
+
+
+def categorize_batch(model, prompt, input_texts, controller=None, limiter=None, sent=None):
+    """
+    Categorize input texts with as few requests as possible. A batch whose answers do not
+    line up with its inputs is split in two and each half is sent again, down to single rows.
+    Every request, the split ones included, waits for ``limiter`` if given, and its input texts
+    are appended to the ``sent`` list if given.
+
+    Returns:
+    - list: One answer per input text, in order.
+    """
+    if sent is not None:
+        sent.append(list(input_texts))
+
+    if len(input_texts) == 1:
+        return [call_gpt_model(model, prompt, input_texts[0], controller, limiter)]
+
+    try:
+        return call_gpt_model_batch(model, prompt, input_texts, controller, limiter)
+    except GPTBatchResponseError:
+        middle = len(input_texts) // 2
+        return (categorize_batch(model, prompt, input_texts[:middle], controller, limiter, sent)
+                + categorize_batch(model, prompt, input_texts[middle:], controller, limiter, sent))
+    except Exception as e:
+        return [f"API request failed: {str(e)}"] * len(input_texts)
+
+
+def make_batches(indices, texts, batch_size, token_budget):
+    """
+    Group consecutive rows into batches of at most ``batch_size`` rows and about ``token_budget`` input tokens.
+
+    Parameters:
+    - indices (list): The row numbers to group.
+    - texts (list): The input text of every row.
+    - batch_size (int): Maximum number of rows per batch.
+    - token_budget (int): Maximum estimated input tokens per batch (a single row can exceed it).
+
+    Returns:
+    - list: Lists of row numbers.
+    """
+    batches = []
+    batch, batch_tokens = [], 0
+    for i in indices:
+        tokens = estimate_tokens(texts[i])
+        if batch and (len(batch) >= batch_size or batch_tokens + tokens > token_budget):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def is_failed_response(response):
+    """Whether a response is the error message of a failed request rather than an answer."""
+    return response.startswith(("API request failed", "Error categorizing"))
+
+# Default OpenAI rate limits, overridable in config.json
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200000
+
+# Tokens reserved for each completion when checking the tokens per minute limit
+COMPLETION_TOKEN_ESTIMATE = 50
+
+# Default maximum of input tokens packed into one batched request, overridable in config.json
+DEFAULT_BATCH_TOKEN_BUDGET = 6000
+
+
+def estimate_tokens(*texts):
+    """Rough token count of the given texts (about four characters per token)."""
+    return sum(len(text) for text in texts) // 4 + 1
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket holding up to ``capacity`` tokens, refilled at ``capacity`` per minute.
+
+    Attributes:
+    - capacity (float): Maximum number of tokens, i.e. the per minute limit.
+    - tokens (float): Tokens currently available.
+    """
+    def __init__(self, capacity):
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def take(self, amount):
+        """Take ``amount`` tokens if available; otherwise return the seconds to wait before retrying."""
+        amount = min(amount, self.capacity)
+        with self.lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0
+            return (amount - self.tokens) * 60 / self.capacity
+
+
+class RateLimiter:
+    """Blocks callers until both the requests per minute and the tokens per minute limits allow a request."""
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens):
+        # One caller at a time, so requests are released in the order they asked
+        with self.lock:
+            while True:
+                wait = self.requests.take(1)
+                if not wait:
+                    break
+                time.sleep(wait)
+            while True:
+                wait = self.tokens.take(tokens)
+                if not wait:
+                    break
+                time.sleep(wait)
+
+
 # Funkcija za procesiranje više zahteva sa rate limiting-om
-def handle_multiple_requests(model, prompt, inputs, rate_limit_per_second=1):
-   
+def handle_multiple_requests(model, prompt, inputs, max_workers=None, requests_per_minute=None, tokens_per_minute=None,
+                             cache=None, batch_size=1, completed=None, on_result=None, sent=None):
+    """
+    Send the inputs to the GPT model from a bounded pool of workers, within the OpenAI rate limits.
+
+    Parameters:
+    - model (str): The GPT model to use.
+    - prompt (str): The prompt sent with every input.
+    - inputs (list): The input texts.
+    - max_workers (int): Maximum number of requests in flight (MAX_CONCURRENT_REQUESTS in config.json by default).
+      Fewer are sent while the API answers with rate limit errors, see ConcurrencyController.
+    - requests_per_minute (int): Requests per minute limit (REQUESTS_PER_MINUTE in config.json by default).
+    - tokens_per_minute (int): Tokens per minute limit (TOKENS_PER_MINUTE in config.json by default).
+    - cache (GPTResponseCache): Cache of earlier responses; inputs found in it are not sent again.
+    - batch_size (int): Number of inputs sent per request, bounded by BATCH_TOKEN_BUDGET in config.json.
+      With 1, every input is sent on its own.
+    - completed (dict): Responses already known, by input number; these inputs are not sent again.
+    - on_result (callable): Called with the input number and response of every other input as soon as it is known.
+    - sent (list): If given, the input texts of every request sent are appended to it, one list per request.
+
+    Returns:
+    - list: The responses, in the same order as the inputs.
+    """
     config = load_config()
-    api_key = config.get('OPENAI_API_KEY')
+    max_workers = max_workers or config.get('MAX_CONCURRENT_REQUESTS', DEFAULT_MAX_CONCURRENT_REQUESTS)
+    limiter = RateLimiter(
+        requests_per_minute or config.get('REQUESTS_PER_MINUTE', DEFAULT_REQUESTS_PER_MINUTE),
+        tokens_per_minute or config.get('TOKENS_PER_MINUTE', DEFAULT_TOKENS_PER_MINUTE)
+    )
 
-    if not api_key:
-        raise ValueError("API key is not set in the configuration file.")
+    controller = ConcurrencyController(max_workers)
 
-    threads = []
     responses = [None] * len(inputs)
+    for i, response in (completed or {}).items():
+        responses[i] = response
 
-    # Funkcija za kontrolisanje slanja zahteva prema API rate limitu
-    def request_with_delay(i):
-        time.sleep(i / rate_limit_per_second)  # Osigurava da se zahtevi ne šalju prebrzo
-        call_gpt_model(model, prompt, inputs[i])
+    pending = [i for i in range(len(inputs)) if responses[i] is None]
+    if cache is not None:
+        for i in pending:
+            responses[i] = cache.get(model, prompt, inputs[i])
+            if responses[i] is not None and on_result:
+                on_result(i, responses[i])
+        pending = [i for i in pending if responses[i] is None]
 
-    # Kreiraj niti za svaki API poziv i postavi odgodu između njih
-    for i in range(len(inputs)):
-        thread = threading.Thread(target=request_with_delay, args=(i,))
-        threads.append(thread)
-        thread.start()
+    if batch_size > 1:
+        batches = make_batches(pending, inputs, batch_size, config.get('BATCH_TOKEN_BUDGET', DEFAULT_BATCH_TOKEN_BUDGET))
+    else:
+        batches = [[i] for i in pending]
 
-    # Čekaj da sve niti završe
-    for thread in threads:
-        thread.join()
+    def request(batch):
+        texts = [inputs[i] for i in batch]
+        try:
+            # The limiter is acquired before every request sent for the batch, retries and splits included
+            answers = categorize_batch(model, prompt, texts, controller, limiter, sent)
+        except Exception as e:
+            answers = [f"Error categorizing: {str(e)}"] * len(batch)
+
+        for i, answer in zip(batch, answers):
+            responses[i] = answer
+            # Failed requests are not cached, so they are retried next time
+            if cache is not None and not is_failed_response(answer):
+                cache.put(model, prompt, inputs[i], answer)
+            if on_result:
+                on_result(i, answer)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(request, batches))
+
+    if cache is not None:
+        cache.evict()
 
     return responses
 
@@ -102,9 +416,18 @@ def clean_and_extract_relevant_columns(excel_file_path, selected_columns):
         raise Exception(f"Failed to process the Excel file: {str(e)}")
 
 
-def categorize_claims(df, model, prompt, selected_columns):
-    gpt_results = []
+def build_inputs(df, selected_columns):
+    """
+    Build the GPT input text of every row, in row order. The prompt is not part of it; it is sent
+    once per request by build_messages.
 
+    Parameters:
+    - df (DataFrame): The rows to categorize.
+    - selected_columns (list): The columns sent to the GPT model.
+
+    Returns:
+    - list: The input texts.
+    """
     # Define labels for each column
     column_labels = {
         'First Claim': 'First Claim: ',
@@ -112,19 +435,18 @@ def categorize_claims(df, model, prompt, selected_columns):
         'Abstract': 'Abstract: ',
     }
 
+    # Construct input_text with labels
+    inputs = []
     for i, row in df.iterrows():
-        try:
-            # Construct input_text with labels
-            input_text = ' '.join([f"{column_labels[col]}{str(row[col])}" for col in selected_columns if col in row])
-            
-            # Combine the prompt and input_text
-            full_input = f"{prompt}\n\n{input_text}"
-
-            # Pass to GPT model
-            gpt_category = call_gpt_model(model, prompt, full_input)
-            gpt_results.append(gpt_category)
-        except Exception as e:
-            gpt_results.append(f"Error categorizing: {str(e)}")
+        inputs.append(' '.join([f"{column_labels[col]}{str(row[col])}" for col in selected_columns if col in row]))
+    return inputs
+
+
+def categorize_claims(df, model, prompt, selected_columns, cache=None, batch_size=1):
+    inputs = build_inputs(df, selected_columns)
+
+    # Pass to GPT model, many rows at a time
+    gpt_results = handle_multiple_requests(model, prompt, inputs, cache=cache, batch_size=batch_size)
 
     df['GPT Category'] = gpt_results
     return df
@@ -0,0 +1,116 @@
+import os
+import time
+import hashlib
+import threading
+from ..sqlite_connections import SQLiteConnections
+
+
+class GPTResponseCache:
+    """
+    Persistent cache of GPT responses, stored in SQLite.
+
+    Responses are keyed on a hash of the model, prompt and input text. They expire
+    ``ttl_seconds`` after they were stored, and the cache keeps at most ``max_entries``
+    responses, evicting the least recently used ones first.
+
+    Attributes:
+    - path (str): Path of the SQLite database file.
+    - ttl_seconds (float): Lifetime of a cached response.
+    - max_entries (int): Maximum number of cached responses.
+    - hits (int): Number of responses found in the cache by this instance.
+    - misses (int): Number of responses not found in the cache by this instance.
+    """
+    def __init__(self, path, ttl_seconds=30 * 24 * 3600, max_entries=200000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connections = SQLiteConnections(path)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS gpt_responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL, "
+                "scope TEXT, input_text TEXT)"
+            )
+            # Caches created before the past examples were kept have no scope and input text
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(gpt_responses)")}
+            for column in ('scope', 'input_text'):
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE gpt_responses ADD COLUMN {column} TEXT")
+            connection.execute("CREATE INDEX IF NOT EXISTS gpt_responses_last_used ON gpt_responses (last_used)")
+            connection.execute("CREATE INDEX IF NOT EXISTS gpt_responses_scope ON gpt_responses (scope, last_used)")
+
+    def _connect(self):
+        return self._connections.get()
+
+    def close(self):
+        """Close the database connections of every thread that used the cache."""
+        self._connections.close()
+
+    @staticmethod
+    def make_key(model, prompt, input_text):
+        return hashlib.sha256('\x1f'.join([model, prompt, input_text]).encode()).hexdigest()
+
+    @staticmethod
+    def make_scope(model, prompt):
+        return hashlib.sha256('\x1f'.join([model, prompt]).encode()).hexdigest()
+
+    def get(self, model, prompt, input_text):
+        """Return the cached response, or None if it is missing or expired."""
+        key = self.make_key(model, prompt, input_text)
+        now = time.time()
+
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT response FROM gpt_responses WHERE key = ? AND created > ?", (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row:
+                connection.execute("UPDATE gpt_responses SET last_used = ? WHERE key = ?", (now, key))
+
+        with self._lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row[0] if row else None
+
+    def put(self, model, prompt, input_text, response):
+        """Store a response for the model, prompt and input text."""
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO gpt_responses (key, response, created, last_used, scope, input_text) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.make_key(model, prompt, input_text), response, now, now, self.make_scope(model, prompt), input_text)
+            )
+
+    def examples(self, model, prompt, limit):
+        """
+        Return (input text, response) pairs of the ``limit`` most recently used responses that have
+        not expired for the model and prompt, without counting them as hits.
+        """
+        with self._connect() as connection:
+            return connection.execute(
+                "SELECT input_text, response FROM gpt_responses "
+                "WHERE scope = ? AND input_text IS NOT NULL AND created > ? ORDER BY last_used DESC LIMIT ?",
+                (self.make_scope(model, prompt), time.time() - self.ttl_seconds, limit)
+            ).fetchall()
+
+    def evict(self):
+        """Delete the expired responses and the least recently used ones beyond the size bound."""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM gpt_responses WHERE created <= ?", (time.time() - self.ttl_seconds,))
+            connection.execute(
+                "DELETE FROM gpt_responses WHERE key IN ("
+                "SELECT key FROM gpt_responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        with self._connect() as connection:
+            entries = connection.execute("SELECT COUNT(*) FROM gpt_responses").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
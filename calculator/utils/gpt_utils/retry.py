@@ -0,0 +1,121 @@
+import time
+import random
+import threading
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+# Default retry settings, overridable in config.json
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_RETRY_BASE_DELAY = 1.0
+DEFAULT_RETRY_MAX_DELAY = 60.0
+
+
+class ConcurrencyController:
+    """
+    AIMD limit on the number of GPT requests in flight.
+
+    Every successful request raises the limit by 1 / limit (about +1 per round of requests),
+    up to ``maximum``. A rate limited (429) request halves it, down to ``minimum``; 429s of
+    requests that were already in flight when the limit was halved do not halve it again.
+
+    Attributes:
+    - limit (float): The current limit.
+    - in_flight (int): The number of requests currently running.
+    """
+    def __init__(self, maximum, minimum=1, initial=None):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(initial or maximum)
+        self.in_flight = 0
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free slot and return the time it was taken."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started, throttled=False):
+        """Free the slot taken at ``started`` and adjust the limit to how the request went."""
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                if started >= self._decreased_at:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._decreased_at = time.monotonic()
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+def is_retryable(error):
+    """Rate limits (429), server errors (5xx), timeouts and connection errors are worth retrying."""
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def retry_after(error):
+    """Seconds the API asked to wait before retrying, from the Retry-After headers, or None."""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+
+    try:
+        if response.headers.get('retry-after-ms'):
+            return float(response.headers['retry-after-ms']) / 1000
+        if response.headers.get('retry-after'):
+            return float(response.headers['retry-after'])
+    except ValueError:
+        # Retry-After given as a date is not worth parsing; fall back to backoff
+        return None
+    return None
+
+
+def retry_delay(error, attempt, base_delay=DEFAULT_RETRY_BASE_DELAY, max_delay=DEFAULT_RETRY_MAX_DELAY):
+    """
+    Seconds to wait before retry number ``attempt`` (from 0): the Retry-After of the error if given,
+    otherwise exponential backoff with jitter.
+    """
+    requested = retry_after(error)
+    if requested is not None:
+        return min(requested, max_delay)
+    return random.uniform(0.5, 1) * min(max_delay, base_delay * 2 ** attempt)
+
+
+def call_with_retries(request, controller=None, max_retries=DEFAULT_MAX_RETRIES,
+                      base_delay=DEFAULT_RETRY_BASE_DELAY, max_delay=DEFAULT_RETRY_MAX_DELAY):
+    """
+    Call ``request()`` and retry it on transient API errors.
+
+    Parameters:
+    - request (callable): Sends the API request and returns its result.
+    - controller (ConcurrencyController): Limits the requests in flight and learns from their outcome.
+    - max_retries (int): Maximum number of retries before the last error is raised.
+    - base_delay (float): Backoff before the first retry, doubled for every further retry.
+    - max_delay (float): Maximum wait between retries.
+
+    Returns:
+    - The result of ``request()``.
+    """
+    attempt = 0
+    while True:
+        started = controller.acquire() if controller else None
+        try:
+            result = request()
+        except Exception as e:
+            if controller:
+                controller.release(started, throttled=getattr(e, 'status_code', None) == 429)
+            if not is_retryable(e) or attempt >= max_retries:
+                raise
+            time.sleep(retry_delay(e, attempt, base_delay, max_delay))
+            attempt += 1
+            continue
+
+        if controller:
+            controller.release(started)
+        return result
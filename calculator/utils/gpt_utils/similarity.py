@@ -0,0 +1,103 @@
+import re
+import math
+from collections import Counter, defaultdict
+
+# Rarest terms of a text used to look up candidate matches in the inverted index
+CANDIDATE_TERMS = 8
+
+
+def tokenize(text):
+    return re.findall(r'[a-z0-9]+', text.lower())
+
+
+def normalize(text):
+    """Text compared for exact duplicates: lower case, single spaces."""
+    return ' '.join(text.lower().split())
+
+
+class SimilarityIndex:
+    """
+    CPU-only TF-IDF index with an inverted index of terms, for finding near-duplicate texts.
+
+    The term weights are computed once, from every text the index will see, passed as ``corpus``.
+
+    Attributes:
+    - idf (dict): Inverse document frequency of every term of the corpus.
+    """
+    def __init__(self, corpus):
+        document_frequency = Counter(term for text in corpus for term in set(tokenize(text)))
+        self.idf = {term: math.log((1 + len(corpus)) / (1 + count)) + 1 for term, count in document_frequency.items()}
+        self.vectors = []
+        self.values = []
+        self.postings = defaultdict(list)
+
+    def vector(self, text):
+        weights = {term: count * self.idf.get(term, 1.0) for term, count in Counter(tokenize(text)).items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        return {term: weight / norm for term, weight in weights.items()}
+
+    def add(self, text, value):
+        """Index a text with the value returned when it is matched."""
+        vector = self.vector(text)
+        document = len(self.vectors)
+        self.vectors.append(vector)
+        self.values.append(value)
+        for term in vector:
+            self.postings[term].append(document)
+
+    def best_match(self, text):
+        """Return (value, cosine similarity) of the most similar indexed text, or (None, 0)."""
+        vector = self.vector(text)
+        rare_terms = sorted(vector, key=lambda term: -self.idf.get(term, 1.0))[:CANDIDATE_TERMS]
+        candidates = {document for term in rare_terms for document in self.postings.get(term, ())}
+
+        best_value, best_score = None, 0.0
+        for document in candidates:
+            indexed = self.vectors[document]
+            score = sum(weight * indexed.get(term, 0.0) for term, weight in vector.items())
+            if score > best_score:
+                best_value, best_score = self.values[document], score
+        return best_value, best_score
+
+
+def plan_reuse(inputs, examples=(), threshold=None):
+    """
+    Decide which rows need a GPT request and which can reuse another answer.
+
+    Exact duplicates (ignoring case and spacing) always reuse the answer. With a ``threshold``,
+    rows whose TF-IDF cosine similarity to a past example or to an earlier row of the job is at
+    least the threshold reuse it too.
+
+    Parameters:
+    - inputs (list): The input texts of the job, in row order.
+    - examples (list): (input text, answer) pairs of earlier results for the same prompt and model.
+    - threshold (float): Minimum similarity for reusing an answer, or None for exact duplicates only.
+
+    Returns:
+    - list: For every row, None if it has to be sent, ('answer', text) to reuse a past answer,
+      or ('row', number) to reuse the answer of an earlier row of the job.
+    """
+    exact = {normalize(text): ('answer', answer) for text, answer in examples}
+    index = SimilarityIndex([text for text, _ in examples] + list(inputs)) if threshold else None
+    if index:
+        for text, answer in examples:
+            index.add(text, ('answer', answer))
+
+    plan = []
+    for row, text in enumerate(inputs):
+        key = normalize(text)
+        source = exact.get(key)
+
+        if source is None and index:
+            match, score = index.best_match(text)
+            if score >= threshold:
+                source = match
+
+        plan.append(source)
+        if source is None:
+            # First row of its kind: later duplicates reuse its answer
+            exact[key] = ('row', row)
+            if index:
+                index.add(text, ('row', row))
+
+    return plan
@@ -0,0 +1,138 @@
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Answers handed out by the stand-in, picked deterministically from the request text
+DEFAULT_CATEGORIES = ['Category A', 'Category B', 'Category C', 'Category D']
+
+
+def deterministic_answer(text, categories=DEFAULT_CATEGORIES):
+    """The same text always gets the same category."""
+    return categories[int(hashlib.sha1(text.encode()).hexdigest(), 16) % len(categories)]
+
+
+class StandInGPTServer:
+    """
+    Local stand-in for the OpenAI chat completions API, for load tests that cost nothing.
+
+    Every request waits a latency drawn from a log-normal distribution around ``median_latency``
+    seconds, is refused with a 429 (and a Retry-After) with probability ``rate_limit_probability``,
+    and is otherwise answered with a category picked deterministically from the user message.
+    Batched requests (a JSON array of numbered items) get one answer per item.
+    Point the GPT tools at it with OPENAI_BASE_URL = ``base_url`` in config.json.
+
+    Attributes:
+    - base_url (str): The URL to use as OPENAI_BASE_URL.
+    - latencies (list): Seconds spent on every answered request.
+    - rate_limited (int): Number of requests refused with a 429.
+    """
+    def __init__(self, host='127.0.0.1', port=0, median_latency=0.3, latency_sigma=0.5,
+                 rate_limit_probability=0.0, retry_after=1.0, categories=DEFAULT_CATEGORIES, seed=None):
+        self.median_latency = median_latency
+        self.latency_sigma = latency_sigma
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.categories = categories
+        self.latencies = []
+        self.rate_limited = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self._send(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                status, payload, headers = server.respond(body)
+                self._send(status, payload, headers)
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                # Keep benchmark output readable
+                pass
+
+        return Handler
+
+    def respond(self, body):
+        """Return (status, payload, headers) for a chat completion request body."""
+        with self._lock:
+            rate_limited = self._random.random() < self.rate_limit_probability
+            latency = self.median_latency * self._random.lognormvariate(0, self.latency_sigma)
+
+        if rate_limited:
+            with self._lock:
+                self.rate_limited += 1
+            error = {'error': {'message': 'Rate limit reached (stand-in).', 'type': 'requests', 'code': 'rate_limit_exceeded'}}
+            return 429, error, {'Retry-After': str(self.retry_after)}
+
+        time.sleep(latency)
+        messages = body.get('messages', [])
+        user_text = messages[-1]['content'] if messages else ''
+
+        try:
+            items = json.loads(user_text)
+            batched = isinstance(items, list) and all(isinstance(item, dict) and 'id' in item for item in items)
+        except ValueError:
+            batched = False
+
+        if batched:
+            content = json.dumps([{'id': item['id'], 'answer': deterministic_answer(str(item.get('text', '')), self.categories)}
+                                  for item in items])
+        else:
+            content = deterministic_answer(user_text, self.categories)
+
+        prompt_tokens = sum(len(message.get('content', '')) for message in messages) // 4 + 1
+        with self._lock:
+            self.latencies.append(latency)
+
+        return 200, {
+            'id': f"chatcmpl-standin-{int(time.time() * 1000)}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'stand-in'),
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(content) // 4 + 1,
+                      'total_tokens': prompt_tokens + len(content) // 4 + 1},
+        }, {}
+
+    def start(self):
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            self.latencies = []
+            self.rate_limited = 0
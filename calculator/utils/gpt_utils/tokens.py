@@ -0,0 +1,62 @@
+import functools
+
+try:
+    import tiktoken
+except ImportError:  # Token counts fall back to an estimate of four characters per token
+    tiktoken = None
+
+# Tokens the chat format adds around every message
+TOKENS_PER_MESSAGE = 4
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+
+
+def count_tokens(text, model='gpt-4o-mini'):
+    """Number of tokens of a text for the given model (estimated if tiktoken is not installed)."""
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    return len(_encoding(model).encode(text))
+
+
+def count_message_tokens(messages, model='gpt-4o-mini'):
+    """Number of prompt tokens of a list of chat messages."""
+    return sum(count_tokens(message['content'], model) + TOKENS_PER_MESSAGE for message in messages) + 3
+
+
+def legacy_messages(prompt, input_text):
+    """
+    The messages rows used to be sent as: the prompt in front of the row text, all of it in
+    the system message after the prompt again, and once more as the user message.
+    """
+    full_input = f"{prompt}\n\n{input_text}"
+    return [
+        {"role": "system", "content": f"{prompt} {full_input}"},
+        {"role": "user", "content": full_input},
+    ]
+
+
+def token_savings(prompt, requests, build_request_messages, model='gpt-4o-mini'):
+    """
+    Compare the prompt tokens of the requests a job sent with the former layout, where every row
+    was sent on its own, with the prompt in front of the row text.
+
+    Parameters:
+    - prompt (str): The prompt.
+    - requests (list): The row texts of every request sent, one list per request.
+    - build_request_messages (callable): Builds the messages of a request from the prompt and its row texts.
+    - model (str): The GPT model the tokens are counted for.
+
+    Returns:
+    - dict: 'tokens' sent with the current layout, 'legacy_tokens' with the former one, and 'saved'.
+    """
+    tokens = sum(count_message_tokens(build_request_messages(prompt, texts), model) for texts in requests)
+    # A row resent in the halves of a split batch was only ever sent once in the former layout
+    rows = dict.fromkeys(text for texts in requests for text in texts)
+    legacy_tokens = sum(count_message_tokens(legacy_messages(prompt, text), model) for text in rows)
+    return {'tokens': tokens, 'legacy_tokens': legacy_tokens, 'saved': legacy_tokens - tokens}
@@ -2,17 +2,16 @@ import os
 from django.conf import settings
 from .exceptions import InvalidCountryCodeError
 
-def locate_country_code_in_fees(patent_info, fees_info):
+def locate_country_code_in_fees(patent_info, fee_schedule):
     date_types = {}
 
     # Extract country codes from patent_info
     for patent in patent_info:
         patent_number, _, _, _, _, country, _ = patent
 
-        # Check if country codes exist as columns in fees_info
-        if country in fees_info.columns:
-            fees_for_country = fees_info[country]
-            date_type = fees_for_country.iloc[0]  # Get the date type from index 0
+        # Check if country codes exist in the fee schedule
+        if country in fee_schedule:
+            date_type = fee_schedule[country].date_type  # The date type from index 0
             date_types[patent_number] = date_type
         else:
             # If the country code is missing, assign 'non existent' as the date type
@@ -20,3 +19,24 @@ def locate_country_code_in_fees(patent_info, fees_info):
             print(f"Warning: Country code {country} not found in fees data for patent {patent_number}. Setting date type to 'non existent'.")
 
     return date_types
+
+
+def locate_country_codes_in_portfolio(portfolio, fee_schedule):
+    """
+    Same as ``locate_country_code_in_fees`` for a columnar portfolio (see ``extract_patent_columns``),
+    warning once per missing country code instead of once per patent.
+    """
+    date_types = {}
+    missing_countries = set()
+
+    for patent_number, country in zip(portfolio['patent_number'], portfolio['country']):
+        if country in fee_schedule:
+            date_types[patent_number] = fee_schedule[country].date_type
+        else:
+            date_types[patent_number] = "none"
+            missing_countries.add(country)
+
+    for country in missing_countries:
+        print(f"Warning: Country code {country} not found in fees data. Setting date type to 'non existent'.")
+
+    return date_types
@@ -0,0 +1,144 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Upper bounds of the histogram buckets, in seconds
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Counter:
+    """A Prometheus counter, with one value per combination of label values."""
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """A Prometheus histogram with cumulative buckets, with one series per combination of label values."""
+    def __init__(self, name, help, buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][position] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series['buckets']):
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The metrics of this process, rendered in the Prometheus text format by the /metrics view.
+
+    Every process (e.g. every web server worker) keeps its own metrics.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args)
+            return self._metrics[name]
+
+    def counter(self, name, help):
+        return self._get_or_create(Counter, name, help)
+
+    def histogram(self, name, help, buckets=SECONDS_BUCKETS):
+        return self._get_or_create(Histogram, name, help, buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram('calculator_stage_seconds', "Seconds spent in each stage of a calculation or GPT job.")
+
+
+class StageTimings:
+    """
+    Wall time of every stage of one pipeline run.
+
+    A stage entered several times (e.g. once per batch) adds up. ``finish`` records the stages and
+    the total in the calculator_stage_seconds histogram and returns them, for the result model.
+
+    Attributes:
+    - pipeline (str): The pipeline label of the histogram, e.g. 'calculation' or 'gpt'.
+    - seconds (dict): Seconds per stage, in the order the stages were first entered.
+    """
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.seconds = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+    def timed(self, name, iterable):
+        """Iterate over ``iterable``, counting the time spent producing its items as stage ``name``."""
+        iterator = iter(iterable)
+        exhausted = object()
+        while True:
+            with self.stage(name):
+                item = next(iterator, exhausted)
+            if item is exhausted:
+                return
+            yield item
+
+    def finish(self):
+        """Record the stages and the total time since the timings were created, and return them rounded."""
+        self.seconds['total'] = time.perf_counter() - self._start
+        for name, seconds in self.seconds.items():
+            STAGE_SECONDS.observe(seconds, pipeline=self.pipeline, stage=name)
+        return {name: round(seconds, 4) for name, seconds in self.seconds.items()}
@@ -1,5 +1,6 @@
 import pandas as pd
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import NamedStyle, Alignment, Font,  PatternFill
 from openpyxl.utils import get_column_letter
 from openpyxl.chart import BarChart, Reference
@@ -148,4 +149,108 @@ def format_dates_and_currency(output_file_path):
                     cell.alignment = alignment_style
 
     # Save the workbook with the formatting changes
-    workbook.save(output_file_path)
\ No newline at end of file
+    workbook.save(output_file_path)
+
+
+DATE_FORMAT = 'MM/DD/YYYY'
+CURRENCY_FORMAT = '$#,##0.00'
+
+
+def _styled_cell(sheet, number_format=None, font=None, fill=None, alignment=None):
+    """Create a write-only cell whose style is shared by all cells written with ``_write_row``."""
+    cell = WriteOnlyCell(sheet)
+    if number_format:
+        cell.number_format = number_format
+    if font:
+        cell.font = font
+    if fill:
+        cell.fill = fill
+    if alignment:
+        cell.alignment = alignment
+    return cell
+
+
+def _write_row(sheet, values, styles):
+    """Append a row of values, each cell taking the style of the matching template cell."""
+    row = []
+    for value, style in zip(values, styles):
+        cell = WriteOnlyCell(sheet, None if value is None or value != value else value)  # NaN/NaT as empty cells
+        cell._style = style._style
+        row.append(cell)
+    sheet.append(row)
+
+
+def write_results_workbook(results_df, output_file_path):
+    """
+    Write the results to a new Excel file in a single streaming pass, with the 'Fees per Year'
+    sheet formatted as ``format_dates_and_currency`` does and an 'Overview' sheet with the total
+    fee per country and per year, both computed from the in-memory DataFrame.
+
+    Parameters:
+    - results_df (DataFrame): The calculated fees, including 'Total Fees' and the grand total row.
+    - output_file_path (str): The file path of the Excel file to create.
+    """
+    workbook = Workbook(write_only=True)
+
+    # Define date, currency, and alignment styles
+    alignment_style = Alignment(horizontal='center', vertical='top')
+    header_alignment_style = Alignment(horizontal='center', vertical='center')
+    bold_font = Font(bold=True)
+
+    ######## Fees per Year ########
+    main_sheet = workbook.create_sheet(title='Fees per Year')
+    main_sheet.sheet_view.zoomScale = 80
+    main_sheet.row_dimensions[1].height = 30
+
+    columns = [str(col) for col in results_df.columns]
+    year_columns = [col for col in columns if col.isdigit()]
+    for col in range(1, len(columns) + 1):
+        main_sheet.column_dimensions[get_column_letter(col)].width = 15
+
+    header_style = _styled_cell(main_sheet, font=bold_font, alignment=header_alignment_style)
+    column_styles = []
+    for col in columns:
+        if col in ('File Date', 'Publication Date', 'Est. Expiration Date'):
+            column_styles.append(_styled_cell(main_sheet, DATE_FORMAT, alignment=alignment_style))
+        elif col in year_columns or col == 'Total Fees':
+            column_styles.append(_styled_cell(main_sheet, CURRENCY_FORMAT, alignment=alignment_style))
+        else:
+            column_styles.append(_styled_cell(main_sheet, alignment=alignment_style))
+
+    _write_row(main_sheet, columns, [header_style] * len(columns))
+    for values in results_df.itertuples(index=False, name=None):
+        _write_row(main_sheet, values, column_styles)
+
+    ######## Overview ########
+    overview_sheet = workbook.create_sheet(title='Overview')
+    overview_sheet.row_dimensions[1].height = 30
+    for col in range(1, 3):
+        overview_sheet.column_dimensions[get_column_letter(col)].width = 20
+
+    # Total fee per each country (the grand total row has no country)
+    countries = results_df['Publication Country']
+    patents_df = results_df[countries.notna() & (countries != '')]
+    total_fees_per_country = patents_df.groupby('Publication Country')['Total Fees'].sum().reset_index()
+
+    # Total fee per each year
+    total_fees_per_year = [(year, pd.to_numeric(results_df[year], errors='coerce').sum()) for year in year_columns]
+
+    text_style = _styled_cell(overview_sheet, alignment=alignment_style)
+    currency_style = _styled_cell(overview_sheet, CURRENCY_FORMAT, alignment=alignment_style)
+    table_header_style = _styled_cell(overview_sheet, CURRENCY_FORMAT, font=Font(bold=True, color="000000"),
+                                      fill=PatternFill("solid", fgColor="FFFFFF"), alignment=alignment_style)
+    header_style = _styled_cell(overview_sheet, font=bold_font, alignment=header_alignment_style)
+
+    _write_row(overview_sheet, ['Publication Country', 'Total Fees'], [header_style, header_style])
+    for row in total_fees_per_country.itertuples(index=False, name=None):
+        _write_row(overview_sheet, row, [text_style, currency_style])
+
+    # Add some space before the next table
+    overview_sheet.append([])
+
+    # Write the second table header
+    _write_row(overview_sheet, ['Year', 'Maintenance Cost ($)'], [table_header_style, table_header_style])
+    for row in total_fees_per_year:
+        _write_row(overview_sheet, row, [text_style, currency_style])
+
+    workbook.save(output_file_path)
@@ -1,21 +1,22 @@
 import datetime
 
-def calculate_remaining_life(patent_info):
+def calculate_remaining_life(patent_info, as_of=None):
     """
     Calculate the exact remaining life of patents based on their expiration dates,
-    considering partial years in the current year 2024.
+    considering partial years in the year of the valuation date.
 
     Parameters:
     - patent_info (list of tuples): List of tuples containing extracted patent information.
       Each tuple should contain (patent_number, priority_date, filing_date, issued_date, 
       expiration_date, country, numofclaims, execution_year).
+    - as_of (date, optional): The valuation date the remaining life is measured from. Defaults to today.
 
     Returns:
     - updated_patent_info (list of tuples): Updated list of tuples with remaining life appended.
       Each tuple will now contain (patent_number, priority_date, filing_date, issued_date, 
       expiration_date, country, numofclaims, execution_year, remaining_life).
     """
-    today = datetime.date.today()  # Get the current date
+    today = as_of if as_of is not None else datetime.date.today()  # Get the valuation date
 
     updated_patent_info = []
 
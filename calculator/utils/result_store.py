@@ -0,0 +1,59 @@
+import os
+import pandas as pd
+from .total import calculate_grand_total
+from .overview import write_results_workbook
+
+# Formats the stored results can be exported to, with their content type
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def save_result_store(results_df, store_path):
+    """
+    Persist the calculated fees as Parquet, one row per patent (without the grand total row).
+
+    Parameters:
+    - results_df (DataFrame): The calculated fees per patent, including 'Total Fees'.
+    - store_path (str): The file path of the Parquet file to create.
+    """
+    os.makedirs(os.path.dirname(store_path), exist_ok=True)
+
+    store_df = results_df.copy()
+    for column in store_df.columns:
+        # Text columns may mix numbers and strings, which Parquet cannot store in one column
+        if store_df[column].dtype == object:
+            store_df[column] = store_df[column].astype('string')
+
+    store_df.to_parquet(store_path, engine='pyarrow', index=False)
+
+
+def load_result_store(store_path):
+    """Read the calculated fees per patent back from the Parquet result store."""
+    return pd.read_parquet(store_path, engine='pyarrow')
+
+
+def export_results(store_path, export_format, output):
+    """
+    Export stored results to CSV, JSON lines or a formatted Excel workbook.
+
+    Parameters:
+    - store_path (str): The Parquet file written by ``save_result_store``.
+    - export_format (str): One of EXPORT_FORMATS.
+    - output (str or file): Where to write the export.
+    """
+    results_df = load_result_store(store_path)
+
+    if export_format == 'csv':
+        results_df.to_csv(output, index=False)
+    elif export_format == 'jsonl':
+        results_df.to_json(output, orient='records', lines=True, date_format='iso')
+    elif export_format == 'xlsx':
+        for column in results_df.columns:
+            if results_df[column].dtype == 'string':
+                results_df[column] = results_df[column].astype(object).where(results_df[column].notna(), None)
+        write_results_workbook(calculate_grand_total(results_df), output)
+    else:
+        raise ValueError(f"Invalid export format: {export_format}. Expected one of {', '.join(EXPORT_FORMATS)}.")
@@ -0,0 +1,107 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .calculation import calculate_fees_matrix, resolve_row_date_types, resolve_as_of
+
+
+# Fee schedule shipped to every worker process once, by the pool initializer
+_worker_state = {}
+
+
+def _init_worker(fee_schedule):
+    _worker_state['fee_schedule'] = fee_schedule
+
+
+def _calculate_shard(shard, date_types, as_of):
+    _, fee_matrix, _ = calculate_fees_matrix(shard, date_types, _worker_state['fee_schedule'], as_of)
+    return fee_matrix
+
+
+class ShardPool:
+    """
+    A pool of worker processes kept for the lifetime of the web server process, so the batches
+    of every calculation job are sharded on the same workers instead of starting a pool per batch.
+    The processes are started on the first sharded batch and receive the fee schedule once, when they start;
+    the pool is started again when a batch comes with another version of the fee table.
+
+    Attributes:
+    - max_workers (int): Number of worker processes.
+    - shards_calculated (int): Number of shards calculated by the pool so far.
+    """
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.shards_calculated = 0
+        self._executor = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def map(self, shards, date_types, fee_schedule, as_of):
+        with self._lock:
+            if self._executor is None or self._version != fee_schedule.version:
+                if self._executor is not None:
+                    # Shards already submitted by other jobs still finish on the replaced workers
+                    self._executor.shutdown(wait=False)
+                # Workers are spawned rather than forked: the pool is started from a job thread, and a fork
+                # would copy whatever locks the other threads of the web server hold at that moment
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_init_worker, initargs=(fee_schedule,))
+                self._version = fee_schedule.version
+            executor = self._executor
+        # Every task carries its shard and the date types of the shard's patents only
+        futures = [
+            executor.submit(_calculate_shard, shard,
+                            {number: date_types[number] for number in shard['patent_number'] if number in date_types},
+                            as_of)
+            for shard in shards
+        ]
+        shard_matrices = [future.result() for future in futures]
+        with self._lock:
+            self.shards_calculated += len(shard_matrices)
+        return shard_matrices
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+                self._version = None
+
+
+def calculate_fees_matrix_sharded(portfolio, date_types, fee_schedule, as_of=None, shard_size=50000, max_workers=None,
+                                  pool=None):
+    """
+    Same as ``calculate_fees_matrix``, but the portfolio is split into shards of ``shard_size`` patents
+    that are calculated in parallel, either on ``pool`` (a ShardPool) or on a pool of ``max_workers``
+    processes (one per CPU by default) started for this call only.
+
+    Every patent is calculated independently of the others, so the merged result is identical
+    to the serial one. Portfolios that fit in a single shard are calculated in-process.
+    """
+    as_of = resolve_as_of(as_of)
+    count = len(portfolio['patent_number'])
+
+    if count <= shard_size or (pool is None and max_workers == 1):
+        return calculate_fees_matrix(portfolio, date_types, fee_schedule, as_of)
+
+    bounds = range(0, count, shard_size)
+    shards = [{name: values[start:start + shard_size] for name, values in portfolio.items()} for start in bounds]
+
+    if pool is not None:
+        shard_matrices = pool.map(shards, date_types, fee_schedule, as_of)
+    else:
+        pool = ShardPool(min(max_workers or os.cpu_count() or 1, len(bounds)))
+        try:
+            shard_matrices = pool.map(shards, date_types, fee_schedule, as_of)
+        finally:
+            pool.shutdown()
+
+    # Every shard's year axis starts at the valuation year; merge them onto the longest one
+    years = np.arange(as_of.year, as_of.year + max(matrix.shape[1] for matrix in shard_matrices))
+    fee_matrix = np.full((count, len(years)), np.nan)
+    for start, matrix in zip(bounds, shard_matrices):
+        fee_matrix[start:start + len(matrix), :matrix.shape[1]] = matrix
+
+    return years, fee_matrix, resolve_row_date_types(portfolio, date_types)
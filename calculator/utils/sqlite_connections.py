@@ -0,0 +1,36 @@
+import sqlite3
+import threading
+
+
+class SQLiteConnections:
+    """
+    One SQLite connection per thread to a database file, opened with the pragmas of the caches
+    on first use and reused by every later query of that thread until ``close``.
+
+    ``with connections.get() as connection`` wraps the statements in a transaction; it does not close the connection.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._opened = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Only used by the thread that opened it; ``close`` may run in another thread
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._lock:
+                self._opened.append(connection)
+        return connection
+
+    def close(self):
+        """Close the connections of every thread."""
+        with self._lock:
+            opened, self._opened = self._opened, []
+        for connection in opened:
+            connection.close()
+        self._local = threading.local()
@@ -1,28 +1,28 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.http import HttpResponse, FileResponse, Http404, JsonResponse, HttpResponseRedirect
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from .forms import UploadFileForm, GPTForm
-from .models import CalculationResult
-from .models import GptResult
+from .models import CalculationResult, CalculationJob
+from .jobs import submit_calculation_job
+from .models import GptResult, GptBatchJob, GptJob
+from .gpt_jobs import submit_gpt_job, get_checkpoint_store
+from .gpt_batches import submit_gpt_batch_job
 from io import BytesIO
+from contextlib import closing
 import os
-import datetime
 import zipfile
 import pandas as pd
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from .utils.calculation import (
-    calculate_fees_issued_date, calculate_fees_filing_date, post_process_fees, date_check
-)
-from .utils.excel_utils import read_patent_data, extract_patent_info
-from .utils.fees_reader import read_fees_data
-from .utils.total import add_total_fees_per_patent, calculate_grand_total
-from .utils.overview import create_overview_sheet, format_dates_and_currency
-from .utils.locate import locate_country_code_in_fees
-from .utils.gpt_utils.operations import clean_and_extract_relevant_columns, categorize_claims, save_to_excel, handle_multiple_requests
-from .utils.exceptions import MissingRequiredColumnsError, InvalidCountryCodeError, ExcelFileReadError, ExcelError
+from .utils.fees_reader import load_fee_schedule, invalidate_fee_schedule
+from .utils.fee_cache import FeeVectorCache
+from .utils.result_store import export_results, EXPORT_FORMATS
+from .utils.metrics import metrics, StageTimings
+from .utils.gpt_utils.operations import clean_and_extract_relevant_columns
 from .utils.gpt_utils.exceptions import GPTInvalidColumnsError
 
 ###################################### LOGIN/LOGOUT #########################################
@@ -54,7 +54,7 @@ def home(request):
 
 def view_fees_dollars(request):
     file_path = os.path.join(settings.BASE_DIR, 'calculator', 'data', 'feesdollars.xlsx')
-    df = pd.read_excel(file_path)
+    df = load_fee_schedule(file_path).frame
     data = df.to_html(classes='table table-striped', index=False)
     return render(request, 'calculator/feesdollars.html', {'data': data})
 
@@ -69,6 +69,12 @@ def upload_fees(request):
         with open(file_path, 'wb+') as destination:
             for chunk in file.chunks():
                 destination.write(chunk)
+        invalidate_fee_schedule(file_path)
+
+        # Drop the cached fee vectors calculated with the replaced fees
+        fee_cache_path = os.path.join(settings.BASE_DIR, 'database', 'cache', 'fee_vectors.sqlite3')
+        with closing(FeeVectorCache(fee_cache_path)) as fee_cache:
+            fee_cache.invalidate(keep_version=load_fee_schedule(file_path).version)
         return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
@@ -76,87 +82,48 @@ def upload_fees(request):
 @login_required  # Ensure the user is logged in before accessing this view
 def locate_country_codes_and_names(request):
     fees_info_path = os.path.join(settings.BASE_DIR, 'calculator', 'data', 'feesdollars.xlsx')
-    fees_info = read_fees_data(fees_info_path)
+    fee_schedule = load_fee_schedule(fees_info_path)
     country_codes_and_names = {}
 
-    for column in fees_info.columns:
-        if fees_info.iloc[0][column].strip() in ['Publication Date', 'File Date']:  # Filter out other types if necessary
-            country_codes_and_names[column] = {
-                'country': fees_info.iloc[1][column],
-                'type': fees_info.iloc[0][column]
+    for code, country_fees in fee_schedule.countries.items():
+        if str(country_fees.date_type).strip() in ['Publication Date', 'File Date']:  # Filter out other types if necessary
+            country_codes_and_names[code] = {
+                'country': country_fees.country_name,
+                'type': country_fees.date_type
             }
 
     return country_codes_and_names
 
+@login_required
 def calculate_fees_view(request):
     if request.method == "POST":
         form = UploadFileForm(request.POST, request.FILES)
         if form.is_valid():
             file = form.cleaned_data["file"]
-
-            try:
-                # Read patent data and validate columns
-                full_patent_df, patent_df = read_patent_data(file)
-
-                # Extract patent info
-                patent_info = extract_patent_info(patent_df)
-                
-                # Read fees data
-                fees_info_path = os.path.join(settings.BASE_DIR, 'calculator', 'data', 'feesdollars.xlsx')
-                fees_info = read_fees_data(fees_info_path)
-
-                # Locate country code in fees and calculate fees
-                date_types = locate_country_code_in_fees(patent_info, fees_info)
-
-                # Proceed with the rest of the logic...
-                project_id = CalculationResult.objects.count() + 1
-                original_filename = os.path.splitext(file.name)[0]
-                new_filename = f"TIPA_MC_{project_id}_{original_filename}.xlsx"
-                
-                fs = FileSystemStorage()
-                filename = fs.save(new_filename, file)
-                file_path = fs.path(filename)
-
-                full_patent_df, patent_df = read_patent_data(file_path)
-                patent_info = extract_patent_info(patent_df)
-
-                output_filename = f"TIPA_MC_{project_id}_{original_filename}.xlsx"
-                output_file_path = os.path.join(settings.BASE_DIR, 'database', 'calculator', output_filename)
-
-                results_df = patent_df.copy()
-                results_df['Date Type'] = None
-
-                for i, patent in enumerate(patent_info):
-                    results_df = date_check(patent, date_types, fees_info, results_df, i)
-
-                results_df = post_process_fees(results_df)
-                results_df = add_total_fees_per_patent(results_df)
-                results_df = calculate_grand_total(results_df)
-                #results_df = results_df.drop(columns=['Date Type'])
-
-                results_df.to_excel(output_file_path, index=False)
-                create_overview_sheet(output_file_path)
-                format_dates_and_currency(output_file_path)
-
-                CalculationResult.objects.create(
-                    filename=output_filename,
-                    file_path=output_file_path,
-                    created_by=request.user
-                )
-
-                return redirect('calculate_fees')
-
-            # Handle missing columns specifically
-            except MissingRequiredColumnsError as e:
-                return render_error_page(request, form, str(e))
-
-            # Handle any Excel-related errors
-            except ExcelError as e:
-                return render_error_page(request, form, str(e))
-
-            # Handle any other unexpected errors
-            except Exception as e:
-                return render_error_page(request, form, "An unexpected error occurred. Please try again later.")
+            as_of = form.cleaned_data["as_of"]
+            output_format = form.cleaned_data["output_format"] or 'xlsx'
+
+            project_id = CalculationResult.objects.count() + CalculationJob.objects.filter(status__in=['queued', 'running']).count() + 1
+            original_filename = os.path.splitext(file.name)[0]
+            new_filename = f"TIPA_MC_{project_id}_{original_filename}.xlsx"
+
+            # Stream the upload to disk; the job parses it from there
+            fs = FileSystemStorage()
+            filename = fs.save(new_filename, file)
+
+            job = CalculationJob.objects.create(
+                upload_path=fs.path(filename),
+                original_filename=original_filename,
+                project_id=project_id,
+                as_of=as_of,
+                output_format=output_format,
+                created_by=request.user
+            )
+            submit_calculation_job(job)
+
+            if request.headers.get('Accept') == 'application/json':
+                return JsonResponse({'job_id': job.id, 'progress_url': reverse('calculation_job_progress', args=[job.id])}, status=202)
+            return redirect(f"{reverse('calculate_fees')}?job={job.id}")
 
     else:
         form = UploadFileForm()
@@ -168,11 +135,27 @@ def calculate_fees_view(request):
     context = {
         'form': form,
         'result_files_calculation': result_files_calculation,
-        'country_codes_and_names': country_codes_and_names
+        'country_codes_and_names': country_codes_and_names,
+        'job_id': request.GET.get('job')
     }
 
     return render(request, 'calculator/calculate.html', context)
 
+@login_required
+def calculation_job_progress(request, job_id):
+    job = get_object_or_404(CalculationJob, pk=job_id)
+
+    return JsonResponse({
+        'job_id': job.id,
+        'status': job.status,
+        'stage': job.stage,
+        'rows_processed': job.rows_processed,
+        'error': job.error,
+        'result_id': job.result_id,
+        'filename': job.result.filename if job.result else None,
+        'stage_timings': job.result.stage_timings if job.result else None,
+    })
+
 def render_error_page(request, form, error_message):
     result_files_calculation = CalculationResult.objects.filter(
         file_path__startswith=os.path.join(settings.BASE_DIR, 'database', 'calculator')
@@ -196,6 +179,23 @@ def handle_uploaded_file(f):
 
 
 ############################################ FILE DOWNLOAD ############################################
+@login_required
+def export_calculation(request, result_id, export_format):
+    result_file = get_object_or_404(CalculationResult, pk=result_id)
+
+    if export_format not in EXPORT_FORMATS or not result_file.store_path or not os.path.exists(result_file.store_path):
+        raise Http404("Export not available.")
+
+    buffer = BytesIO()
+    timings = StageTimings('export')
+    with timings.stage(export_format):
+        export_results(result_file.store_path, export_format, buffer)
+    timings.finish()
+    buffer.seek(0)
+
+    filename = f"{os.path.splitext(result_file.filename)[0]}.{export_format}"
+    return FileResponse(buffer, as_attachment=True, filename=filename, content_type=EXPORT_FORMATS[export_format])
+
 def bulk_download(request):
     if request.method == "POST":
         selected_files = request.POST.getlist('selected_files')
@@ -255,6 +255,10 @@ def gpt_categorize_view(request):
             prompt = form.cleaned_data['prompt']
             model = form.cleaned_data['model']
             prefix = request.POST.get('prefix', 'TIPA')  # Default to TIPA if not selected
+            bypass_cache = form.cleaned_data['bypass_cache']
+            batch_size = form.cleaned_data['batch_size'] or 1
+            similarity_threshold = form.cleaned_data['similarity_threshold']
+            offline_batch = form.cleaned_data['offline_batch']
 
             # Get the user-selected columns
             selected_columns = request.POST.getlist('columns')
@@ -265,34 +269,35 @@ def gpt_categorize_view(request):
                 filename = fs.save(file.name, file)
                 file_path = fs.path(filename)
 
-                # Process the Excel file (extract selected columns)
-                df = clean_and_extract_relevant_columns(file_path, selected_columns)
-
-                # Categorize claims using the GPT model
-                categorized_df = categorize_claims(df, model, prompt, selected_columns)
+                if offline_batch:
+                    # Results are stored later, once the batch service completes the batch
+                    project_id = GptResult.objects.count() + GptBatchJob.objects.filter(status='in_progress').count() + 1
+                    submit_gpt_batch_job(file_path, f"{prefix}_{project_id:04d}_{filename}", prompt, model,
+                                         selected_columns, request.user)
+                    return redirect('gpt-categorize')
 
-                # Ensure the output directory exists
-                output_dir = os.path.join(settings.BASE_DIR, 'database', 'GPT', 'Categorization')
-                os.makedirs(output_dir, exist_ok=True)
+                # Check the selected columns before queueing the job
+                clean_and_extract_relevant_columns(file_path, selected_columns)
 
                 # Generate the new filename with the selected prefix and project ID
-                project_id = GptResult.objects.count() + 1
+                project_id = GptResult.objects.count() + GptJob.objects.filter(status__in=['queued', 'running']).count() + 1
                 output_filename = f"{prefix}_{project_id:04d}_{filename}"
-                output_file_path = os.path.join(output_dir, output_filename)
 
-                # Save the results to Excel
-                save_to_excel(categorized_df, output_file_path)
-
-                # Store the result in the database
-                GptResult.objects.create(
+                # Categorize claims using the GPT model in the background, reusing earlier responses unless bypassed
+                job = GptJob.objects.create(
+                    upload_path=file_path,
                     filename=output_filename,
-                    file_path=output_file_path,
                     prompt=prompt,
                     model_used=model,
+                    columns=selected_columns,
+                    batch_size=batch_size,
+                    use_cache=not bypass_cache,
+                    similarity_threshold=similarity_threshold,
                     created_by=request.user
                 )
+                submit_gpt_job(job)
 
-                return redirect('gpt-categorize')
+                return redirect(f"{reverse('gpt-categorize')}?job={job.id}")
 
             except GPTInvalidColumnsError as e:
                 result_files_gpt = GptResult.objects.filter(file_path__startswith=os.path.join(settings.BASE_DIR, 'database', 'GPT', 'Categorization')).order_by('-created_at')
@@ -314,14 +319,42 @@ def gpt_categorize_view(request):
         form = GPTForm()
 
     result_files_gpt = GptResult.objects.filter(file_path__startswith=os.path.join(settings.BASE_DIR, 'database', 'GPT', 'Categorization')).order_by('-created_at')
+    gpt_batch_jobs = GptBatchJob.objects.exclude(status='completed').order_by('-created_at')
 
     context = {
         'form': form,
         'result_files_gpt': result_files_gpt,
+        'gpt_batch_jobs': gpt_batch_jobs,
+        'job_id': request.GET.get('job'),
     }
     
     return render(request, 'calculator/gpt.html', context)
 
+@login_required
+def gpt_job_progress(request, job_id):
+    job = get_object_or_404(GptJob, pk=job_id)
+    if job.status == 'done':
+        rows_done = job.row_count
+    else:
+        with closing(get_checkpoint_store()) as checkpoints:
+            rows_done = checkpoints.count(job.checkpoint_key)
+
+    return JsonResponse({
+        'job_id': job.id,
+        'status': job.status,
+        'rows_done': rows_done,
+        'row_count': job.row_count,
+        'error': job.error,
+        'filename': job.result.filename if job.result else None,
+        'stage_timings': job.result.stage_timings if job.result else None,
+    })
+
 
 #result_files_gpt = GptResult.objects.filter(file_path__startswith=os.path.join(settings.BASE_DIR, 'database', 'GPT', 'Categorization')).order_by('-created_at')
 
+
+############################################ METRICS ############################################
+@staff_member_required
+def metrics_view(request):
+    # Stage timings and GPT request metrics of this process, in the Prometheus text format
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -131,4 +131,24 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 LOGIN_REDIRECT_URL = '/'
-LOGOUT_REDIRECT_URL = '/login/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/login/'
+
+# Patent workbooks are read and calculated in batches of PATENT_BATCH_SIZE rows
+PATENT_BATCH_SIZE = 50000
+
+# Fee calculation: every batch is split into shards of FEE_SHARD_SIZE patents calculated by a pool
+# of FEE_SHARD_WORKERS processes shared by all jobs (None for one per CPU, 1 to stay serial).
+# Batches are sharded one at a time, so FEE_SHARD_SIZE must not exceed PATENT_BATCH_SIZE
+FEE_SHARD_SIZE = 12500
+FEE_SHARD_WORKERS = None
+
+# Fee calculations run as background jobs on a pool of CALCULATION_WORKERS threads
+CALCULATION_WORKERS = 2
+
+# GPT categorizations run as background jobs on a pool of GPT_JOB_WORKERS threads
+GPT_JOB_WORKERS = 2
+
+# Every process beats the heartbeat of the jobs it runs every JOB_HEARTBEAT_SECONDS; running jobs
+# without a heartbeat for JOB_STALE_SECONDS were left behind by a dead process and are queued again
+JOB_HEARTBEAT_SECONDS = 30
+JOB_STALE_SECONDS = 120